@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""benchmark.py
+
+Benchmark inference modes of the transformer on our recorded questions.
+
+[//]: # (markdown comment # noqa)
+
+Usage:
+    benchmark.py quantize [IN_CSV_FILE]
+                 [ --limit=N ]
+                 [ --verbose | -v ]
+                 [ --debug | -d ]
+    benchmark.py cascade [IN_CSV_FILE]
+                 [ --cascade=SPEC ]
+                 [ --quantize ]
+                 [ --limit=N ]
+                 [ --verbose | -v ]
+                 [ --debug | -d ]
+    benchmark.py (-h | --help)
+                 [ --verbose | -v ]
+                 [ --debug | -d ]
+
+Options:
+    -h --help         Show this screen.
+    quantize          compare the "float32" and "int8" inference modes.
+    cascade           compare a model cascade with each of its models alone.
+    [IN_CSV_FILE]     defaults to "data.csv". Recorded questions and contexts.
+    --limit=N         defaults to every recorded question with a context.
+    --cascade=SPEC    defaults to the distilbert model, then bert-large below 0.5.
+                      Comma separated "model:score" stages, cheapest first.
+    --quantize        run every model of the cascade int8 quantized.
+    --verbose -v      printouts while running.
+    --debug -d        printouts while running, extra debugging.
+
+Example:
+    $ python benchmark.py quantize --limit=50
+    mode     load_s  mean_ms  p50_ms  p95_ms  model_mb  peak_rss_mb  agreement
+    float32    2.10    61.30   58.90   90.10    249.00       901.20       1.00
+    int8       0.90    31.70   30.20   47.80    132.60       610.40       0.94
+
+    Each mode runs in a fresh process so memory numbers do not overlap.
+    "agreement" is the fraction of answers identical to the float32 answer.
+
+    $ python benchmark.py cascade --limit=50
+    model                                                  mean_ms  p50_ms  p95_ms  escalated  agreement  saved
+    distilbert-base-cased-distilled-squad                    58.40   56.10   88.70       0.00       0.78   0.82
+    bert-large-cased-whole-word-masking-finetuned-squad    318.20  301.50  470.30       0.00       1.00   0.00
+    cascade                                                141.60   60.20  402.90       0.26       0.93   0.55
+
+    "agreement" is the fraction of answers identical to the last model's
+    answer, "saved" the fraction of its mean latency that is saved.
+
+Resources:
+    * docopt is cool
+        * http://docopt.org
+"""
+import io
+import multiprocessing
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import torch
+from docopt import docopt
+
+from ntfp.cascade import DEFAULT_CASCADE_SPEC, Cascade, parse_cascade, run_cascade
+from ntfp.models import load_pipeline, mode_name
+from ntfp.ntfp import transformer
+from ntfp.ntfp_types import Context, Question
+from utils.terminal_colors import print_colored_doc, print_verbose
+
+
+def read_recorded_questions(
+    csv_filename: str, limit: Optional[int] = None
+) -> List[Tuple[Question, Context]]:
+    """Reads the (question, context) pairs that have a non-empty context."""
+    df = pd.read_csv(csv_filename)
+    df = df[df["context"].notna() & (df["context"].astype(str).str.len() > 0)]
+    pairs = [
+        (Question(str(q)), Context(str(c)))
+        for q, c in zip(df["question"], df["context"])
+    ]
+    return pairs[:limit]
+
+
+def peak_rss_mb() -> float:
+    """The peak resident set size of this process in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS but kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def model_mb(model: torch.nn.Module) -> float:
+    """The serialized size of the model weights in megabytes."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2 ** 20
+
+
+def run_mode(quantize: bool, pairs: List[Tuple[Question, Context]]) -> Dict[str, Any]:
+    """Loads one mode and answers every pair. Runs in its own process."""
+    load_start = time.perf_counter()
+    nlp = load_pipeline(quantize=quantize)
+    load_seconds = time.perf_counter() - load_start
+    answers, latencies = [], []
+    for question, context in pairs:
+        start = time.perf_counter()
+        answer, _ = transformer(question, context, quantize=quantize)
+        latencies.append(time.perf_counter() - start)
+        answers.append(answer)
+    return {
+        "mode": mode_name(quantize),
+        "load_s": load_seconds,
+        "latencies": latencies,
+        "answers": answers,
+        "model_mb": model_mb(nlp.model),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def benchmark_quantize(pairs: List[Tuple[Question, Context]]) -> pd.DataFrame:
+    """Compares latency, memory and answer agreement of float32 vs int8."""
+    # spawn (not fork) so that each mode starts from an empty process
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        results = [pool.apply(run_mode, (q, pairs)) for q in (False, True)]
+    reference = results[0]["answers"]
+    rows = []
+    for result in results:
+        latencies_ms = pd.Series(result["latencies"]) * 1000
+        agree = [a == b for a, b in zip(result["answers"], reference)]
+        rows.append(
+            {
+                "mode": result["mode"],
+                "load_s": result["load_s"],
+                "mean_ms": latencies_ms.mean(),
+                "p50_ms": latencies_ms.quantile(0.50),
+                "p95_ms": latencies_ms.quantile(0.95),
+                "model_mb": result["model_mb"],
+                "peak_rss_mb": result["peak_rss_mb"],
+                "agreement": sum(agree) / max(len(agree), 1),
+            }
+        )
+    return pd.DataFrame(rows).set_index("mode")
+
+
+def benchmark_cascade(
+    pairs: List[Tuple[Question, Context]], cascade: Cascade, quantize: bool = False
+) -> pd.DataFrame:
+    """Compares the latency and answers of the cascade and of each of its models.
+
+    Every model is loaded before anything is timed, so only inference counts.
+    The last model of the cascade is the reference of `agreement` and `saved`.
+    """
+    models = [stage.model for stage in cascade]
+    for model in models:
+        load_pipeline(model=model, quantize=quantize)
+    results: Dict[str, Dict[str, list]] = {}
+    for model in models:
+        result: Dict[str, list] = {"answers": [], "latencies": [], "escalations": []}
+        for question, context in pairs:
+            start = time.perf_counter()
+            answer, _ = transformer(question, context, model=model, quantize=quantize)
+            result["latencies"].append(time.perf_counter() - start)
+            result["answers"].append(answer)
+            result["escalations"].append(0)
+        results[model] = result
+    result = {"answers": [], "latencies": [], "escalations": []}
+    for question, context in pairs:
+        answer, extra_data = run_cascade(
+            cascade,
+            lambda m: transformer(question, context, model=m, quantize=quantize),
+        )
+        result["latencies"].append(extra_data["cascade_latency_s"])
+        result["answers"].append(answer)
+        result["escalations"].append(extra_data["escalations"])
+    results["cascade"] = result
+    reference = results[models[-1]]
+    reference_ms = pd.Series(reference["latencies"], dtype=float).mean() * 1000
+    rows = []
+    for name, result in results.items():
+        latencies_ms = pd.Series(result["latencies"], dtype=float) * 1000
+        agree = [a == b for a, b in zip(result["answers"], reference["answers"])]
+        escalated = [e > 0 for e in result["escalations"]]
+        mean_ms = latencies_ms.mean()
+        rows.append(
+            {
+                "model": name,
+                "mean_ms": mean_ms,
+                "p50_ms": latencies_ms.quantile(0.50),
+                "p95_ms": latencies_ms.quantile(0.95),
+                "escalated": sum(escalated) / max(len(escalated), 1),
+                "agreement": sum(agree) / max(len(agree), 1),
+                "saved": 1 - mean_ms / reference_ms if reference_ms else 0.0,
+            }
+        )
+    return pd.DataFrame(rows).set_index("model")
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__, version="Benchmark 1.0", help=False)
+    VERBOSE = arguments["--verbose"]
+    DEBUG = arguments["--debug"]
+    print(arguments) if DEBUG else None
+    if arguments["--help"]:
+        print_colored_doc(
+            doc=__doc__,
+            to_color_green_bold=(
+                "benchmark.py",
+                "quantize",
+                "cascade",
+                "(-h | --help)",
+            ),
+            to_color_yellow_bold=("[IN_CSV_FILE]",),
+            to_color_white_bold=(
+                "Benchmark inference modes of the transformer on our recorded questions.",  # noqa
+                "Usage:",
+                "Options:",
+                "Example:",
+                "Resources:",
+            ),
+            to_color_white_bold_patterns=(r"(\$.*)",),
+            to_color_red_bold_patterns=(r"(defaults to.*)",),
+            to_color_grey_out=("[//]: # (markdown comment # noqa)",),
+        )
+        exit()
+    IN_CSV_FILE = arguments["IN_CSV_FILE"] or "data.csv"
+    LIMIT = arguments["--limit"]
+    LIMIT = int(LIMIT) if LIMIT else None
+    PAIRS = read_recorded_questions(IN_CSV_FILE, limit=LIMIT)
+    print_verbose("len(PAIRS)", len(PAIRS)) if VERBOSE or DEBUG else None
+    if arguments["quantize"]:
+        print(benchmark_quantize(PAIRS).round(2).to_string())
+    elif arguments["cascade"]:
+        CASCADE = parse_cascade(arguments["--cascade"] or DEFAULT_CASCADE_SPEC)
+        print_verbose("CASCADE", CASCADE) if VERBOSE or DEBUG else None
+        TABLE = benchmark_cascade(PAIRS, CASCADE, quantize=arguments["--quantize"])
+        print(TABLE.round(2).to_string())
@@ -7,6 +7,9 @@ Calculate a sha256 checksum of the concatenation of all .py files in this reposi
 
 Usage:
     checksum.py [ --ends-with=".py" ]
+                [ --merkle ]
+                [ --cache=FILE | --no-cache ]
+                [ --workers=N ]
                 [ --verbose | -v ]
                 [ --debug | -d ]
                 [ -n ]
@@ -20,13 +23,31 @@ Options:
     --debug -d           printouts while running, extra debugging.
     --ends-with=".py"    defaults to ".py". Allows program to run on other kinds of files.
     -n                   Do not print the trailing newline character for final output.
+    --merkle             print the Merkle root of the files instead, see below.
+    --cache=FILE         defaults to "~/.cache/ntfp/cache.db". File digests by
+                         (path, size, mtime), so unchanged files are not reread.
+    --no-cache           reread every file.
+    --workers=N          defaults to the number of CPUs. Threads hashing changed files.
+
+The walk skips version control and cache directories (.git, __pycache__,
+.mypy_cache, .pytest_cache, .pyre), which never hold the files checksummed.
+Files are streamed into the hash in blocks, never read whole into memory.
+
+The concatenation checksum is only reused when no file was added, removed
+or changed since it was cached; otherwise every file is streamed again.
+The Merkle root only rehashes the files that changed. Its leaves are
+sha256(0x00 + path + 0x00 + sha256(file)) in path order, each parent is
+sha256(0x01 + left + right), and an odd node is carried up unchanged.
 
 Example:
     $ python checksum.py
     A_64_CHARACTER_HEXADECIMAL_STRING_GENERATED_BY_SHA_256_ALGORITHM
 
     $ python checksum.py --version
-    Checksum 1.0.0
+    Checksum 1.1.0
+
+    $ python checksum.py --merkle
+    A_64_CHARACTER_HEXADECIMAL_STRING_OF_THE_MERKLE_ROOT
 
     # TEST CASE 1 (verifying basic input/output and concatenation property)
     # note that sha256("") = 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
@@ -65,7 +86,16 @@ Changelog:
     All notable changes to this file `checksum.py` will be documented here.
     The format is _loosely_ based on [Keep a Changelog](https://keepachangelog.com/en/1.0.0/).
 
-    ## [1.0.0] - 2020-04-18 (latest)
+    ## [1.1.0] - 2026-10-19 (latest)
+    ### Added
+    - `--merkle` prints a Merkle root that only rehashes changed files.
+    - file digests and checksums are cached by (path, size, mtime).
+    ### Changed
+    - files are streamed into the hash instead of concatenated in memory.
+    - `.git` and cache directories are pruned from the walk.
+    - the concatenation checksum itself is unchanged.
+
+    ## [1.0.0] - 2020-04-18
     ### Added/Changed/Fixed
     - what was `checksum.sh` is now `checksum.py`
     - much more readable and hopefully future-proof.
@@ -75,11 +105,121 @@ Changelog:
 
 import hashlib
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 from docopt import docopt
 
+from ntfp.cache import DEFAULT_CACHE, DiskCache
 from utils.terminal_colors import print_colored_doc, print_debug, print_verbose
 
+PRUNED_DIRS = (".git", "__pycache__", ".mypy_cache", ".pytest_cache", ".pyre")
+"""Directories that never hold the files checksummed."""
+
+BLOCK_SIZE = 1 << 20
+"""Bytes read from a file at a time."""
+
+RACY_SECONDS = 2.0
+"""Files changed this recently are never cached, as a change within the
+same mtime tick would keep their size and mtime."""
+
+
+def walk_files(root: str = ".", ends_with: str = ".py") -> List[str]:
+    """The sorted paths ending with `ends_with` under `root`, minus `PRUNED_DIRS`."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(os.path.expanduser(root)):
+        dirnames[:] = [d for d in dirnames if d not in PRUNED_DIRS]
+        paths += [os.path.join(dirpath, f) for f in filenames if f.endswith(ends_with)]
+    return sorted(paths)
+
+
+def stat_key(path: str) -> Tuple[str, int, int]:
+    """What identifies a version of a file: (absolute path, size, mtime)."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def is_racy(key: Tuple[str, int, int], now: float) -> bool:
+    return now - key[2] / 1e9 < RACY_SECONDS
+
+
+def stream_into(sha, path: str, block_size: int = BLOCK_SIZE) -> None:
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+
+
+def concat_sha256(paths: List[str]) -> str:
+    """The sha256 of the files' concatenation, like `cat ... | shasum -a 256`."""
+    sha = hashlib.sha256()
+    for path in paths:
+        stream_into(sha, path)
+    return sha.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    stream_into(sha, path)
+    return sha.hexdigest()
+
+
+def cached_concat_sha256(
+    paths: List[str], keys: List[Tuple[str, int, int]], cache: Optional[DiskCache]
+) -> str:
+    """[`concat_sha256`](#checksum.concat_sha256), reused while no file changed."""
+    if cache is None:
+        return concat_sha256(paths)
+    sha = cache.get("checksum", keys)
+    if sha is None:
+        sha = concat_sha256(paths)
+        if not any(is_racy(key, time.time()) for key in keys):
+            cache.put("checksum", keys, sha)
+    return sha
+
+
+def file_digests(
+    paths: List[str],
+    keys: List[Tuple[str, int, int]],
+    cache: Optional[DiskCache],
+    workers: Optional[int] = None,
+) -> List[str]:
+    """The sha256 of each file, rehashing only the files not in the cache.
+
+    Changed files are hashed in parallel threads; `hashlib` releases the GIL
+    while hashing large blocks.
+    """
+    digests = [cache.get("file_sha256", [key]) if cache else None for key in keys]
+    changed = [i for i, digest in enumerate(digests) if digest is None]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashed = executor.map(file_sha256, [paths[i] for i in changed])
+        for i, digest in zip(changed, hashed):
+            digests[i] = digest
+            if cache is not None and not is_racy(keys[i], time.time()):
+                cache.put("file_sha256", [keys[i]], digest)
+    return digests
+
+
+def merkle_leaf(path: str, digest: str) -> bytes:
+    name = path.replace(os.sep, "/").encode("utf-8")
+    return hashlib.sha256(b"\x00" + name + b"\x00" + bytes.fromhex(digest)).digest()
+
+
+def merkle_root(paths: List[str], digests: List[str]) -> str:
+    """The root of a binary Merkle tree over (path, digest) leaves, in order."""
+    level = [merkle_leaf(path, digest) for path, digest in zip(paths, digests)]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        parents = [
+            hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
+
 
 def print_help():
     to_color_green_bold = (
@@ -111,7 +251,7 @@ def print_help():
 
 if __name__ == "__main__":
     # My basic docopt setup...
-    arguments = docopt(__doc__, version="Checksum 1.0.0", help=False)
+    arguments = docopt(__doc__, version="Checksum 1.1.0", help=False)
     VERBOSE = arguments["--verbose"] or arguments["-v"]
     DEBUG = arguments["--debug"]
     print(arguments) if DEBUG else None
@@ -133,22 +273,9 @@ if __name__ == "__main__":
     assert THIS_FILENAME in os.listdir(), msg
 
     # ASSUMPTION 2 - the files we care about can be nested at arbitrary depth
-    # Recursively get all file pathsfrom current directory downward
-    FILEPATHS = [
-        os.path.join(dp, f)
-        for dp, dn, fn in os.walk(os.path.expanduser("."))
-        for f in fn
-    ]
-    print_debug("FILEPATHS", FILEPATHS) if DEBUG else None
-    print_verbose("FILEPATHS[:5]", FILEPATHS[:5]) if VERBOSE else None
-    print_verbose("len(FILEPATHS)", len(FILEPATHS)) if VERBOSE or DEBUG else None
-
+    # Recursively get all file paths from current directory downward,
+    # never descending into PRUNED_DIRS.
     # ASSUMPTION 3 - only python files need be considered for checksum
-    ENDS_WITH = arguments["--ends-with"] or ".py"
-    py_files = [x for x in filter(lambda x: x.endswith(ENDS_WITH), FILEPATHS)]
-    print_verbose("py_files", py_files) if VERBOSE or DEBUG else None
-    print_verbose("len(py_files)", len(py_files)) if VERBOSE or DEBUG else None
-
     # ASSUMPTION 4 - ORDER MATTERS
     #   once all python filepaths are found from current directory,
     #   then they will be sorted in alphabetical order
@@ -160,19 +287,26 @@ if __name__ == "__main__":
     #                   './ntfp/__init__.py', './ntfp/ntfp.py',
     #                   './ntfp/ntfp_types.py', './utils/__init__.py',
     #                   './utils/terminal_colors.py']
-    sorted_py_files = sorted(py_files)
-
-    # ASSUMPTION 5 - the following code equivalent to `cat file.py **.py ...py`
-    catted_files = b""
-    for filename in sorted_py_files:
-        with open(filename, "rb") as f:
-            catted_files += f.read()
-    print_debug("catted_files", catted_files) if DEBUG else None
-    print_verbose("catted_files[:99]", catted_files[:99]) if VERBOSE else None
-    print_verbose("len(catted_files)", len(catted_files)) if VERBOSE or DEBUG else None
-
-    # ASSUMPTION 6 - hashlib.sha256 equiv to `shasum -a 256 -U` on macOS
-    sha = hashlib.sha256(catted_files).hexdigest()
+    ENDS_WITH = arguments["--ends-with"] or ".py"
+    sorted_py_files = walk_files(".", ENDS_WITH)
+    print_verbose("py_files", sorted_py_files) if VERBOSE or DEBUG else None
+    print_verbose("len(py_files)", len(sorted_py_files)) if VERBOSE or DEBUG else None
+
+    CACHE = None if arguments["--no-cache"] else arguments["--cache"] or DEFAULT_CACHE
+    CACHE = DiskCache(CACHE) if CACHE else None
+    WORKERS = arguments["--workers"]
+    WORKERS = int(WORKERS) if WORKERS else None
+    keys = [stat_key(path) for path in sorted_py_files]
+    print_verbose("len(catted_files)", sum(k[1] for k in keys)) if VERBOSE else None
+
+    if arguments["--merkle"]:
+        digests = file_digests(sorted_py_files, keys, CACHE, WORKERS)
+        print_debug("digests", digests) if DEBUG else None
+        sha = merkle_root(sorted_py_files, digests)
+    else:
+        # ASSUMPTION 5 - the following code equivalent to `cat file.py **.py ...py`
+        # ASSUMPTION 6 - hashlib.sha256 equiv to `shasum -a 256 -U` on macOS
+        sha = cached_concat_sha256(sorted_py_files, keys, CACHE)
     print_verbose("sha", sha) if VERBOSE or DEBUG else None
 
     if arguments["-n"]:
@@ -11,6 +11,14 @@ Usage:
              [ --club-separator="\\n\\n\\n" ]
              [ --fuzz-threshold=25 | --fuzz=25 ]
              [ --context-limit=25 | --limit=25 ]
+             [ --len-threshold=2 | --len=2 ]
+             [ --retriever=snapshot ]
+             [ --budget=512 ]
+             [ --dedupe=0.9 ]
+             [ --quantize ]
+             [ --cascade=SPEC ]
+             [ --token-cache=FILE ]
+             [ --profile ] [ --profile-dir=DIR ]
              [ --verbose | -v ]
              [ --debug | -d ]
     clubs.py (--example | -e) [IN_TXT_FILE]
@@ -18,6 +26,28 @@ Usage:
              [ --club-separator="\\n\\n\\n" ]
              [ --fuzz-threshold=25 | --fuzz=25 ]
              [ --context-limit=25 | --limit=25 ]
+             [ --len-threshold=2 | --len=2 ]
+             [ --retriever=snapshot ]
+             [ --budget=512 ]
+             [ --dedupe=0.9 ]
+             [ --quantize ]
+             [ --cascade=SPEC ]
+             [ --token-cache=FILE ]
+             [ --profile ] [ --profile-dir=DIR ]
+             [ --verbose | -v ]
+             [ --debug | -d ]
+    clubs.py --batch=QUESTIONS [IN_TXT_FILE]
+             [ --club-separator="\\n\\n\\n" ]
+             [ --fuzz-threshold=25 | --fuzz=25 ]
+             [ --context-limit=25 | --limit=25 ]
+             [ --len-threshold=2 | --len=2 ]
+             [ --retriever=snapshot ]
+             [ --budget=512 ]
+             [ --dedupe=0.9 ]
+             [ --quantize ]
+             [ --cascade=SPEC ]
+             [ --token-cache=FILE ]
+             [ --profile ] [ --profile-dir=DIR ]
              [ --verbose | -v ]
              [ --debug | -d ]
     clubs.py (--make-doc | -m) [IN_CSV_FILE] [OUT_TXT_FILE]
@@ -25,6 +55,13 @@ Usage:
              [ --club-separator="\\n\\n\\n" ]
              [ --fuzz-threshold=25 | --fuzz=25 ]
              [ --context-limit=25 | --limit=25 ]
+             [ --quantize ]
+             [ --token-cache=FILE ]
+             [ --profile ] [ --profile-dir=DIR ]
+             [ --verbose | -v ]
+             [ --debug | -d ]
+    clubs.py (--build-snapshot | -b) [IN_TXT_FILE]
+             [ --club-separator="\\n\\n\\n" ]
              [ --verbose | -v ]
              [ --debug | -d ]
     clubs.py (-h | --help)
@@ -35,11 +72,30 @@ Options:
     -h --help                       Show this screen.
     --example -e                    read IN_TXT_FILE and ask a default question.
     --make-doc -m                   read IN_CSV_FILE and do stuff and write out txt.
+    --build-snapshot -b             precompute IN_TXT_FILE into IN_TXT_FILE.snapshot.
+    --batch=QUESTIONS               answer each line of QUESTIONS ("-" for stdin)
+                                    and print one JSON line per answer.
     [IN_TXT_FILE]                   defaults to "clubs.txt"
     [IN_CSV_FILE]                   defaults to "clubs.csv"
     [OUT_TXT_FILE]                  defaults to "clubs.txt"
-    --fuzz-threshold=25 --fuzz=25   defaults to 25.
-    --context-limit=25 --limit=25   defaults to 25.
+    --fuzz-threshold=25 --fuzz=25   defaults to 25, or the tuned value in ntfp.json.
+    --context-limit=25 --limit=25   defaults to 25, or the tuned value in ntfp.json.
+    --len-threshold=2 --len=2       defaults to 2, or the tuned value in ntfp.json.
+                                    The fewest characters of a relevant club.
+    --retriever=snapshot            defaults to "snapshot", or the tuned value in ntfp.json.
+                                    "corpus" scores every club even with a snapshot.
+    --budget=512                    defaults to 512, or the tuned value in ntfp.json.
+                                    The most context tokens, 0 for no limit.
+    --dedupe=0.9                    defaults to 0.9, or the tuned value in ntfp.json.
+                                    The similarity of near-duplicate sentences
+                                    dropped before packing, 0 to keep them.
+    --quantize                      use the int8 quantized model for CPU inference.
+    --cascade=SPEC                  defaults to only the distilbert model. Comma separated
+                                    "model:score" stages, cheapest first; a question goes
+                                    on to the next model when it scores below "score".
+    --token-cache=FILE              reuse club tokens saved in FILE across questions.
+    --profile                       profile the CPU time and memory of every stage.
+    --profile-dir=DIR               defaults to "profile". Where the profiles are written.
     --verbose -v                    printouts while running.
     --debug -d                      printouts while running, extra debugging.
     --sentence-separator=" "        defaults to " ". Separates same club sentences.
@@ -48,6 +104,8 @@ Options:
 Example:
     $ python clubs.py --make-doc my_clubs_data.csv my_clubs_doc.txt
 
+    $ python clubs.py --build-snapshot my_clubs_doc.txt
+
     $ python clubs.py --example my_clubs_doc.txt --verbose
     question: "What is blah?"
     ...
@@ -56,6 +114,10 @@ Example:
     answer: "Blah is foobar"
     extradata: {...}
 
+    $ python clubs.py --batch=questions.txt my_clubs_doc.txt > answers.jsonl
+
+    $ python clubs.py --batch=questions.txt --cascade=distilbert-base-cased-distilled-squad:0.5,bert-large-cased-whole-word-masking-finetuned-squad
+
     $ python clubs.py my_clubs_doc.txt
     question: "user_input ¯\\_(ツ)_/¯"
     ...
@@ -65,14 +127,48 @@ Resources:
     * docopt is cool
         * http://docopt.org
 """
+if __name__ == "__main__":
+    # before the heavy imports, to run warm when a fork-server is running
+    from ntfp.forkserver import run_in_server
+
+    run_in_server()
+
+import atexit
+import json
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
 import pandas as pd
-import spacy
 from docopt import docopt
 
-from ntfp.ntfp import filter_string_by_relevance, transformer
-from ntfp.ntfp_types import Context, Question
+from ntfp.cascade import Cascade, parse_cascade, run_cascade, run_cascade_batch
+from ntfp.config import load_config
+from ntfp.fast_path import fast_answer
+from ntfp.models import DEFAULT_QA_MODEL, load_spacy
+from ntfp.corpus import Corpus
+from ntfp.ntfp import (
+    NtfpNoEntityError,
+    answer as answer_question,
+    answering_model,
+    prepare_context,
+    record_preparation,
+    top_segments_by_relevance,
+)
+from ntfp.ntfp_types import Answer, Context, ExtraDataDict, Question
+from ntfp.profiling import DEFAULT_PROFILE_DIR, profile_until_exit, stage
+from ntfp.snapshot import Snapshot, build_snapshot, load_snapshot
+from ntfp.token_cache import (
+    TokenCache,
+    cached_transformer,
+    cached_transformer_batch,
+    shared_cache,
+)
 from utils.terminal_colors import green_bold, print_colored_doc, yellow_bold
 
+BATCH_SIZE = 32
+"""Questions per model call in batch mode."""
+
 
 def make_sents(club):
     templates = (
@@ -115,6 +211,198 @@ def make_sents(club):
     return final_sents
 
 
+def open_clubs(
+    txt_file: str, sep: str, retriever: str = "snapshot"
+) -> Union[Snapshot, Corpus]:
+    """The valid snapshot of `txt_file`, or else its memory-mapped corpus.
+
+    The `"corpus"` retriever always gives the corpus.
+    """
+    if retriever == "corpus":
+        return Corpus(txt_file, sep=sep)
+    snapshot = load_snapshot(txt_file, sep=sep)
+    return snapshot if snapshot is not None else Corpus(txt_file, sep=sep)
+
+
+def retrieve(
+    question: Question,
+    clubs: Union[Snapshot, Corpus],
+    sep: str,
+    fuzz: int,
+    limit: int,
+    nlp,
+    token_cache: Optional[TokenCache] = None,
+    doc=None,
+    len_threshold: Optional[int] = None,
+) -> Tuple[Context, Optional[TokenCache]]:
+    """Finds the `limit` clubs most relevant to the question.
+
+    From a snapshot only the clubs sharing a term with the question are
+    scored, and their precomputed tokens are put in the token cache.
+    From a corpus every club is scored. Clubs shorter than `len_threshold`
+    characters are never relevant.
+    """
+    with stage("retrieve"):
+        if isinstance(clubs, Snapshot):
+            indices = clubs.candidates(question)
+            segments = clubs.segments(indices)
+        else:
+            segments = clubs
+        top = top_segments_by_relevance(
+            to=question,
+            segments=segments,
+            FUZZ=fuzz,
+            LEN=len_threshold,
+            limit=limit,
+            nlp=nlp,
+            doc=doc,
+        )
+        if isinstance(clubs, Snapshot):
+            token_cache = token_cache if token_cache is not None else shared_cache
+            selected = {segment for _, segment in top}
+            clubs.fill_token_cache(
+                token_cache, [i for i, s in zip(indices, segments) if s in selected]
+            )
+    return Context(sep.join(segment for _, segment in top)), token_cache
+
+
+def ask(
+    question: Question,
+    context: Context,
+    sep: str,
+    quantize: bool = False,
+    token_cache: Optional[TokenCache] = None,
+    cascade: Optional[Cascade] = None,
+) -> Tuple[Answer, ExtraDataDict]:
+    if token_cache is None:
+        return answer_question(question, context, quantize=quantize, cascade=cascade)
+    fast = fast_answer(question, context)
+    if fast is not None:
+        return fast
+    segments = context.split(sep) if context else []
+
+    def run(model: str = DEFAULT_QA_MODEL) -> Tuple[Answer, ExtraDataDict]:
+        return cached_transformer(
+            question, segments, sep, model, quantize=quantize, cache=token_cache
+        )
+
+    answer, extradata = run_cascade(cascade, run) if cascade else run()
+    extradata["stage"] = "transformer"
+    return answer, extradata
+
+
+def read_questions(questions_file: str) -> List[Question]:
+    """One question per non-blank line of the file, or of stdin for `"-"`."""
+    if questions_file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(questions_file, "r") as f:
+            lines = f.read().splitlines()
+    return [Question(line.strip()) for line in lines if line.strip()]
+
+
+def answer_batch(
+    questions: List[Question],
+    clubs: Union[Snapshot, Corpus],
+    sep: str,
+    fuzz: int,
+    limit: int,
+    nlp,
+    quantize: bool = False,
+    token_cache: Optional[TokenCache] = None,
+    batch_size: int = BATCH_SIZE,
+    len_threshold: Optional[int] = None,
+    budget: Optional[int] = None,
+    dedupe_threshold: Optional[float] = None,
+    cascade: Optional[Cascade] = None,
+) -> Iterator[Dict]:
+    """Answers many questions with one spaCy and one model load.
+
+    Entities are found with `nlp.pipe`, every question's clubs are retrieved,
+    cleared of near-duplicate sentences at `dedupe_threshold` and packed into
+    `budget` tokens, and the questions the fast path cannot answer go through
+    the model `batch_size` at a time, or through each model of the `cascade`
+    they escalate to.
+
+    Yields:
+        One record per question, in order, with `retrieval_ms` and \
+            `inference_ms`. A batch's inference time is split evenly \
+            between its questions.
+    """
+    token_cache = token_cache if token_cache is not None else shared_cache
+    for first in range(0, len(questions), batch_size):
+        chunk = questions[first : first + batch_size]
+        records: List[Dict] = []
+        pending: List[Tuple[Dict, Question, List[str]]] = []
+        for question, doc in zip(chunk, nlp.pipe(chunk)):
+            start = time.perf_counter()
+            record: Dict = {"question": question}
+            try:
+                context, _ = retrieve(
+                    question,
+                    clubs,
+                    sep,
+                    fuzz,
+                    limit,
+                    nlp,
+                    token_cache,
+                    doc=doc,
+                    len_threshold=len_threshold,
+                )
+            except NtfpNoEntityError as e:
+                record["error"] = e.messsage
+                context = Context("")
+            preparation = prepare_context(
+                question,
+                context,
+                budget,
+                dedupe_threshold,
+                sep=sep,
+                ranked=True,
+                cache=token_cache,
+                model=answering_model(cascade=cascade),
+            )
+            context = preparation[0]
+            record_preparation(record, preparation)  # type: ignore
+            record["retrieval_ms"] = 1000 * (time.perf_counter() - start)
+            start = time.perf_counter()
+            fast = fast_answer(question, context)
+            if fast is not None:
+                record["answer"], extradata = fast
+                record.update(extradata)
+                record["inference_ms"] = 1000 * (time.perf_counter() - start)
+            else:
+                pending.append(
+                    (record, question, context.split(sep) if context else [])
+                )
+            records.append(record)
+
+        def run_batch(
+            model: str = DEFAULT_QA_MODEL, indices: Optional[List[int]] = None
+        ) -> List[Tuple[Answer, ExtraDataDict]]:
+            indices = range(len(pending)) if indices is None else indices
+            return cached_transformer_batch(
+                [pending[i][1:] for i in indices],
+                sep=sep,
+                model=model,
+                quantize=quantize,
+                cache=token_cache,
+            )
+
+        start = time.perf_counter()
+        if cascade:
+            answers = run_cascade_batch(cascade, run_batch, len(pending))
+        else:
+            answers = run_batch()
+        inference_ms = 1000 * (time.perf_counter() - start) / max(1, len(pending))
+        for (record, _, _), (answer, extradata) in zip(pending, answers):
+            record["answer"] = answer
+            record.update(extradata)
+            record["stage"] = "transformer"
+            record["inference_ms"] = inference_ms
+        yield from records
+
+
 if __name__ == "__main__":
     arguments = docopt(__doc__, version="Clubs 1.0", help=False)
     VERBOSE = arguments["--verbose"]
@@ -125,6 +413,8 @@ if __name__ == "__main__":
             "clubs.py",
             "(--example | -e)",
             "(--make-doc | -m)",
+            "(--build-snapshot | -b)",
+            "--batch=QUESTIONS",
             "(-h | --help)",
         )
         to_color_yellow_bold = (
@@ -155,12 +445,30 @@ if __name__ == "__main__":
     IN_CSV_FILE = arguments["IN_CSV_FILE"] or "clubs.csv"
     IN_TXT_FILE = arguments["IN_TXT_FILE"] or "clubs.txt"
     OUT_TXT_FILE = arguments["OUT_TXT_FILE"] or "clubs.txt"
-    FUZZ = arguments["--fuzz-threshold"] or arguments["--fuzz"] or 25
+    CONFIG = load_config()
+    FUZZ = arguments["--fuzz-threshold"] or arguments["--fuzz"] or CONFIG["fuzz"]
     FUZZ = int(FUZZ)
-    LIMIT = arguments["--context-limit"] or arguments["--limit"] or 25
+    LIMIT = arguments["--context-limit"] or arguments["--limit"] or CONFIG["limit"]
     LIMIT = int(LIMIT)
+    LEN = arguments["--len-threshold"] or arguments["--len"] or CONFIG["len"]
+    LEN = int(LEN)
+    RETRIEVER = arguments["--retriever"] or CONFIG["retriever"]
+    BUDGET = arguments["--budget"] or CONFIG["budget"]
+    BUDGET = int(BUDGET)
+    DEDUPE = arguments["--dedupe"] or CONFIG["dedupe"]
+    DEDUPE = float(DEDUPE)
     SENTENCE_SEPARATOR = arguments["--sentence-separator"] or " "
     CLUB_SEPARATOR = arguments["--club-separator"] or "\n\n\n"
+    QUANTIZE = arguments["--quantize"]
+    CASCADE = arguments["--cascade"]
+    CASCADE = parse_cascade(CASCADE) if CASCADE else None
+    TOKEN_CACHE_FILE = arguments["--token-cache"]
+    TOKEN_CACHE = TokenCache(TOKEN_CACHE_FILE) if TOKEN_CACHE_FILE else None
+    if TOKEN_CACHE is not None:
+        # an empty TokenCache is falsy, so test for None
+        atexit.register(TOKEN_CACHE.save)
+    if arguments["--profile"]:
+        profile_until_exit(arguments["--profile-dir"] or DEFAULT_PROFILE_DIR)
     if arguments["--make-doc"]:
         print(f"reading from {IN_CSV_FILE}...") if DEBUG else None
         df = pd.read_csv(IN_CSV_FILE, escapechar="\\", engine="python")
@@ -175,44 +483,78 @@ if __name__ == "__main__":
         print(f"writing to {OUT_TXT_FILE}.") if DEBUG else None
         with open(OUT_TXT_FILE, "w") as f:
             f.write(doc)
-    elif arguments["--example"]:
-        doc = ""
+    elif arguments["--build-snapshot"]:
         print(f"reading from {IN_TXT_FILE}...") if DEBUG else None
-        with open(IN_TXT_FILE, "r") as f:
-            doc = f.read()
-        club = "Computer Science and Artificial Intelligence"
-        print(f"club: {club}...") if DEBUG else None
-        question = f"who is the advisor for {club} club?"
-        print(green_bold("question:"), question)
-        spacy_nlp = spacy.load("en_core_web_sm")
-        context = filter_string_by_relevance(
-            to=question,
-            string=doc,
-            FUZZ=FUZZ,
-            limit=LIMIT,
+        snapshot_path = build_snapshot(IN_TXT_FILE, sep=CLUB_SEPARATOR)
+        print(f"wrote {snapshot_path}.") if VERBOSE or DEBUG else None
+    elif arguments["--batch"]:
+        questions = read_questions(arguments["--batch"])
+        print(f"reading from {IN_TXT_FILE}...", file=sys.stderr) if DEBUG else None
+        spacy_nlp = load_spacy()
+        records = answer_batch(
+            questions,
+            open_clubs(IN_TXT_FILE, CLUB_SEPARATOR, RETRIEVER),
             sep=CLUB_SEPARATOR,
+            fuzz=FUZZ,
+            limit=LIMIT,
             nlp=spacy_nlp,
+            quantize=QUANTIZE,
+            token_cache=TOKEN_CACHE,
+            cascade=CASCADE,
+            len_threshold=LEN,
+            budget=BUDGET,
+            dedupe_threshold=DEDUPE,
         )
-        print(yellow_bold("context:"), context) if VERBOSE else None
-        answer, extradata = transformer(Question(question), Context(context))
-        print(green_bold("answer:"), answer)
-        print(yellow_bold("extradata:"), extradata) if VERBOSE else None
+        start = time.perf_counter()
+        for record in records:
+            print(json.dumps(record), flush=True)
+        elapsed = time.perf_counter() - start
+        if VERBOSE:
+            rate = len(questions) / elapsed if elapsed else 0.0
+            print(
+                f"{len(questions)} questions in {elapsed:.2f}s ({rate:.1f}/s)",
+                file=sys.stderr,
+            )
     else:
-        doc = ""
         print(f"reading from {IN_TXT_FILE}...") if DEBUG else None
-        with open(IN_TXT_FILE, "r") as f:
-            doc = f.read()
-        question = input(green_bold("question: "))
-        spacy_nlp = spacy.load("en_core_web_sm")
-        context = filter_string_by_relevance(
-            to=question,
-            string=doc,
-            FUZZ=FUZZ,
-            limit=LIMIT,
+        if arguments["--example"]:
+            club = "Computer Science and Artificial Intelligence"
+            print(f"club: {club}...") if DEBUG else None
+            question = f"who is the advisor for {club} club?"
+            print(green_bold("question:"), question)
+        else:
+            question = input(green_bold("question: "))
+        spacy_nlp = load_spacy()
+        context, TOKEN_CACHE = retrieve(
+            Question(question),
+            open_clubs(IN_TXT_FILE, CLUB_SEPARATOR, RETRIEVER),
             sep=CLUB_SEPARATOR,
+            fuzz=FUZZ,
+            limit=LIMIT,
             nlp=spacy_nlp,
+            token_cache=TOKEN_CACHE,
+            len_threshold=LEN,
+        )
+        preparation = prepare_context(
+            Question(question),
+            context,
+            BUDGET,
+            DEDUPE,
+            sep=CLUB_SEPARATOR,
+            ranked=True,
+            cache=TOKEN_CACHE,
+            model=answering_model(cascade=CASCADE),
         )
+        context = preparation[0]
         print(yellow_bold("context:"), context) if VERBOSE else None
-        answer, extradata = transformer(Question(question), Context(context))
+        answer, extradata = ask(
+            Question(question),
+            Context(context),
+            sep=CLUB_SEPARATOR,
+            quantize=QUANTIZE,
+            token_cache=TOKEN_CACHE,
+            cascade=CASCADE,
+        )
+        record_preparation(extradata, preparation)
         print(green_bold("answer:"), answer)
         print(yellow_bold("extradata:"), extradata) if VERBOSE else None
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""evaluate.py
+
+Measure the accuracy and latency of answering a gold set of questions.
+
+[//]: # (markdown comment # noqa)
+
+Usage:
+    evaluate.py [GOLD_CSV]
+                [ --path=clubs ]
+                [ --retrievers=snapshot ]
+                [ --fuzz=25 ]
+                [ --len=2 ]
+                [ --limit=25 ]
+                [ --budget=512 ]
+                [ --dedupe=0.9 ]
+                [ --modes=float32 ]
+                [ --in-txt-file="clubs.txt" ]
+                [ --workers=N ]
+                [ --cache=FILE | --no-cache ]
+                [ --out=FILE ]
+                [ --verbose | -v ]
+                [ --debug | -d ]
+    evaluate.py --tune [GOLD_CSV]
+                [ --min-accuracy=0.8 ]
+                [ --metric=fuzzy ]
+                [ --config=FILE ]
+                [ --retrievers=snapshot,corpus ]
+                [ --fuzz=15,25,40 ]
+                [ --len=2,20 ]
+                [ --limit=3,10,25 ]
+                [ --budget=256,512 ]
+                [ --dedupe=0,0.9 ]
+                [ --modes=float32 ]
+                [ --in-txt-file="clubs.txt" ]
+                [ --workers=N ]
+                [ --cache=FILE | --no-cache ]
+                [ --out=FILE ]
+                [ --verbose | -v ]
+                [ --debug | -d ]
+    evaluate.py (-h | --help)
+                [ --verbose | -v ]
+                [ --debug | -d ]
+
+Options:
+    -h --help               Show this screen.
+    --tune                  find the cheapest clubs configuration that is still
+                            accurate enough, and write it to --config.
+    [GOLD_CSV]              defaults to "gold.csv". Has question and answer columns.
+    --path=clubs            defaults to "clubs". Comma separated "clubs" and "google".
+    --retrievers=snapshot   defaults to the tuned one, or "snapshot,corpus" with --tune.
+    --fuzz=25               defaults to the tuned one, or "15,25,40" with --tune.
+    --len=2                 defaults to the tuned one, or "2,20" with --tune.
+    --limit=25              defaults to the tuned one, or "3,10,25" with --tune.
+    --budget=512            defaults to the tuned one, or "256,512" with --tune.
+                            The most context tokens, 0 for no limit.
+    --dedupe=0.9            defaults to the tuned one, or "0,0.9" with --tune.
+                            The near-duplicate similarity, 0 to keep them.
+    --modes=float32         defaults to "float32". Comma separated "float32" and "int8".
+    --min-accuracy=0.8      defaults to 0.8. The accuracy floor of --tune.
+    --metric=fuzzy          defaults to "fuzzy". The accuracy, "exact" or "fuzzy".
+    --config=FILE           defaults to $NTFP_CONFIG or "ntfp.json".
+    --in-txt-file=FILE      defaults to "clubs.txt". The clubs path's corpus.
+    --workers=N             defaults to the number of CPUs. Size of process pool.
+    --cache=FILE            defaults to "~/.cache/ntfp/cache.db". Pages and answers.
+    --no-cache              fetch and infer everything again, e.g. for cold latency.
+    --out=FILE              also write every answer to a CSV file.
+    --verbose -v            printouts while running.
+    --debug -d              printouts while running, extra debugging.
+
+Each combination of the values of --path, --retrievers, --fuzz, --len,
+the --limit, --budget, --dedupe and --modes lists is one configuration. The google
+path uses none of the --retrievers, --fuzz, --len and --limit.
+
+Tuning never reuses cached answers, so its latencies are real inference.
+Of the configurations at or above --min-accuracy, the one with the fewest
+context tokens on average wins, then the one with the lowest p95 latency.
+
+Example:
+    $ python evaluate.py --fuzz=15,25,40 --limit=5,25
+     path retriever fuzz len limit budget dedupe    mode  n exact fuzzy ... dedupe_shrink_mean
+    clubs  snapshot   15   2     5    512    0.9 float32 25  0.64  0.80 ...              0.091
+    ...
+
+    $ python evaluate.py --tune --min-accuracy=0.9
+    ...
+    wrote ntfp.json: {'fuzz': 25, 'len': 2, 'limit': 3, 'retriever': 'snapshot', 'budget': 256, 'dedupe': 0.9}
+
+Resources:
+    * docopt is cool
+        * http://docopt.org
+"""
+import csv
+import itertools
+import re
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+from docopt import docopt
+from fuzzywuzzy import fuzz
+
+from clubs import ask, open_clubs, retrieve
+from ntfp.cache import DEFAULT_CACHE, DiskCache
+from ntfp.config import config_path, load_config, save_config
+from ntfp.models import DEFAULT_QA_MODEL, load_pipeline, load_spacy, mode_name
+from ntfp.ntfp import (
+    NtfpNoEntityError,
+    answer,
+    get_context,
+    prepare_context,
+    record_preparation,
+)
+from ntfp.ntfp_types import Answer, Context, ExtraDataDict, Question
+from utils.terminal_colors import print_colored_doc, print_verbose
+
+CLUB_SEPARATOR = "\n\n\n"
+FUZZY_MATCH_THRESHOLD = 80
+"""The minimum `fuzz.token_set_ratio` of a fuzzy match."""
+
+TUNE_RETRIEVERS = "snapshot,corpus"
+TUNE_FUZZ = "15,25,40"
+TUNE_LEN = "2,20"
+TUNE_LIMIT = "3,10,25"
+TUNE_BUDGET = "256,512"
+TUNE_DEDUPE = "0,0.9"
+MIN_ACCURACY = 0.8
+
+
+class Config(NamedTuple):
+    """One way of answering the gold questions."""
+
+    path: str
+    retriever: Optional[str]
+    fuzz: Optional[int]
+    len: Optional[int]
+    limit: Optional[int]
+    budget: int
+    dedupe: float
+    mode: str
+
+
+def read_gold(gold_csv: str) -> List[Tuple[Question, str]]:
+    with open(gold_csv, "r", newline="") as f:
+        return [(Question(row["question"]), row["answer"]) for row in csv.DictReader(f)]
+
+
+def normalize_answer(text: str) -> str:
+    """Lowercases, collapses whitespace and strips surrounding punctuation."""
+    return " ".join(text.lower().split()).strip(string.punctuation + " ")
+
+
+def exact_match(prediction: str, gold: str) -> bool:
+    return normalize_answer(prediction) == normalize_answer(gold)
+
+
+def fuzzy_match(prediction: str, gold: str) -> bool:
+    prediction, gold = normalize_answer(prediction), normalize_answer(gold)
+    return fuzz.token_set_ratio(prediction, gold) >= FUZZY_MATCH_THRESHOLD
+
+
+_worker: Dict = {}
+
+
+def _init_worker(
+    in_txt_file: str, cache_path: Optional[str], cache_answers: bool = True
+) -> None:
+    _worker["nlp"] = load_spacy()
+    _worker["in_txt_file"] = in_txt_file
+    _worker["clubs"] = {}
+    _worker["cache"] = DiskCache(cache_path) if cache_path else None
+    _worker["cache_answers"] = cache_answers
+
+
+def _clubs(retriever: str):
+    if retriever not in _worker["clubs"]:
+        clubs = open_clubs(_worker["in_txt_file"], CLUB_SEPARATOR, retriever)
+        _worker["clubs"][retriever] = clubs
+    return _worker["clubs"][retriever]
+
+
+def _context_tokens(context: Context) -> int:
+    """How many tokens the model reads for the context."""
+    if "tokenizer" not in _worker:
+        _worker["tokenizer"] = load_pipeline(model=DEFAULT_QA_MODEL).tokenizer
+    return len(_worker["tokenizer"].tokenize(context)) if context else 0
+
+
+def _answer(
+    config: Config, question: Question
+) -> Tuple[Answer, ExtraDataDict, Context]:
+    quantize = config.mode == mode_name(True)
+    cache: Optional[DiskCache] = _worker["cache"]
+    if config.path == "google":
+        _, _, context = get_context(question, cache=cache)
+        preparation = prepare_context(question, context, config.budget, config.dedupe)
+        context = preparation[0]
+
+        def infer() -> Tuple[Answer, ExtraDataDict]:
+            return answer(question, context, quantize=quantize)
+
+    else:
+        context, token_cache = retrieve(
+            question,
+            _clubs(config.retriever),
+            sep=CLUB_SEPARATOR,
+            fuzz=config.fuzz,
+            limit=config.limit,
+            nlp=_worker["nlp"],
+            len_threshold=config.len,
+        )
+        preparation = prepare_context(
+            question,
+            context,
+            config.budget,
+            config.dedupe,
+            sep=CLUB_SEPARATOR,
+            ranked=True,
+            cache=token_cache,
+        )
+        context = preparation[0]
+
+        def infer() -> Tuple[Answer, ExtraDataDict]:
+            return ask(
+                question,
+                context,
+                sep=CLUB_SEPARATOR,
+                quantize=quantize,
+                token_cache=token_cache,
+            )
+
+    if cache is None or not _worker["cache_answers"]:
+        prediction, extra_data = infer()
+    else:
+        parts = [config.mode, question, context]
+        prediction, extra_data = cache.get_or_compute("answer", parts, infer)
+    record_preparation(extra_data, preparation)
+    return prediction, extra_data, context
+
+
+def evaluate_one(config: Config, question: Question, gold: str) -> Dict:
+    """Answers one gold question. Runs inside a pool process."""
+    start = time.perf_counter()
+    error = ""
+    try:
+        prediction, extra_data, context = _answer(config, question)
+    except NtfpNoEntityError as e:
+        prediction, extra_data, context = Answer(""), {}, Context("")
+        error = e.messsage
+    latency_s = time.perf_counter() - start
+    return {
+        **config._asdict(),
+        "question": question,
+        "gold": gold,
+        "answer": prediction,
+        "score": extra_data.get("score", -1.0),
+        "stage": extra_data.get("stage", ""),
+        "exact": exact_match(prediction, gold),
+        "fuzzy": fuzzy_match(prediction, gold),
+        "latency_s": latency_s,
+        "context_len": len(context),
+        "context_tokens": _context_tokens(context),
+        "dedupe_shrink": extra_data.get("dedupe_shrink", 0.0),
+        "error": error,
+    }
+
+
+def evaluate(
+    configs: List[Config],
+    gold: List[Tuple[Question, str]],
+    in_txt_file: str = "clubs.txt",
+    cache_path: Optional[str] = DEFAULT_CACHE,
+    workers: Optional[int] = None,
+    cache_answers: bool = True,
+) -> pd.DataFrame:
+    """Answers every gold question in every configuration across a process pool.
+
+    Args:
+        cache_answers: Reuse answers from the cache at `cache_path`, not only \
+            fetched pages. Latencies then only measure what was not cached.
+
+    Returns:
+        One row per (configuration, question).
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(in_txt_file, cache_path, cache_answers),
+    ) as executor:
+        futures = [
+            executor.submit(evaluate_one, config, question, answer_)
+            for config in configs
+            for question, answer_ in gold
+        ]
+        return pd.DataFrame([f.result() for f in futures])
+
+
+def report(records: pd.DataFrame) -> pd.DataFrame:
+    """One row of accuracy and latency per configuration."""
+    columns = list(Config._fields)
+    unused = {c: "-" for c in ("retriever", "fuzz", "len", "limit")}
+    grouped = records.fillna(unused).groupby(columns, sort=False)
+    return grouped.agg(
+        n=("question", "size"),
+        exact=("exact", "mean"),
+        fuzzy=("fuzzy", "mean"),
+        latency_mean=("latency_s", "mean"),
+        latency_p95=("latency_s", lambda s: s.quantile(0.95)),
+        context_mean=("context_len", "mean"),
+        context_tokens_mean=("context_tokens", "mean"),
+        dedupe_shrink_mean=("dedupe_shrink", "mean"),
+    ).reset_index()
+
+
+def choose_config(
+    table: pd.DataFrame, min_accuracy: float = MIN_ACCURACY, metric: str = "fuzzy"
+) -> Optional[pd.Series]:
+    """The clubs configuration reading the fewest context tokens, then with \
+        the lowest p95 latency, of those at or above `min_accuracy`.
+
+    Returns:
+        A row of the [`report`](#evaluate.report) table, or `None` when no \
+            configuration is accurate enough.
+    """
+    feasible = table[(table["path"] == "clubs") & (table[metric] >= min_accuracy)]
+    if feasible.empty:
+        return None
+    return feasible.sort_values(["context_tokens_mean", "latency_p95"]).iloc[0]
+
+
+def parse_configs(
+    paths: str,
+    retrievers: str,
+    fuzzes: str,
+    lens: str,
+    limits: str,
+    budgets: str,
+    dedupes: str,
+    modes: str,
+) -> List[Config]:
+    def split(values: str) -> List[str]:
+        return [v for v in re.split(r"\s*,\s*", values.strip()) if v]
+
+    configs = []
+    for path, budget, dedupe_, mode in itertools.product(
+        split(paths), split(budgets), split(dedupes), split(modes)
+    ):
+        if path == "google":
+            configs.append(
+                Config(path, None, None, None, None, int(budget), float(dedupe_), mode)
+            )
+            continue
+        for retriever, fuzz_, len_, limit in itertools.product(
+            split(retrievers), split(fuzzes), split(lens), split(limits)
+        ):
+            configs.append(
+                Config(
+                    path,
+                    retriever,
+                    int(fuzz_),
+                    int(len_),
+                    int(limit),
+                    int(budget),
+                    float(dedupe_),
+                    mode,
+                )
+            )
+    return configs
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__, version="Evaluate 1.0", help=False)
+    VERBOSE = arguments["--verbose"]
+    DEBUG = arguments["--debug"]
+    print(arguments) if DEBUG else None
+    if arguments["--help"]:
+        print_colored_doc(
+            doc=__doc__,
+            to_color_green_bold=("evaluate.py", "--tune", "(-h | --help)"),
+            to_color_yellow_bold=("[GOLD_CSV]",),
+            to_color_white_bold=(
+                "Measure the accuracy and latency of answering a gold set of questions.",  # noqa
+                "Usage:",
+                "Options:",
+                "Example:",
+                "Resources:",
+            ),
+            to_color_white_bold_patterns=(r"(\$.*)",),
+            to_color_red_bold_patterns=(r"(defaults to.*)",),
+            to_color_grey_out=("[//]: # (markdown comment # noqa)",),
+        )
+        exit()
+    TUNE = arguments["--tune"]
+    CONFIG_FILE = config_path(arguments["--config"])
+    CONFIG = load_config(CONFIG_FILE)
+    GOLD_CSV = arguments["GOLD_CSV"] or "gold.csv"
+    IN_TXT_FILE = arguments["--in-txt-file"] or "clubs.txt"
+    WORKERS = arguments["--workers"]
+    WORKERS = int(WORKERS) if WORKERS else None
+    CACHE = None if arguments["--no-cache"] else arguments["--cache"] or DEFAULT_CACHE
+    MIN = float(arguments["--min-accuracy"] or MIN_ACCURACY)
+    METRIC = arguments["--metric"] or "fuzzy"
+    CONFIGS = parse_configs(
+        "clubs" if TUNE else arguments["--path"] or "clubs",
+        arguments["--retrievers"] or (TUNE_RETRIEVERS if TUNE else CONFIG["retriever"]),
+        arguments["--fuzz"] or (TUNE_FUZZ if TUNE else str(CONFIG["fuzz"])),
+        arguments["--len"] or (TUNE_LEN if TUNE else str(CONFIG["len"])),
+        arguments["--limit"] or (TUNE_LIMIT if TUNE else str(CONFIG["limit"])),
+        arguments["--budget"] or (TUNE_BUDGET if TUNE else str(CONFIG["budget"])),
+        arguments["--dedupe"] or (TUNE_DEDUPE if TUNE else str(CONFIG["dedupe"])),
+        arguments["--modes"] or mode_name(False),
+    )
+    print_verbose("CONFIGS", CONFIGS) if DEBUG else None
+    gold = read_gold(GOLD_CSV)
+    records = evaluate(
+        CONFIGS,
+        gold,
+        in_txt_file=IN_TXT_FILE,
+        cache_path=CACHE,
+        workers=WORKERS,
+        cache_answers=not TUNE,
+    )
+    if arguments["--out"]:
+        OUT = arguments["--out"]
+        records.to_csv(OUT, index=False)
+        print(f"wrote {len(records)} answers to {OUT}") if VERBOSE else None
+    table = report(records)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(table.round(3).to_string(index=False))
+    if TUNE:
+        best = choose_config(table, min_accuracy=MIN, metric=METRIC)
+        if best is None:
+            print(f"no configuration has {METRIC} >= {MIN}, kept {CONFIG_FILE}")
+            exit(1)
+        tuned = {
+            "fuzz": int(best["fuzz"]),
+            "len": int(best["len"]),
+            "limit": int(best["limit"]),
+            "retriever": best["retriever"],
+            "budget": int(best["budget"]),
+            "dedupe": float(best["dedupe"]),
+        }
+        tuning = {
+            "gold": GOLD_CSV,
+            "n": int(best["n"]),
+            "mode": best["mode"],
+            METRIC: float(best[METRIC]),
+            "min_accuracy": MIN,
+            "context_tokens_mean": float(best["context_tokens_mean"]),
+            "latency_p95": float(best["latency_p95"]),
+            "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        path = save_config(tuned, CONFIG_FILE, tuning=tuning)
+        print(f"wrote {path}: {tuned}")
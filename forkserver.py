@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""forkserver.py
+
+Preload torch, transformers, spaCy and the QA pipeline once, so that main.py and clubs.py start warm.
+
+[//]: # (markdown comment # noqa)
+
+Usage:
+    forkserver.py [ --socket=FILE ]
+                  [ --quantize ]
+                  [ --verbose | -v ]
+                  [ --debug | -d ]
+    forkserver.py (--status | --stop) [ --socket=FILE ]
+    forkserver.py (-h | --help)
+
+Options:
+    -h --help        Show this screen.
+    --socket=FILE    defaults to $NTFP_FORKSERVER or "~/.cache/ntfp/forkserver.sock".
+    --quantize       also preload the int8 quantized model.
+    --status         print whether a server is running.
+    --stop           stop the running server.
+    --verbose -v     printouts while running.
+    --debug -d       printouts while running, extra debugging.
+
+While the server runs, main.py and clubs.py are run by a forked copy of
+it, with the same arguments, terminal and exit status. Without a server
+they run in-process as before. NTFP_FORKSERVER=0 never uses a server.
+
+Example:
+    $ python forkserver.py &
+    serving on ~/.cache/ntfp/forkserver.sock, preloaded in 9.7s
+
+    $ python clubs.py --example
+    question: who is the advisor for Computer Science and Artificial Intelligence club?
+    answer: Foaad Khosmood
+
+    $ python forkserver.py --status
+    {'pid': 4242, 'served': 1}
+
+    $ python forkserver.py --stop
+
+Resources:
+    * docopt is cool
+        * http://docopt.org
+"""
+import sys
+
+from docopt import docopt
+
+from ntfp.forkserver import request, serve
+from utils.terminal_colors import print_colored_doc
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__, version="Forkserver 1.0", help=False)
+    VERBOSE = arguments["--verbose"]
+    DEBUG = arguments["--debug"]
+    print(arguments) if DEBUG else None
+    if arguments["--help"]:
+        print_colored_doc(
+            doc=__doc__,
+            to_color_green_bold=("forkserver.py", "(-h | --help)"),
+            to_color_white_bold=(
+                "Preload torch, transformers, spaCy and the QA pipeline once, so that main.py and clubs.py start warm.",  # noqa
+                "Usage:",
+                "Options:",
+                "Example:",
+                "Resources:",
+            ),
+            to_color_white_bold_patterns=(r"(\$.*)",),
+            to_color_red_bold_patterns=(r"(defaults to.*)",),
+            to_color_grey_out=("[//]: # (markdown comment # noqa)",),
+        )
+        exit()
+    SOCKET = arguments["--socket"]
+    if arguments["--status"] or arguments["--stop"]:
+        reply = request("status" if arguments["--status"] else "stop", SOCKET)
+        print(reply if reply is not None else "no fork-server is running")
+        sys.exit(0 if reply is not None else 1)
+    try:
+        serve(SOCKET, quantize=arguments["--quantize"], verbose=VERBOSE or DEBUG)
+    except KeyboardInterrupt:
+        pass
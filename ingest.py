@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""ingest.py
+
+Pre-extract and index contexts ahead of query time.
+
+[//]: # (markdown comment # noqa)
+
+Usage:
+    ingest.py [SOURCES ...]
+              [ --from-file=FILE ]
+              [ --store="contexts.db" ]
+              [ --workers=N ]
+              [ --verbose | -v ]
+              [ --debug | -d ]
+    ingest.py (-h | --help)
+              [ --verbose | -v ]
+              [ --debug | -d ]
+
+Options:
+    -h --help              Show this screen.
+    [SOURCES ...]          URLs, HTML files or plain-text files to ingest.
+    --from-file=FILE       also ingest every source listed in FILE, one per line.
+    --store="contexts.db"  defaults to "contexts.db". Where chunks are stored.
+    --workers=N            defaults to the number of CPUs. Size of process pool.
+    --verbose -v           printouts while running.
+    --debug -d             printouts while running, extra debugging.
+
+Example:
+    $ python ingest.py https://cpe.calpoly.edu/faculty/foaad/ clubs.txt -v
+    https://cpe.calpoly.edu/faculty/foaad/: 14 new of 14 chunks
+    clubs.txt: 798 new of 811 chunks
+    added 812 chunks to contexts.db
+
+    $ python ingest.py --from-file=trusted_urls.txt --store=trusted.db
+
+Resources:
+    * docopt is cool
+        * http://docopt.org
+"""
+from docopt import docopt
+
+from ntfp.ingest import ingest
+from utils.terminal_colors import print_colored_doc, print_verbose
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__, version="Ingest 1.0", help=False)
+    VERBOSE = arguments["--verbose"]
+    DEBUG = arguments["--debug"]
+    print(arguments) if DEBUG else None
+    if arguments["--help"]:
+        print_colored_doc(
+            doc=__doc__,
+            to_color_green_bold=("ingest.py", "(-h | --help)"),
+            to_color_yellow_bold=("[SOURCES ...]",),
+            to_color_white_bold=(
+                "Pre-extract and index contexts ahead of query time.",
+                "Usage:",
+                "Options:",
+                "Example:",
+                "Resources:",
+            ),
+            to_color_white_bold_patterns=(r"(\$.*)",),
+            to_color_red_bold_patterns=(r"(defaults to.*)",),
+            to_color_grey_out=("[//]: # (markdown comment # noqa)",),
+        )
+        exit()
+    STORE = arguments["--store"] or "contexts.db"
+    WORKERS = arguments["--workers"]
+    WORKERS = int(WORKERS) if WORKERS else None
+    SOURCES = list(arguments["SOURCES"])
+    if arguments["--from-file"]:
+        with open(arguments["--from-file"], "r") as f:
+            SOURCES += [line.strip() for line in f if line.strip()]
+    print_verbose("SOURCES", SOURCES) if DEBUG else None
+    added = ingest(SOURCES, store=STORE, workers=WORKERS, verbose=VERBOSE or DEBUG)
+    print(f"added {added} chunks to {STORE}")
@@ -1,5 +1,95 @@
 #!/usr/bin/env python3
-from ntfp.ntfp import get_context, transformer
+"""main.py
+
+Answer questions from Google and log every answer to data.csv.
+
+[//]: # (markdown comment # noqa)
+
+The token budget and dedupe threshold come from the tuned config, see
+ntfp/config.py. Its relevance thresholds and context limit were tuned on
+the clubs corpus, so the Google path keeps its own.
+
+Usage:
+    main.py [ --deadline=10 ]
+            [ --cascade=SPEC ]
+            [ --min-yield=0.2 ]
+            [ --profile ] [ --profile-dir=DIR ]
+            [ --verbose | -v ]
+            [ --debug | -d ]
+    main.py --batch=QUESTIONS
+            [ --concurrency=8 ]
+            [ --workers=N ]
+            [ --deadline=10 ]
+            [ --cascade=SPEC ]
+            [ --min-yield=0.2 ]
+            [ --profile ] [ --profile-dir=DIR ]
+            [ --verbose | -v ]
+            [ --debug | -d ]
+    main.py (-h | --help)
+            [ --verbose | -v ]
+            [ --debug | -d ]
+
+Options:
+    -h --help            Show this screen.
+    --batch=QUESTIONS    answer each line of QUESTIONS ("-" for stdin).
+    --concurrency=8      defaults to 8. Questions fetching at the same time.
+    --workers=N          defaults to 0, batched in this process. Forked
+                         processes sharing the model that answer in parallel.
+    --deadline=10        defaults to 10. Seconds of fetching per question.
+    --cascade=SPEC       defaults to only the distilbert model. Comma separated
+                         "model:score" stages, cheapest first; a question goes
+                         on to the next model when it scores below "score".
+    --min-yield=0.2      defaults to 0.2. The least ranking score of a result
+                         page worth fetching, from 0 (fetch all) to 1.
+    --profile            profile the CPU time and memory of every stage.
+    --profile-dir=DIR    defaults to "profile". Where the profiles are written.
+    --verbose -v         printouts while running.
+    --debug -d           printouts while running, extra debugging.
+
+Example:
+    $ python main.py
+    question: what is foaad email?
+    ...
+    answer:  foaad@calpoly.edu
+    appended a row to data.csv
+
+    $ python main.py --profile
+    question: what is foaad email?
+    ...
+    stage         calls  seconds  peak_kib  net_kib
+    torch             1    0.412   10563.2    128.4
+    ...
+    wrote profiles to profile, see profile/summary.txt
+
+    $ python main.py --batch=questions.txt --concurrency=16
+    ...
+    appended 100 rows to data.csv
+    100 questions in 21.3s (4.7/s)
+    latency mean 2.9s p50 2.4s p95 6.8s
+
+Resources:
+    * docopt is cool
+        * http://docopt.org
+"""
+if __name__ == "__main__":
+    # before the heavy imports, to run warm when a fork-server is running
+    from ntfp.forkserver import run_in_server
+
+    run_in_server()
+
+import sys
+import time
+from os import listdir
+from typing import Dict, List, Tuple, cast
+
+import pandas as pd
+from docopt import docopt
+
+from ntfp.batch import DEFAULT_CONCURRENCY, answer_from_google_batch
+from ntfp.cascade import parse_cascade
+from ntfp.config import load_config
+from ntfp.deadline import Deadline, DEFAULT_DEADLINE_SECONDS
+from ntfp.ntfp import answer_from_google
 from ntfp.ntfp_types import (
     Answer,
     Context,
@@ -11,52 +101,150 @@ from ntfp.ntfp_types import (
     Start,
     End,
 )
-from typing import Tuple, cast
-import pandas as pd
-from os import listdir
+from ntfp.pool import InferencePool
+from ntfp.profiling import DEFAULT_PROFILE_DIR, profile_until_exit
+from ntfp.ranking import DEFAULT_MIN_YIELD, load_yields, record_yields
+from utils.terminal_colors import print_colored_doc
 
+CSV_FILENAME = "data.csv"
 
-if __name__ == "__main__":
-    print("\n")
-    user_input: str = input("question: ")
-    question: Question = Question(user_input)
-
-    google_data: Tuple[Query, WebPage, Context] = get_context(question)
-    query, page, context = google_data
-    print("len(context): ", len(context))
-
-    trfrmr_data: Tuple[Answer, ExtraDataDict] = transformer(question, context)
-    answer = trfrmr_data[0]
-    extra_data = trfrmr_data[1]
-    print("\n\n\nanswer: ", answer)
-
-    CSV_FILENAME = "data.csv"
 
+def make_row(
+    question: Question,
+    google_data: Tuple[Query, WebPage, Context, Answer, ExtraDataDict],
+) -> Dict:
+    query, page, context, answer, extra_data = google_data
     score: Score = cast(Score, extra_data["score"])
     start: Start = cast(Start, extra_data["start"])
     end: End = cast(End, extra_data["end"])
     tokenizer: str = extra_data["tokenizer"]
     model: str = extra_data["model"]
     # fmt:off
-    data = {
-        "question": [question],
-        "query": [query],
-        "answer": [answer],
-        "score": [score],
-        "start": [start],
-        "end": [end],
-        "tokenizer": [tokenizer],
-        "model": [model],
-        "context": [context],
-        "page": [page],
+    return {
+        "question": question,
+        "query": query,
+        "answer": answer,
+        "score": score,
+        "start": start,
+        "end": end,
+        "tokenizer": tokenizer,
+        "model": model,
+        "context": context,
+        "page": page,
     }
     # fmt:on
 
-    df: pd.DataFrame = pd.DataFrame(data)
 
+def write_rows(rows: List[Dict]) -> None:
+    """Appends all rows to data.csv in one write."""
+    df: pd.DataFrame = pd.DataFrame(rows)
+    rows_text = "a row" if len(rows) == 1 else f"{len(rows)} rows"
     if CSV_FILENAME in listdir("."):
         df.to_csv(CSV_FILENAME, mode="a", header=False)
-        print(f"appended new row to {CSV_FILENAME}")
+        print(f"appended {rows_text} to {CSV_FILENAME}")
     else:
         df.to_csv(CSV_FILENAME)
-        print(f"created {CSV_FILENAME} and appended a row.")
+        print(f"created {CSV_FILENAME} and appended {rows_text}.")
+
+
+def read_questions(questions_file: str) -> List[Question]:
+    """One question per non-blank line of the file, or of stdin for `"-"`."""
+    if questions_file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(questions_file, "r") as f:
+            lines = f.read().splitlines()
+    return [Question(line.strip()) for line in lines if line.strip()]
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__, version="Main 1.0", help=False)
+    VERBOSE = arguments["--verbose"]
+    DEBUG = arguments["--debug"]
+    print(arguments) if DEBUG else None
+    if arguments["--help"]:
+        print_colored_doc(
+            doc=__doc__,
+            to_color_green_bold=("main.py", "--batch=QUESTIONS", "(-h | --help)"),
+            to_color_white_bold=(
+                "Answer questions from Google and log every answer to data.csv.",
+                "Usage:",
+                "Options:",
+                "Example:",
+                "Resources:",
+            ),
+            to_color_white_bold_patterns=(r"(\$.*)",),
+            to_color_red_bold_patterns=(r"(defaults to.*)",),
+            to_color_grey_out=("[//]: # (markdown comment # noqa)",),
+        )
+        exit()
+    DEADLINE = arguments["--deadline"] or DEFAULT_DEADLINE_SECONDS
+    DEADLINE = float(DEADLINE)
+    CONCURRENCY = arguments["--concurrency"] or DEFAULT_CONCURRENCY
+    CONCURRENCY = int(CONCURRENCY)
+    CASCADE = arguments["--cascade"]
+    CASCADE = parse_cascade(CASCADE) if CASCADE else None
+    MIN_YIELD = arguments["--min-yield"] or DEFAULT_MIN_YIELD
+    MIN_YIELD = float(MIN_YIELD)
+    YIELDS = load_yields()
+    CONFIG = load_config()
+    WORKERS = arguments["--workers"]
+    # forked before any inference runs in this process, see ntfp.pool
+    POOL = InferencePool(workers=int(WORKERS)) if WORKERS else None
+    if arguments["--profile"]:
+        profile_until_exit(arguments["--profile-dir"] or DEFAULT_PROFILE_DIR)
+    if arguments["--batch"]:
+        questions = read_questions(arguments["--batch"])
+        started = time.perf_counter()
+        results = answer_from_google_batch(
+            questions,
+            concurrency=CONCURRENCY,
+            deadline_seconds=DEADLINE,
+            verbose=VERBOSE or DEBUG,
+            cascade=CASCADE,
+            min_yield=MIN_YIELD,
+            yields=YIELDS,
+            pool=POOL,
+            budget=CONFIG["budget"],
+            dedupe_threshold=CONFIG["dedupe"],
+        )
+        if POOL is not None:
+            POOL.close()
+        elapsed = time.perf_counter() - started
+        write_rows([make_row(q, r) for q, r in zip(questions, results)])
+        record_yields(y for r in results for y in r[4].get("page_yields", []))
+        latencies = pd.Series([r[4]["latency_s"] for r in results], dtype=float)
+        rate = len(questions) / elapsed if elapsed else 0.0
+        print(f"{len(questions)} questions in {elapsed:.1f}s ({rate:.1f}/s)")
+        errors = [r[4]["error"] for r in results if "error" in r[4]]
+        print(f"{len(errors)} questions failed, e.g. {errors[0]}") if errors else None
+        if len(latencies):
+            print(
+                f"latency mean {latencies.mean():.1f}s"
+                f" p50 {latencies.quantile(0.5):.1f}s"
+                f" p95 {latencies.quantile(0.95):.1f}s"
+            )
+        exit()
+
+    print("\n")
+    user_input: str = input("question: ")
+    question: Question = Question(user_input)
+
+    google_data: Tuple[
+        Query, WebPage, Context, Answer, ExtraDataDict
+    ] = answer_from_google(
+        question,
+        deadline=Deadline(DEADLINE),
+        cascade=CASCADE,
+        min_yield=MIN_YIELD,
+        yields=YIELDS,
+        budget=CONFIG["budget"],
+        dedupe_threshold=CONFIG["dedupe"],
+    )
+    query, page, context, answer, extra_data = google_data
+    print("len(context): ", len(context))
+    print("pages_fetched: ", extra_data.get("pages_fetched", 0))
+    print("\n\n\nanswer: ", answer)
+
+    write_rows([make_row(question, google_data)])
+    record_yields(extra_data.get("page_yields", []))
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""Non-blocking counterparts of the [`ntfp`](ntfp.html) pipeline.
+
+[//]: # (markdown comment # noqa)
+
+HTTP goes through [aiohttp][1], so a question waiting on a web page holds
+no thread. Parsing HTML and extracting PDFs run in a small thread pool, and
+inference runs in a single inference thread or an
+[`InferencePool`](pool.html#ntfp.pool.InferencePool), so the CPU-bound
+stages stay bounded no matter how many questions are in flight.
+
+Every coroutine returns the same `ntfp_types` values as its blocking twin,
+and the contexts go through the same
+[`prepare_context`](ntfp.html#ntfp.ntfp.prepare_context), so both paths
+dedupe, pack into the token budget and rank the result pages alike.
+
+Example:
+    >>> async def main(questions):
+    ...     async with client_session() as session:
+    ...         return await asyncio.gather(
+    ...             *[answer_from_google_async(q, session=session) for q in questions]
+    ...         )
+    >>> loop = asyncio.get_event_loop()
+    >>> loop.run_until_complete(main(["what is foaad email?", ...]))
+    [('what is foaad email? site:calpoly.edu', '<html>...', ..., 'foaad@calpoly.edu', {...}), ...]
+
+Resources:
+    * [aiohttp client][1]
+    * [loop.run_in_executor][2]
+
+[1]: https://docs.aiohttp.org/en/stable/client.html
+[2]: https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.AbstractEventLoop.run_in_executor
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+from typing_extensions import Final
+
+from ntfp.cascade import Cascade
+from ntfp.deadline import DEFAULT_DEADLINE_SECONDS, NO_DEADLINE, Deadline
+from ntfp.dedupe import DEFAULT_SIMILARITY
+from ntfp.fast_path import fast_answer
+from ntfp.models import DEFAULT_QA_MODEL
+from ntfp.ntfp import (
+    CONFIDENT_SCORE_THRESHOLD,
+    DEFAULT_TIMEOUT_SECONDS,
+    FETCH_CONCURRENCY,
+    GOOGLE_SHARE,
+    MAX_CONNECTIONS,
+    PAGES_SHARE,
+    SNIPPET_SCORE_THRESHOLD,
+    answer,
+    answering_model,
+    create_query,
+    extract_relevant_context,
+    parse_google_results,
+    prepare_context,
+    ranked_urls,
+    record_fetching,
+    record_preparation,
+    url_param_sanitize,
+)
+from ntfp.ntfp_types import (
+    URL,
+    Answer,
+    Context,
+    ExtraDataDict,
+    GooglePage,
+    GoogleResults,
+    GoogleResultURL,
+    Query,
+    Question,
+    WebPage,
+)
+from ntfp.packing import DEFAULT_TOKEN_BUDGET, count_tokens
+from ntfp.pdf import get_pdf_page
+from ntfp.pool import InferencePool
+from ntfp.ranking import DEFAULT_MIN_YIELD, HostYields
+from ntfp.store import DEFAULT_STORE, lookup_context
+
+PARSE_WORKERS: Final[int] = 4
+"""Threads that parse HTML, extract PDFs and read the store."""
+
+_parse_executor: Final[ThreadPoolExecutor] = ThreadPoolExecutor(
+    max_workers=PARSE_WORKERS
+)
+
+_inference_executor: Final[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=1)
+"""One thread, since torch already spreads one forward pass over every core."""
+
+
+def client_session(
+    connections: int = MAX_CONNECTIONS, timeout: float = DEFAULT_TIMEOUT_SECONDS
+) -> aiohttp.ClientSession:
+    """A `ClientSession` sharing at most `connections` pooled connections.
+
+    Create it inside a running event loop and share it between questions.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=connections),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
+
+
+async def _in_executor(executor: ThreadPoolExecutor, f, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, partial(f, *args, **kwargs))
+
+
+async def get_page_async(
+    url: URL,
+    session: aiohttp.ClientSession,
+    verbose: bool = False,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+) -> WebPage:
+    """Like [`get_page`](ntfp.html#ntfp.ntfp.get_page), without blocking."""
+    if url.endswith("pdf"):
+        return await _in_executor(
+            _parse_executor, get_pdf_page, url, verbose, deadline=Deadline(timeout)
+        )
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with session.get(url, timeout=client_timeout) as response:
+        html: str = await response.text(errors="replace")
+    return WebPage(html)
+
+
+async def get_google_page_async(
+    query: Query,
+    session: aiohttp.ClientSession,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+) -> GooglePage:
+    """Like [`get_google_page`](ntfp.html#ntfp.ntfp.get_google_page), \
+        without blocking.
+    """
+    url = URL(f"https://www.google.com/search?q={url_param_sanitize(query)}")
+    return GooglePage(await get_page_async(url, session, timeout=timeout))
+
+
+async def fetch_google_result_urls_async(
+    query: Query, session: aiohttp.ClientSession, limit: Optional[int] = None
+) -> AsyncIterator[GoogleResultURL]:
+    """Yields the result URLs of the first Google page, in ranked order."""
+    page = await get_google_page_async(query, session)
+    results = await _in_executor(_parse_executor, parse_google_results, page)
+    for result in results[:limit]:
+        yield result.url
+
+
+async def get_context_async(
+    question: Question,
+    session: Optional[aiohttp.ClientSession] = None,
+    use_google: bool = True,
+    verbose: bool = False,
+    store: str = DEFAULT_STORE,
+) -> Tuple[Query, WebPage, Context]:
+    """Like [`get_context`](ntfp.html#ntfp.ntfp.get_context), without blocking.
+
+    `session` is required when `use_google` is `True`.
+    """
+    if not use_google:
+        context = await _in_executor(
+            _parse_executor, lookup_context, question, store=store
+        )
+        return Query(question), WebPage(""), context
+    query: Query = create_query(question)
+    page: GooglePage = await get_google_page_async(query, session)
+    if verbose:
+        print("query: ", query, "\n")
+        print("len(page): ", len(page), "\n")
+    context = await _in_executor(
+        _parse_executor, extract_relevant_context, page, question
+    )
+    return query, page, context
+
+
+async def answer_async(
+    q: Question,
+    c: Context,
+    model: str = DEFAULT_QA_MODEL,
+    quantize: bool = False,
+    pool: Optional[InferencePool] = None,
+    deadline: Deadline = NO_DEADLINE,
+    cascade: Optional[Cascade] = None,
+) -> Tuple[Answer, ExtraDataDict]:
+    """Like [`answer`](ntfp.html#ntfp.ntfp.answer), without blocking.
+
+    Args:
+        pool: An optional [`InferencePool`](pool.html#ntfp.pool.InferencePool) \
+            to run the transformer in, instead of the one inference thread. \
+            Its own model is used, not `model` or `quantize`. \
+            A `cascade` runs in the inference thread instead.
+    """
+    if pool is None or cascade or (deadline.expired() and not c):
+        return await _in_executor(
+            _inference_executor,
+            answer,
+            q,
+            c,
+            model=model,
+            quantize=quantize,
+            deadline=deadline,
+            cascade=cascade,
+        )
+    fast = fast_answer(q, c)
+    if fast is not None:
+        return fast
+    result, extra_data = await asyncio.wrap_future(pool.submit(q, c))
+    extra_data["stage"] = "transformer"
+    return result, extra_data
+
+
+async def _get_page_or_none(
+    url: URL, session: aiohttp.ClientSession, timeout: float
+) -> Optional[WebPage]:
+    try:
+        return await get_page_async(url, session, timeout=timeout)
+    except Exception:
+        # like fetch_ranked_contexts, a page that fails for any reason is skipped,
+        # e.g. a requests.HTTPError of a PDF
+        return None
+
+
+async def answer_packed_async(
+    question: Question,
+    context: Context,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    dedupe_threshold: Optional[float] = DEFAULT_SIMILARITY,
+    deadline: Deadline = NO_DEADLINE,
+    cascade: Optional[Cascade] = None,
+    pool: Optional[InferencePool] = None,
+) -> Tuple[Context, Answer, ExtraDataDict]:
+    """Like [`answer_packed`](ntfp.html#ntfp.ntfp.answer_packed), without blocking."""
+    model = answering_model(cascade=cascade, pool=pool)
+    preparation = await _in_executor(
+        _parse_executor,
+        prepare_context,
+        question,
+        context,
+        budget,
+        dedupe_threshold,
+        model=model,
+    )
+    best_answer, extra_data = await answer_async(
+        question, preparation[0], pool=pool, deadline=deadline, cascade=cascade
+    )
+    return preparation[0], best_answer, record_preparation(extra_data, preparation)
+
+
+async def fetch_ranked_contexts_async(
+    question: Question,
+    results: GoogleResults,
+    session: aiohttp.ClientSession,
+    limit: int = 10,
+    deadline: Deadline = NO_DEADLINE,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    min_yield: float = DEFAULT_MIN_YIELD,
+    yields: Optional[HostYields] = None,
+    model: str = DEFAULT_QA_MODEL,
+) -> List[Tuple[GoogleResultURL, Context]]:
+    """Like [`fetch_ranked_contexts`](ntfp.html#ntfp.ntfp.fetch_ranked_contexts), \
+        without blocking. Fetches still in flight when it stops are cancelled.
+    """
+    urls = ranked_urls(question, results, limit, min_yield, yields)
+    arrived: Dict[int, Context] = {}
+    in_flight: Dict[asyncio.Future, int] = {}
+    tokens = 0
+    index = 0
+    try:
+        while index < len(urls) or in_flight:
+            while index < len(urls) and len(in_flight) < FETCH_CONCURRENCY:
+                timeout = deadline.remaining()
+                timeout = DEFAULT_TIMEOUT_SECONDS if timeout is None else timeout
+                task = asyncio.ensure_future(
+                    _get_page_or_none(urls[index], session, timeout)
+                )
+                in_flight[task] = index
+                index += 1
+            done, _ = await asyncio.wait(
+                in_flight,
+                timeout=deadline.remaining(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                break  # the deadline expired
+            for task in done:
+                i = in_flight.pop(task)
+                if task.result() is None:
+                    continue
+                arrived[i] = await _in_executor(
+                    _parse_executor, extract_relevant_context, task.result(), question
+                )
+                if budget and arrived[i]:
+                    tokens += await _in_executor(
+                        _parse_executor, count_tokens, arrived[i], model
+                    )
+            if budget and tokens >= budget:
+                break
+    finally:
+        for task in in_flight:
+            task.cancel()
+    return [(urls[i], arrived[i]) for i in sorted(arrived)]
+
+
+async def answer_from_google_async(
+    question: Question,
+    session: aiohttp.ClientSession,
+    threshold: float = SNIPPET_SCORE_THRESHOLD,
+    limit: int = 10,
+    deadline: Optional[Deadline] = None,
+    pool: Optional[InferencePool] = None,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    dedupe_threshold: Optional[float] = DEFAULT_SIMILARITY,
+    cascade: Optional[Cascade] = None,
+    min_yield: float = DEFAULT_MIN_YIELD,
+    yields: Optional[HostYields] = None,
+) -> Tuple[Query, GooglePage, Context, Answer, ExtraDataDict]:
+    """Like [`answer_from_google`](ntfp.html#ntfp.ntfp.answer_from_google), \
+        without blocking.
+
+    [//]: # (markdown comment # noqa)
+
+    Result pages still in flight when their share of the
+    [`Deadline`](deadline.html#ntfp.deadline.Deadline) runs out, or once
+    the token budget is filled, are cancelled.
+    """
+    if deadline is None:
+        deadline = Deadline(DEFAULT_DEADLINE_SECONDS)
+    query: Query = create_query(question)
+    try:
+        page = await get_google_page_async(
+            query, session, timeout=deadline.share(GOOGLE_SHARE).remaining()
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        page = GooglePage(WebPage(""))
+    results: GoogleResults = await _in_executor(
+        _parse_executor, parse_google_results, page
+    )
+    context = Context("\n".join(r.snippet for r in results if r.snippet))
+    context, best_answer, extra_data = await answer_packed_async(
+        question, context, budget, dedupe_threshold, deadline, cascade, pool
+    )
+    extra_data["pages_fetched"] = 0
+    if extra_data["score"] >= threshold or deadline.expired():
+        return query, page, context, best_answer, extra_data
+    fetched = await fetch_ranked_contexts_async(
+        question,
+        results,
+        session,
+        limit=limit,
+        deadline=deadline.share(PAGES_SHARE),
+        budget=budget,
+        min_yield=min_yield,
+        yields=yields,
+        model=answering_model(cascade=cascade, pool=pool),
+    )
+    # the snippets already scored below threshold, the pages get the budget
+    page_context = Context("\n".join(c for _, c in fetched if c))
+    page_context, page_answer, page_extra_data = await answer_packed_async(
+        question, page_context, budget, dedupe_threshold, deadline, cascade, pool
+    )
+    if page_extra_data["score"] < extra_data["score"]:
+        best = (context, best_answer, extra_data)
+    else:
+        best = (page_context, page_answer, page_extra_data)
+    best_context, best_answer, extra_data = best
+    record_fetching(extra_data, fetched, min(len(results), limit), best_answer)
+    return query, page, best_context, best_answer, extra_data
+
+
+async def stream_answers_async(
+    question: Question,
+    session: aiohttp.ClientSession,
+    threshold: float = CONFIDENT_SCORE_THRESHOLD,
+    limit: int = 10,
+    deadline: Optional[Deadline] = None,
+    pool: Optional[InferencePool] = None,
+) -> AsyncIterator[Tuple[Answer, ExtraDataDict]]:
+    """Like [`stream_answers`](ntfp.html#ntfp.ntfp.stream_answers), without \
+        blocking.
+
+    [//]: # (markdown comment # noqa)
+
+    Fetches still in flight are cancelled as soon as an answer scores
+    `threshold`, the deadline runs out, or the caller stops iterating.
+    """
+    if deadline is None:
+        deadline = Deadline(DEFAULT_DEADLINE_SECONDS)
+    query: Query = create_query(question)
+    try:
+        page = await get_google_page_async(
+            query, session, timeout=deadline.share(GOOGLE_SHARE).remaining()
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        page = GooglePage(WebPage(""))
+    results: GoogleResults = await _in_executor(
+        _parse_executor, parse_google_results, page
+    )
+    context = Context("\n".join(r.snippet for r in results if r.snippet))
+    best_answer, best = await answer_async(question, context, pool=pool)
+    best["pages_fetched"] = 0
+    yield best_answer, best
+    if best["score"] >= threshold or deadline.expired():
+        return
+    tasks = [
+        asyncio.ensure_future(_get_page_or_none(url, session, deadline.remaining()))
+        for url in ranked_urls(question, results, limit)
+    ]
+    fetched = 0
+    try:
+        for next_page in asyncio.as_completed(tasks, timeout=deadline.remaining()):
+            page_or_none = await next_page
+            fetched += 1
+            if deadline.expired():
+                return
+            if page_or_none is None:
+                continue
+            page_context = await _in_executor(
+                _parse_executor, extract_relevant_context, page_or_none, question
+            )
+            if not page_context:
+                continue
+            page_answer, extra_data = await answer_async(
+                question, page_context, pool=pool
+            )
+            extra_data["pages_fetched"] = fetched
+            if extra_data["score"] > best["score"]:
+                best_answer, best = page_answer, extra_data
+                yield best_answer, best
+                if best["score"] >= threshold:
+                    return
+    except asyncio.TimeoutError:
+        return
+    finally:
+        for task in tasks:
+            task.cancel()
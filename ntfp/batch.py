@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Answering many questions from Google at once.
+
+[//]: # (markdown comment # noqa)
+
+[`answer_from_google_batch`](#ntfp.batch.answer_from_google_batch) does what
+[`answer_from_google`](ntfp.html#ntfp.ntfp.answer_from_google) does for each
+question, but the questions overlap: up to `concurrency` of them fetch their
+pages at the same time, and the contexts that have arrived are answered
+together in batches of the model while the other fetches go on.
+
+A question that fails, e.g. because its Google page could not be fetched,
+gets an `IDK` answer with the `error` in its extra data; the rest of the
+batch goes on.
+
+Example:
+    >>> results = answer_from_google_batch(["what is foaad email?", ...])
+    >>> query, page, context, answer, extra_data = results[0]
+    >>> extra_data["latency_s"]
+    1.83
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple, Union
+
+from typing_extensions import Final
+
+from ntfp.cascade import Cascade, run_cascade_batch
+from ntfp.deadline import DEFAULT_DEADLINE_SECONDS, Deadline
+from ntfp.fast_path import fast_answer
+from ntfp.ntfp import (
+    SNIPPET_SCORE_THRESHOLD,
+    answering_model,
+    create_query,
+    fetch_ranked_contexts,
+    get_google_page,
+    parse_google_results,
+    prepare_context,
+    record_fetching,
+    record_preparation,
+)
+from ntfp.ntfp_types import (
+    IDK,
+    Answer,
+    Context,
+    ExtraDataDict,
+    GooglePage,
+    GoogleResults,
+    Query,
+    Question,
+    URL,
+    WebPage,
+)
+from ntfp.dedupe import DEFAULT_SIMILARITY
+from ntfp.packing import DEFAULT_TOKEN_BUDGET
+from ntfp.pool import InferencePool
+from ntfp.ranking import DEFAULT_MIN_YIELD, HostYields
+from ntfp.token_cache import cached_transformer_batch
+
+DEFAULT_CONCURRENCY: Final[int] = 8
+"""How many questions fetch their pages at the same time."""
+
+INFERENCE_BATCH_SIZE: Final[int] = 16
+"""How many contexts are answered in one model call."""
+
+_SNIPPETS = "snippets"
+_PAGES = "pages"
+
+GoogleBatchResult = Tuple[Query, GooglePage, Context, Answer, ExtraDataDict]
+
+
+def failed_result(question: Question, error: Exception) -> GoogleBatchResult:
+    """The IDK result of a question that failed, with the `error` recorded."""
+    extra_data: ExtraDataDict = {
+        "score": -1.0,
+        "start": -1,
+        "end": -1,
+        "tokenizer": "NA_FAILED",
+        "model": "NA_FAILED",
+        "stage": "error",
+        "pages_fetched": 0,
+        "error": repr(error),
+    }
+    page = GooglePage(WebPage(""))
+    return create_query(question), page, Context(""), Answer(IDK), extra_data
+
+
+def answer_batch(
+    questions: List[Question],
+    contexts: List[Context],
+    cascade: Optional[Cascade] = None,
+    pool: Optional[InferencePool] = None,
+) -> List[Tuple[Answer, ExtraDataDict]]:
+    """Answers each question from its context with the fast path or, \
+        for all the rest together, one batch of the transformer, \
+        or one batch of each model of the `cascade` they escalate to, \
+        or spread over the workers of the `pool`."""
+    answers: List[Optional[Tuple[Answer, ExtraDataDict]]] = [
+        fast_answer(q, c) for q, c in zip(questions, contexts)
+    ]
+    rest = [i for i, a in enumerate(answers) if a is None]
+    if not rest:
+        return answers
+    if cascade:
+        batched = run_cascade_batch(
+            cascade,
+            lambda model, indices: cached_transformer_batch(
+                [(questions[rest[j]], [contexts[rest[j]]]) for j in indices],
+                model=model,
+            ),
+            len(rest),
+        )
+    elif pool is not None:
+        batched = pool.map([(questions[i], contexts[i]) for i in rest])
+    else:
+        batched = cached_transformer_batch(
+            [(questions[i], [contexts[i]]) for i in rest]
+        )
+    for i, (answer, extra_data) in zip(rest, batched):
+        extra_data["stage"] = "transformer"
+        answers[i] = (answer, extra_data)
+    return answers
+
+
+def answer_from_google_batch(
+    questions: List[Question],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    threshold: float = SNIPPET_SCORE_THRESHOLD,
+    limit: int = 10,
+    deadline_seconds: Optional[float] = DEFAULT_DEADLINE_SECONDS,
+    verbose: bool = False,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    dedupe_threshold: Optional[float] = DEFAULT_SIMILARITY,
+    cascade: Optional[Cascade] = None,
+    min_yield: float = DEFAULT_MIN_YIELD,
+    yields: Optional[HostYields] = None,
+    pool: Optional[InferencePool] = None,
+) -> List[GoogleBatchResult]:
+    """Answers every question like \
+        [`answer_from_google`](ntfp.html#ntfp.ntfp.answer_from_google).
+
+    Args:
+        questions: The [`Question`](ntfp_types.html#ntfp.ntfp_types.Question)s.
+        concurrency: How many questions fetch at the same time. (Default = 8).
+        threshold: The minimum `score` of a snippet answer. (Default = 0.5).
+        limit: The most result pages to fetch per question. (Default = 10).
+        deadline_seconds: The fetch budget of each question's snippets, \
+            and again of its result pages. (Default = 10.0).
+        verbose: printouts while running.
+        budget: The most context tokens the model reads per question, \
+            `None` for no limit. (Default = `DEFAULT_TOKEN_BUDGET`).
+        dedupe_threshold: Near-duplicate sentences are dropped before \
+            packing, `None` to keep them. (Default = `DEFAULT_SIMILARITY`).
+        cascade: The models to answer with, cheapest first, see \
+            [`run_cascade_batch`](cascade.html#ntfp.cascade.run_cascade_batch). \
+            (Default = only `DEFAULT_QA_MODEL`).
+        min_yield: The least score of a result page worth fetching, see \
+            [`fetch_ranked_contexts`](ntfp.html#ntfp.ntfp.fetch_ranked_contexts). \
+            (Default = `DEFAULT_MIN_YIELD`).
+        yields: The host yields to rank the result pages by.
+        pool: An optional [`InferencePool`](pool.html#ntfp.pool.InferencePool) \
+            whose workers answer each batch, instead of one model call.
+
+    Returns:
+        One (query, page, context, answer, extra_data) per question, in order. \
+            `extra_data["latency_s"]` is the time from the question's first \
+            fetch to its final answer.
+    """
+    model = answering_model(cascade=cascade, pool=pool)
+    started: Dict[int, float] = {}
+    snippets: Dict[int, Tuple[Query, GooglePage, GoogleResults, Context]] = {}
+    results: Dict[int, GoogleBatchResult] = {}
+
+    def fetch_snippets(i: int) -> Tuple[Query, GooglePage, GoogleResults, Context]:
+        started[i] = time.perf_counter()
+        query: Query = create_query(questions[i])
+        try:
+            page = get_google_page(query, Deadline(deadline_seconds))
+        except TimeoutError:
+            page = GooglePage(WebPage(""))
+        google_results = parse_google_results(page)
+        context = Context("\n".join(r.snippet for r in google_results if r.snippet))
+        return query, page, google_results, context
+
+    def fetch_page_context(i: int) -> Tuple[List[Tuple[URL, Context]], Context]:
+        _, _, google_results, _ = snippets[i]
+        fetched = fetch_ranked_contexts(
+            questions[i],
+            google_results,
+            limit=limit,
+            deadline=Deadline(deadline_seconds),
+            budget=budget,
+            min_yield=min_yield,
+            yields=yields,
+            model=model,
+        )
+        # the snippets already scored below threshold, the pages get the budget
+        return fetched, Context("\n".join(c for _, c in fetched if c))
+
+    def flush(ready: List[Tuple[str, int, object]]) -> List[int]:
+        """Answers the ready contexts; returns the questions needing pages."""
+        contexts = [
+            snippets[i][3] if kind == _SNIPPETS else data[1] for kind, i, data in ready
+        ]
+        preparations = [
+            prepare_context(questions[i], c, budget, dedupe_threshold, model=model)
+            for (_, i, _), c in zip(ready, contexts)
+        ]
+        contexts = [context for context, _, _ in preparations]
+        batch_questions = [questions[i] for _, i, _ in ready]
+        try:
+            answers = answer_batch(
+                batch_questions, contexts, cascade=cascade, pool=pool
+            )
+        except Exception:
+            # one at a time, so only the question that fails is lost
+            answers = [answer_one(q, c) for q, c in zip(batch_questions, contexts)]
+        need_pages = []
+        for (kind, i, data), preparation, answered in zip(ready, preparations, answers):
+            if isinstance(answered, Exception):
+                fail(i, kind, answered)
+                continue
+            answer, extra_data = answered
+            record_preparation(extra_data, preparation)
+            context = preparation[0]
+            query, page, google_results, _ = snippets[i]
+            if kind == _SNIPPETS:
+                extra_data["pages_fetched"] = 0
+                results[i] = (query, page, context, answer, extra_data)
+                if extra_data["score"] < threshold and google_results:
+                    need_pages.append(i)
+                    continue
+            else:
+                if extra_data["score"] >= results[i][4]["score"]:
+                    results[i] = (query, page, context, answer, extra_data)
+                candidates = min(len(google_results), limit)
+                record_fetching(results[i][4], data[0], candidates, results[i][3])
+            results[i][4]["latency_s"] = time.perf_counter() - started[i]
+        return need_pages
+
+    def answer_one(
+        question: Question, context: Context
+    ) -> Union[Tuple[Answer, ExtraDataDict], Exception]:
+        try:
+            return answer_batch([question], [context], cascade=cascade, pool=pool)[0]
+        except Exception as e:
+            return e
+
+    def fail(i: int, kind: str, error: Exception) -> None:
+        """Records the error; a failed page fetch keeps the snippet answer."""
+        if kind == _SNIPPETS or i not in results:
+            results[i] = failed_result(questions[i], error)
+        results[i][4]["error"] = repr(error)
+        results[i][4]["latency_s"] = time.perf_counter() - started[i]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(fetch_snippets, i): (_SNIPPETS, i)
+            for i in range(len(questions))
+        }
+        ready: List[Tuple[str, int, object]] = []
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, i = futures.pop(future)
+                if future.exception() is not None:
+                    fail(i, kind, future.exception())
+                    continue
+                if kind == _SNIPPETS:
+                    snippets[i] = future.result()
+                ready.append((kind, i, future.result()))
+            if ready and (len(ready) >= INFERENCE_BATCH_SIZE or not futures):
+                for i in flush(ready):
+                    futures[executor.submit(fetch_page_context, i)] = (_PAGES, i)
+                if verbose:
+                    print(f"answered {len(ready)}, {len(futures)} fetching...")
+                ready = []
+    return [results[i] for i in range(len(questions))]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""A disk cache of fetched pages and model answers, shared between processes.
+
+[//]: # (markdown comment # noqa)
+
+Values are pickled into one SQLite file in WAL mode, so any number of
+processes (e.g. an evaluation's process pool) can read and fill the same
+cache. Keys are namespaced, e.g. `"page"` for a
+[`WebPage`](ntfp_types.html#ntfp.ntfp_types.WebPage) by URL and `"answer"`
+for an (Answer, ExtraDataDict) by model, question and context.
+
+Example:
+    >>> cache = DiskCache()
+    >>> page = cache.get_or_compute("page", [url], lambda: get_page(url))
+    >>> cache.hits, cache.misses
+    (0, 1)
+
+Resources:
+    * [SQLite write-ahead logging][1]
+
+[1]: https://www.sqlite.org/wal.html
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+from typing_extensions import Final
+
+DEFAULT_CACHE: Final[str] = os.path.join(
+    os.path.expanduser("~"), ".cache", "ntfp", "cache.db"
+)
+
+SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+
+def cache_key(parts: Iterable[Any]) -> str:
+    """The sha256 hex digest of the `repr` of each part."""
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update(repr(part).encode("utf-8"))
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+class DiskCache:
+    """Pickled values in an SQLite file, by (namespace, key).
+
+    Args:
+        path: The cache file. (Default = `~/.cache/ntfp/cache.db`).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection must not cross a fork or a thread (sqlite3 refuses
+        # it), so each thread of each process opens its own
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            local.connection = sqlite3.connect(self.path, timeout=30)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.connection
+
+    def __getstate__(self):
+        return {"path": self.path, "hits": 0, "misses": 0}
+
+    def __setstate__(self, state) -> None:
+        self.__init__(state["path"])
+
+    def get(self, namespace: str, parts: Iterable[Any]) -> Optional[Any]:
+        """The cached value, or `None` on a miss."""
+        row = (
+            self._connect()
+            .execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, cache_key(parts)),
+            )
+            .fetchone()
+        )
+        return None if row is None else pickle.loads(row[0])
+
+    def put(self, namespace: str, parts: Iterable[Any], value: Any) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, cache_key(parts), pickle.dumps(value)),
+            )
+
+    def get_or_compute(
+        self, namespace: str, parts: Iterable[Any], compute: Callable[[], Any]
+    ) -> Any:
+        """The cached value, or else `compute()`, which is then cached."""
+        parts = list(parts)
+        value = self.get(namespace, parts)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self.put(namespace, parts, value)
+        return value
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""A cascade of question-answering models, cheapest first.
+
+[//]: # (markdown comment # noqa)
+
+Most questions are answered confidently by the small distilled model, and
+only the rest are worth the time of a larger one. A cascade runs its first
+model, and runs the next one only when the answer's `score` is below that
+stage's threshold. The last model run answers, even below its threshold.
+A question without any context is never escalated, no model can answer it.
+
+Every answer's [`ExtraDataDict`](ntfp_types.html#ntfp.ntfp_types.ExtraDataDict)
+tells which model answered (`qa_model`), how often the question was passed
+on (`escalations`) and the seconds of all the models it went through
+(`cascade_latency_s`).
+
+A cascade is written as comma separated `model:threshold` stages, e.g.
+`DEFAULT_CASCADE_SPEC`. The last stage needs no threshold.
+
+Example:
+    >>> cascade = parse_cascade(DEFAULT_CASCADE_SPEC)
+    >>> answer(question, context, cascade=cascade)
+    ('Foaad Khosmood', {'score': 0.74, ..., 'qa_model': \
+'bert-large-cased-whole-word-masking-finetuned-squad', 'escalations': 1, \
+'cascade_latency_s': 0.93})
+
+    $ python benchmark.py cascade --limit=100
+
+Resources:
+    * [Model cascades, e.g. FrugalGPT][1]
+
+[1]: https://arxiv.org/abs/2305.05176
+"""
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from typing_extensions import Final
+
+from ntfp.models import DEFAULT_QA_MODEL
+from ntfp.ntfp_types import Answer, ExtraDataDict
+
+LARGE_QA_MODEL: Final[str] = "bert-large-cased-whole-word-masking-finetuned-squad"
+"""About 5 times the parameters and latency of `DEFAULT_QA_MODEL`."""
+
+DEFAULT_ESCALATION_SCORE: Final[float] = 0.5
+"""The same score that is good enough to skip fetching the result pages."""
+
+DEFAULT_CASCADE_SPEC: Final[str] = (
+    f"{DEFAULT_QA_MODEL}:{DEFAULT_ESCALATION_SCORE},{LARGE_QA_MODEL}"
+)
+
+
+class CascadeStage(NamedTuple):
+    """One model of a cascade, and the `score` below which the next one runs."""
+
+    model: str
+    threshold: float
+
+
+Cascade = Tuple[CascadeStage, ...]
+
+ModelAnswer = Tuple[Answer, ExtraDataDict]
+
+
+def parse_cascade(spec: str) -> Cascade:
+    """The cascade of comma separated `model:threshold` stages.
+
+    Example:
+        >>> parse_cascade("distilbert-base-cased-distilled-squad:0.5,bert-base")
+        (CascadeStage(model='distilbert-base-cased-distilled-squad', \
+threshold=0.5), CascadeStage(model='bert-base', threshold=0.0))
+
+    Raises:
+        ValueError: When there is no stage or a threshold is not a number.
+    """
+    stages = []
+    for part in spec.split(","):
+        model, colon, threshold = part.strip().partition(":")
+        if model:
+            stages.append(CascadeStage(model, float(threshold) if colon else 0.0))
+    if not stages:
+        raise ValueError(f"no models in the cascade {spec!r}")
+    return tuple(stages)
+
+
+def record_cascade(
+    extra_data: ExtraDataDict, model: str, escalations: int, seconds: float
+) -> ExtraDataDict:
+    """Adds `qa_model`, `escalations` and `cascade_latency_s` to `extra_data`."""
+    extra_data["qa_model"] = model
+    extra_data["escalations"] = escalations
+    extra_data["cascade_latency_s"] = seconds
+    return extra_data
+
+
+def _escalate(extra_data: ExtraDataDict, threshold: float) -> bool:
+    # a start of -1 means there was no context to run the model on
+    return extra_data["score"] < threshold and extra_data["start"] >= 0
+
+
+def run_cascade(cascade: Cascade, run: Callable[[str], ModelAnswer]) -> ModelAnswer:
+    """Answers with each model of the cascade until one is confident enough.
+
+    Args:
+        cascade: The [`CascadeStage`](#ntfp.cascade.CascadeStage)s, cheapest first.
+        run: Answers the question with the given model, e.g. \
+            `lambda model: transformer(q, c, model=model)`.
+
+    Returns:
+        The answer of the last model run, with its extra data recorded \
+            by [`record_cascade`](#ntfp.cascade.record_cascade).
+    """  # noqa
+    seconds = 0.0
+    for escalations, (model, threshold) in enumerate(cascade):
+        start = time.perf_counter()
+        answer, extra_data = run(model)
+        seconds += time.perf_counter() - start
+        if not _escalate(extra_data, threshold):
+            break
+    return answer, record_cascade(extra_data, model, escalations, seconds)
+
+
+def run_cascade_batch(
+    cascade: Cascade, run_batch: Callable[[str, List[int]], List[ModelAnswer]], n: int
+) -> List[ModelAnswer]:
+    """Like [`run_cascade`](#ntfp.cascade.run_cascade) for `n` questions, \
+        each model answering all the questions escalated to it at once.
+
+    Args:
+        cascade: The [`CascadeStage`](#ntfp.cascade.CascadeStage)s, cheapest first.
+        run_batch: Answers the questions of the given indices, in order, \
+            with the given model.
+        n: The number of questions.
+
+    Returns:
+        One answer per question, in order. A batch's seconds are split \
+            evenly between its questions.
+    """  # noqa
+    results: List[Optional[ModelAnswer]] = [None] * n
+    seconds = [0.0] * n
+    pending = list(range(n))
+    for escalations, (model, threshold) in enumerate(cascade):
+        if not pending:
+            break
+        start = time.perf_counter()
+        answers = run_batch(model, pending)
+        share = (time.perf_counter() - start) / len(pending)
+        escalated = []
+        for i, (answer, extra_data) in zip(pending, answers):
+            seconds[i] += share
+            record_cascade(extra_data, model, escalations, seconds[i])
+            results[i] = (answer, extra_data)
+            if _escalate(extra_data, threshold):
+                escalated.append(i)
+        pending = escalated
+    return results  # type: ignore
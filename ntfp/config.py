@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""The tuned retrieval configuration the command line tools start from.
+
+[//]: # (markdown comment # noqa)
+
+`python evaluate.py --tune` searches the relevance thresholds, context
+limit, retriever, token budget and dedupe threshold against a gold set of
+questions and writes the cheapest configuration that is still accurate
+enough to `ntfp.json`. `clubs.py` and `evaluate.py` then use it wherever no option is
+given on the command line.
+
+The gold set asks about the clubs corpus, so only `clubs.py` uses the
+relevance thresholds, context limit and retriever. `main.py` answers from
+Google result pages, which the tuning never saw: it uses only the token
+budget and dedupe threshold, and keeps the `relevance_score` defaults.
+Another file can be chosen with the `NTFP_CONFIG` environment variable.
+
+Without a config file the hand-picked `DEFAULT_RETRIEVAL_CONFIG` is used.
+
+Example:
+    >>> load_config()
+    {'fuzz': 25, 'len': 2, 'limit': 25, 'retriever': 'snapshot', 'budget': 512, \
+'dedupe': 0.9}
+    >>> save_config({**load_config(), "fuzz": 15, "limit": 5})
+    'ntfp.json'
+"""
+import json
+import os
+from typing import Dict, Optional
+
+from typing_extensions import Final
+
+from ntfp.dedupe import DEFAULT_SIMILARITY
+from ntfp.ntfp_types import RetrievalConfigDict
+from ntfp.packing import DEFAULT_TOKEN_BUDGET
+
+DEFAULT_CONFIG: Final[str] = "ntfp.json"
+CONFIG_ENV: Final[str] = "NTFP_CONFIG"
+
+DEFAULT_RETRIEVAL_CONFIG: Final[RetrievalConfigDict] = {
+    "fuzz": 25,
+    "len": 2,
+    "limit": 25,
+    "retriever": "snapshot",
+    "budget": DEFAULT_TOKEN_BUDGET,
+    "dedupe": DEFAULT_SIMILARITY,
+}
+
+RETRIEVERS: Final = ("snapshot", "corpus")
+
+
+def config_path(path: Optional[str] = None) -> str:
+    """`path`, else `$NTFP_CONFIG`, else `"ntfp.json"`."""
+    return path or os.environ.get(CONFIG_ENV) or DEFAULT_CONFIG
+
+
+def load_config(path: Optional[str] = None) -> RetrievalConfigDict:
+    """The tuned configuration, with defaults for anything it lacks.
+
+    A missing file gives `DEFAULT_RETRIEVAL_CONFIG`.
+    """
+    config: RetrievalConfigDict = dict(DEFAULT_RETRIEVAL_CONFIG)  # type: ignore
+    try:
+        with open(config_path(path), "r") as f:
+            tuned = json.load(f)
+    except FileNotFoundError:
+        return config
+    for key in ("fuzz", "len", "limit", "budget"):
+        if key in tuned:
+            config[key] = int(tuned[key])  # type: ignore
+    if "dedupe" in tuned:
+        config["dedupe"] = float(tuned["dedupe"])
+    if tuned.get("retriever") in RETRIEVERS:
+        config["retriever"] = tuned["retriever"]
+    return config
+
+
+def save_config(
+    config: RetrievalConfigDict, path: Optional[str] = None, tuning: Dict = None
+) -> str:
+    """Writes the configuration, and optionally how it was tuned.
+
+    Args:
+        config: The [`RetrievalConfigDict`](ntfp_types.html#ntfp.ntfp_types.RetrievalConfigDict) to save.
+        path: (Default = `$NTFP_CONFIG` or `"ntfp.json"`).
+        tuning: e.g. the gold set, accuracy and latency it was chosen by. \
+            Kept under the `"tuning"` key for people, never loaded.
+
+    Returns:
+        The path written.
+    """  # noqa
+    path = config_path(path)
+    data = dict(config)
+    if tuning is not None:
+        data["tuning"] = tuning
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
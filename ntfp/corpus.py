@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""A memory-mapped text corpus split into segments by a separator.
+
+[//]: # (markdown comment # noqa)
+
+The corpus file (e.g. `clubs.txt`) is never read into memory as a whole.
+It is memory-mapped, and the byte offsets of its segments are found once
+and persisted next to it in an index file (e.g. `clubs.txt.idx`). A segment
+is only decoded into a `str` when it is asked for, so startup and memory
+stay flat as the corpus grows, and every process reading the same corpus
+shares the same OS page cache.
+
+The index is rebuilt whenever the corpus' size, modification time or the
+separator differs from the ones it was built for.
+
+Example:
+    >>> with Corpus("clubs.txt", sep="\\n\\n\\n") as corpus:
+    ...     len(corpus)
+    ...     corpus[0][:31]
+    393
+    'The type of CSAI is Academic.'
+
+Resources:
+    * [mmap][1]
+    * [array][2]
+
+[1]: https://docs.python.org/3/library/mmap.html
+[2]: https://docs.python.org/3/library/array.html
+"""
+import mmap
+import os
+import struct
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+from typing_extensions import Final
+
+INDEX_MAGIC: Final[bytes] = b"NTFPIDX1"
+INDEX_SUFFIX: Final[str] = ".idx"
+
+_HEADER = struct.Struct("<8sQQI")  # magic, size, mtime_ns, len(sep)
+
+
+def find_offsets(data, sep: bytes) -> array:
+    """The (start, end) byte offsets of every segment, flattened.
+
+    Matches `data.split(sep)`, including empty segments.
+
+    Raises:
+        ValueError: When `sep` is empty, like `bytes.split`.
+    """
+    if not sep:
+        raise ValueError("empty separator")
+    offsets = array("Q")
+    start = 0
+    while True:
+        end = data.find(sep, start)
+        if end < 0:
+            offsets.extend((start, len(data)))
+            return offsets
+        offsets.extend((start, end))
+        start = end + len(sep)
+
+
+class Corpus:
+    """The segments of a UTF-8 text file, backed by `mmap` and an offset index.
+
+    Args:
+        path: The corpus text file.
+        sep: The separator between segments. (Default = `"\\n\\n\\n"`).
+        index_path: Where to persist the offset index. \
+            (Default = `path` + `".idx"`).
+    """
+
+    def __init__(
+        self, path: str, sep: str = "\n\n\n", index_path: Optional[str] = None
+    ):
+        self.path = path
+        self.sep = sep
+        self.index_path = index_path or f"{path}{INDEX_SUFFIX}"
+        self._file = open(path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._key = (stat.st_size, stat.st_mtime_ns, sep.encode("utf-8"))
+        if stat.st_size > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""  # an empty file cannot be memory-mapped
+        self._offsets = self._load_index()
+        if self._offsets is None:
+            self._offsets = find_offsets(self._data, self._key[2])
+            self._save_index()
+
+    def _load_index(self) -> Optional[array]:
+        try:
+            with open(self.index_path, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return None
+        if len(raw) < _HEADER.size:
+            return None
+        magic, size, mtime_ns, sep_len = _HEADER.unpack_from(raw)
+        sep = raw[_HEADER.size : _HEADER.size + sep_len]
+        if (magic, (size, mtime_ns, sep)) != (INDEX_MAGIC, self._key):
+            return None
+        offsets = array("Q")
+        offsets.frombytes(raw[_HEADER.size + sep_len :])
+        return offsets
+
+    def _save_index(self) -> None:
+        size, mtime_ns, sep = self._key
+        partial_path = f"{self.index_path}.partial"
+        try:
+            with open(partial_path, "wb") as f:
+                f.write(_HEADER.pack(INDEX_MAGIC, size, mtime_ns, len(sep)))
+                f.write(sep)
+                self._offsets.tofile(f)
+            os.replace(partial_path, self.index_path)
+        except OSError:
+            pass  # ASSUME: a read-only directory only costs a rebuild next time
+
+    def __len__(self) -> int:
+        return len(self._offsets) // 2
+
+    def __getitem__(self, i: int) -> str:
+        """Decodes the `i`th segment."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("corpus segment index out of range")
+        start, end = self._offsets[2 * i], self._offsets[2 * i + 1]
+        return self._data[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        """Decodes the segments one at a time, in order."""
+        return (self[i] for i in range(len(self)))
+
+    def segments(self, indices: Iterable[int]) -> List[str]:
+        """Decodes only the segments at `indices`."""
+        return [self[i] for i in indices]
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self) -> "Corpus":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""End-to-end deadlines and hedged requests.
+
+[//]: # (markdown comment # noqa)
+
+A [`Deadline`](#ntfp.deadline.Deadline) is created once per question and
+handed down through every stage. Each stage takes a share of whatever time
+remains, so a slow stage eats into the budget of later ones instead of
+pushing the answer past the deadline.
+
+A slow fetch is _hedged_: when the first request has not come back after
+the host's recent 95th percentile latency, a duplicate request is sent and
+whichever response arrives first wins.
+
+Example:
+    >>> deadline = Deadline(5.0)
+    >>> page = hedged(get_page, url, host=urlparse(url).netloc, deadline=deadline)
+    >>> deadline.remaining()
+    4.61
+
+Resources:
+    * [The Tail at Scale][1]
+
+[1]: https://research.google/pubs/pub40801/
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from typing_extensions import Final
+
+DEFAULT_DEADLINE_SECONDS: Final[float] = 10.0
+"""The default end-to-end budget of one question."""
+
+DEFAULT_HEDGE_DELAY_SECONDS: Final[float] = 1.0
+"""The hedge delay of a host without enough recorded latencies."""
+
+HEDGE_PERCENTILE: Final[float] = 0.95
+MIN_SAMPLES: Final[int] = 10
+MAX_SAMPLES: Final[int] = 200
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """A point in time by which a question must be answered.
+
+    Args:
+        seconds: The budget from now. `None` means no deadline.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, never negative, or `None` without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def share(self, fraction: float) -> "Deadline":
+        """A child deadline holding `fraction` of the remaining time."""
+        remaining = self.remaining()
+        return Deadline(None if remaining is None else remaining * fraction)
+
+
+NO_DEADLINE: Final[Deadline] = Deadline(None)
+
+
+class LatencyTracker:
+    """Remembers recent latencies per host to pick each host's hedge delay."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=MAX_SAMPLES)
+        )
+
+    def record(self, host: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[host].append(seconds)
+
+    def percentile(self, host: str, p: float = HEDGE_PERCENTILE) -> Optional[float]:
+        """The `p` percentile latency of the host, or `None` if too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(host, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def hedge_delay(self, host: str) -> float:
+        delay = self.percentile(host)
+        return DEFAULT_HEDGE_DELAY_SECONDS if delay is None else delay
+
+
+latencies: Final[LatencyTracker] = LatencyTracker()
+"""The latencies of every fetch made by this process."""
+
+_executor: Final[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=32)
+
+
+def timed(host: str, f: Callable[[], T]) -> T:
+    """Calls `f` and records how long it took against `host`."""
+    start = time.monotonic()
+    result = f()
+    latencies.record(host, time.monotonic() - start)
+    return result
+
+
+def hedged(
+    f: Callable[..., T],
+    *args,
+    host: str,
+    deadline: Deadline = NO_DEADLINE,
+    **kwargs,
+) -> T:
+    """Calls `f(*args, **kwargs)`, and again if the first call is slow.
+
+    The duplicate is sent after the host's 95th percentile latency. The
+    first call to return wins; a call that raises only loses if the other
+    one succeeds.
+
+    Raises:
+        TimeoutError: neither call returned before the deadline.
+    """
+    primary = _executor.submit(timed, host, lambda: f(*args, **kwargs))
+    done, _ = wait([primary], timeout=_cap(latencies.hedge_delay(host), deadline))
+    if done:
+        return primary.result()
+    if deadline.expired():
+        raise TimeoutError(f"{host} did not respond before the deadline")
+    backup = _executor.submit(timed, host, lambda: f(*args, **kwargs))
+    pending = {primary, backup}
+    while pending:
+        done, pending = wait(
+            pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED
+        )
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            if not pending:
+                raise future.exception()
+    raise TimeoutError(f"{host} did not respond before the deadline")
+
+
+def _cap(seconds: float, deadline: Deadline) -> float:
+    remaining = deadline.remaining()
+    return seconds if remaining is None else min(seconds, remaining)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Drops near-duplicate sentences from a context before it is packed.
+
+[//]: # (markdown comment # noqa)
+
+`clubs.make_sents` writes most facts two or three ways ("X has the mail box
+89." / "The mail box of X is 89."), and Google result text repeats titles
+and snippets. The model gains nothing from reading a fact twice, so only
+the first of a group of near-duplicate sentences is kept.
+
+Sentences are compared by their 64-bit [SimHash][1] fingerprints, built
+from their [`terms`](store.html#ntfp.store.terms): stop words are left out,
+so rephrasings of the same fact usually share every term and fingerprint.
+Two sentences are near duplicates when the fraction of equal fingerprint
+bits is at least the similarity threshold. Lower thresholds drop more, but
+below about 0.85 different facts about the same club start to collide.
+
+Numbers are compared exactly instead: `terms` drops one-digit numbers, and a
+number is a small part of a fingerprint, yet "the mail box 7" and "the mail
+box 8" are different facts. Sentences whose numbers differ are never near
+duplicates.
+
+The fingerprints of a segment are computed once and cached, so a corpus
+segment retrieved question after question is never fingerprinted again.
+
+Example:
+    >>> context = Context("CSAI has the mail box 89. The mail box of CSAI is 89.")
+    >>> dedupe(context)
+    ('CSAI has the mail box 89.', Deduplication(sentences=2, dropped=1, chars=53, \
+removed_chars=28))
+
+Resources:
+    * [Similarity estimation techniques from rounding algorithms][1]
+
+[1]: https://www.cs.princeton.edu/courses/archive/spr04/cos598B/bib/CharikarEstim.pdf
+"""
+import hashlib
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, NamedTuple, Tuple
+
+from typing_extensions import Final
+
+from ntfp.ntfp_types import Context, ExtraDataDict
+from ntfp.profiling import stage
+from ntfp.store import split_sentences, terms
+
+FINGERPRINT_BITS: Final[int] = 64
+
+DEFAULT_SIMILARITY: Final[float] = 0.9
+"""At most 6 of 64 fingerprint bits may differ between near duplicates."""
+
+FINGERPRINT_CACHE_SIZE: Final[int] = 4096
+"""How many segments' fingerprints are kept, e.g. every club of `clubs.txt`."""
+
+_NUMBER = re.compile(r"\d+")
+
+
+class Deduplication(NamedTuple):
+    """How much [`dedupe`](#ntfp.dedupe.dedupe) shrank a context."""
+
+    sentences: int
+    dropped: int
+    chars: int
+    removed_chars: int
+
+
+@lru_cache(maxsize=None)
+def _term_hash(term: str) -> int:
+    digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def simhash(features: Iterable[str]) -> int:
+    """The SimHash of the features, each weighted by how often it occurs."""
+    weights = [0] * FINGERPRINT_BITS
+    for feature, count in Counter(features).items():
+        h = _term_hash(feature)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def similarity(a: int, b: int) -> float:
+    """The fraction of equal bits of two fingerprints."""
+    return 1.0 - bin(a ^ b).count("1") / FINGERPRINT_BITS
+
+
+def numbers(sentence: str) -> FrozenSet[str]:
+    """The digit runs of a sentence, e.g. `{"805", "756", "1111"}`."""
+    return frozenset(_NUMBER.findall(sentence))
+
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def segment_fingerprints(
+    segment: str,
+) -> Tuple[Tuple[str, int, FrozenSet[str]], ...]:
+    """Each sentence of a segment with its fingerprint and its numbers."""
+    return tuple(
+        (sent, simhash(terms(sent)), numbers(sent)) for sent in split_sentences(segment)
+    )
+
+
+def dedupe(
+    context: Context, sep: str = "\n", threshold: float = DEFAULT_SIMILARITY
+) -> Tuple[Context, Deduplication]:
+    """Keeps only the first of each group of near-duplicate sentences.
+
+    Args:
+        context: A [`Context`](ntfp_types.html#ntfp.ntfp_types.Context) of \
+            `sep` separated segments, e.g. clubs or lines.
+        sep: The separator between segments. (Default = `"\\n"`).
+        threshold: The least [`similarity`](#ntfp.dedupe.similarity) of \
+            near duplicates. (Default = 0.9).
+
+    Sentences with different [`numbers`](#ntfp.dedupe.numbers) are always kept.
+
+    Returns:
+        The context without the near duplicates, its segments still `sep` \
+            separated and in order, and the [`Deduplication`](#ntfp.dedupe.Deduplication).
+    """  # noqa
+    if not context:
+        return context, Deduplication(0, 0, 0, 0)
+    max_distance = int((1.0 - threshold) * FINGERPRINT_BITS)
+    kept: List[Tuple[int, FrozenSet[str]]] = []
+    seen = set()
+    segments: List[str] = []
+    sentences = dropped = 0
+    with stage("dedupe"):
+        for segment in context.split(sep):
+            kept_sentences = []
+            for sent, fingerprint, sent_numbers in segment_fingerprints(segment):
+                sentences += 1
+                duplicate = (fingerprint, sent_numbers) in seen or any(
+                    sent_numbers == other_numbers
+                    and bin(fingerprint ^ other).count("1") <= max_distance
+                    for other, other_numbers in kept
+                )
+                if duplicate:
+                    dropped += 1
+                    continue
+                seen.add((fingerprint, sent_numbers))
+                kept.append((fingerprint, sent_numbers))
+                kept_sentences.append(sent)
+            if kept_sentences:
+                segments.append(" ".join(kept_sentences))
+    deduped = Context(sep.join(segments))
+    stats = Deduplication(sentences, dropped, len(context), len(context) - len(deduped))
+    return deduped, stats
+
+
+def record_dedupe(extra_data: ExtraDataDict, stats: Deduplication) -> ExtraDataDict:
+    """Adds `duplicates_dropped` and `dedupe_shrink` to `extra_data`."""
+    extra_data["duplicates_dropped"] = stats.dropped
+    extra_data["dedupe_shrink"] = (
+        stats.removed_chars / stats.chars if stats.chars else 0.0
+    )
+    return extra_data
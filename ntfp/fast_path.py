@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""A cheap extractive stage that runs before \
+    [`transformer`](ntfp.html#ntfp.ntfp.transformer).
+
+[//]: # (markdown comment # noqa)
+
+Many questions ask for an email, a phone number, a mail box or an advisor,
+and those answers sit verbatim in the [`Context`](ntfp_types.html#ntfp.ntfp_types.Context).
+So the question's intent is classified with a few keywords and then
+high-precision extractors are tried on the context:
+
+* _field_ extractors match the sentence templates of `clubs.py` \
+    (e.g. `"The mail box of [club_name] is [box]."`) and only answer \
+    when the question names the club of the matched sentence.
+* _pattern_ extractors (email and phone regexes) only answer when the \
+    context holds exactly one distinct match.
+
+When neither is confident, `None` is returned and the caller falls back to
+the transformer.
+
+Example:
+    >>> context = Context("CSAI has the mail box 89. The mail box of CSAI is 89.")
+    >>> fast_answer(Question("what is the mail box of CSAI?"), context)
+    ('89', {'score': 1.0, 'start': 22, 'end': 24, ..., 'stage': 'fast_path:box'})
+"""
+import re
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from fuzzywuzzy import fuzz
+from typing_extensions import Final
+
+from ntfp.ntfp_types import Answer, Context, ExtraDataDict, Question
+
+EMAIL: Final[str] = "email"
+PHONE: Final[str] = "phone"
+BOX: Final[str] = "box"
+ADVISOR: Final[str] = "advisor"
+
+INTENT_KEYWORDS: Final[Dict[str, Pattern]] = {
+    BOX: re.compile(r"\bmail ?box\b|\bbox\b", re.IGNORECASE),
+    EMAIL: re.compile(r"\be-?mail", re.IGNORECASE),
+    PHONE: re.compile(r"\bphone\b|\bcall\b|\btelephone\b", re.IGNORECASE),
+    ADVISOR: re.compile(r"\badvis[eo]r?s?\b|\badviser\b", re.IGNORECASE),
+}
+"""Checked in order; the first intent whose keywords appear wins."""
+
+_SENTENCE_START = r"(?:^|(?<=[.!?] ))"
+
+FIELD_PATTERNS: Final[Dict[str, List[Pattern]]] = {
+    BOX: [
+        re.compile(_SENTENCE_START + r"(?P<subject>[^.]+?) has the mail box (?P<answer>\w+)\.", re.MULTILINE),  # noqa
+        re.compile(r"The mail box of (?P<subject>[^.]+?) is (?P<answer>\w+)\."),
+    ],
+    PHONE: [
+        re.compile(r"The phone number for (?P<subject>[^.]+?) is (?P<answer>[\d.]+?)\.?(?= |$)", re.MULTILINE),  # noqa
+        re.compile(r"You can call (?P<subject>[^.]+?) by the phone number (?P<answer>[\d.]+?)\.?(?= |$)", re.MULTILINE),  # noqa
+    ],
+    ADVISOR: [
+        re.compile(r"Professor (?P<answer>[^.]+?) is the advisor for (?P<subject>[^.]+?)\."),  # noqa
+        re.compile(r"Professor (?P<answer>[^.]+?) advises (?P<subject>[^.]+?)\."),
+        re.compile(_SENTENCE_START + r"(?P<subject>[^.]+?) has Professor (?P<answer>[^.]+?) as their advisor\.", re.MULTILINE),  # noqa
+    ],
+    EMAIL: [
+        re.compile(r"You can contact (?P<subject>[^.]+?) by emailing .+? at (?P<answer>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"),  # noqa
+    ],
+}
+"""Sentence templates written by `clubs.make_sents`, one group per intent."""
+
+PATTERNS: Final[Dict[str, Pattern]] = {
+    EMAIL: re.compile(r"[\w.+-]+@ ?[\w-]+(?:\.[\w-]+)*\.[a-zA-Z]{2,}"),
+    PHONE: re.compile(r"\(?\b\d{3}\)?[ .-]?\d{3}[ .-]\d{4}\b"),
+}
+"""Free-text patterns, e.g. for Google search result text."""
+
+FIELD_SCORE: Final[float] = 1.0
+PATTERN_SCORE: Final[float] = 0.9
+
+SUBJECT_MATCH_THRESHOLD: Final[int] = 90
+"""The minimum `fuzz.partial_ratio` of a matched subject to the question."""
+
+MISSING_VALUES: Final[frozenset] = frozenset({"", "nan", "na", "none", "n/a"})
+
+
+def classify_intent(question: Question) -> Optional[str]:
+    """Returns `"box"`, `"email"`, `"phone"`, `"advisor"` or `None`.
+
+    Example:
+        >>> classify_intent(Question("who is the advisor for CSAI?"))
+        'advisor'
+    """
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if keywords.search(question):
+            return intent
+    return None
+
+
+def _extra_data(intent: str, score: float, start: int, end: int) -> ExtraDataDict:
+    return {
+        "score": score,
+        "start": start,
+        "end": end,
+        "tokenizer": "NA_FAST_PATH",
+        "model": "NA_FAST_PATH",
+        "stage": f"fast_path:{intent}",
+    }
+
+
+def field_answer(
+    intent: str, question: Question, context: Context
+) -> Optional[Tuple[Answer, ExtraDataDict]]:
+    """Answers from a template sentence whose subject the question names."""
+    found: Dict[str, Tuple[int, int]] = {}
+    for pattern in FIELD_PATTERNS.get(intent, []):
+        for match in pattern.finditer(context):
+            answer = match.group("answer").rstrip(".")
+            if answer.lower() in MISSING_VALUES:
+                continue
+            subject = match.group("subject")
+            similarity = fuzz.partial_ratio(subject.lower(), question.lower())
+            if similarity >= SUBJECT_MATCH_THRESHOLD:
+                start = match.start("answer")
+                found.setdefault(answer, (start, start + len(answer)))
+    if len(found) != 1:
+        return None  # ASSUME: no match or disagreeing matches means unsure
+    ((answer, (start, end)),) = found.items()
+    return Answer(answer), _extra_data(intent, FIELD_SCORE, start, end)
+
+
+def pattern_answer(
+    intent: str, context: Context
+) -> Optional[Tuple[Answer, ExtraDataDict]]:
+    """Answers with the only distinct email or phone number in the context."""
+    pattern = PATTERNS.get(intent)
+    if pattern is None:
+        return None
+    matches = list(pattern.finditer(context))
+    texts = [m.group(0) for m in matches]
+    if intent == EMAIL:
+        # SERP text sometimes breaks an email after the "@", e.g. "foaad@ calpoly.edu"
+        texts = [text.replace(" ", "") for text in texts]
+    if len(set(texts)) != 1:
+        return None
+    match = matches[0]
+    extra_data = _extra_data(intent, PATTERN_SCORE, match.start(), match.end())
+    return Answer(texts[0]), extra_data
+
+
+def fast_answer(
+    question: Question, context: Context
+) -> Optional[Tuple[Answer, ExtraDataDict]]:
+    """Tries the field extractors, then the pattern extractors, for the \
+        question's intent.
+
+    Returns:
+        A confident (Answer, ExtraDataDict) whose `stage` names the extractor, \
+            or `None` when the transformer should answer instead.
+    """
+    intent = classify_intent(question)
+    if intent is None or len(context) <= 0:
+        return None
+    return field_answer(intent, question, context) or pattern_answer(
+        intent, context
+    )
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""A warm fork-server that `main.py` and `clubs.py` start inside.
+
+[//]: # (markdown comment # noqa)
+
+Most of a command's time goes to importing torch and transformers, loading
+spaCy and building the QA pipeline. [`serve`](#ntfp.forkserver.serve) does
+all of that once and then waits on a Unix socket. Each command calls
+[`run_in_server`](#ntfp.forkserver.run_in_server) before its own imports:
+it hands its stdin, stdout and stderr to the server (`SCM_RIGHTS`), and a
+forked, already warm child runs the command with them, so prompts and
+output go straight to the terminal or pipe. The command then exits with the
+child's exit status. Ctrl-C is passed on to the child.
+
+Without a server, or with `NTFP_FORKSERVER=0`, the command just runs
+in-process as before. The server refuses, and stops, once a module it
+preloaded has changed on disk, so edited code is never served stale.
+
+Only `SCRIPTS` next to the server's own package are run, and only for
+connections from the server's own user. Standard library only, so that
+checking for a server costs the command nothing.
+
+Example:
+    $ python forkserver.py &
+    serving on ~/.cache/ntfp/forkserver.sock
+    $ python clubs.py --example     # warm
+    $ python forkserver.py --stop
+    $ python clubs.py --example     # in-process again
+
+Resources:
+    * [multiprocessing's forkserver start method][1]
+
+[1]: https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+"""
+import array
+import atexit
+import json
+import os
+import runpy
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from typing_extensions import Final
+
+FORKSERVER_ENV: Final[str] = "NTFP_FORKSERVER"
+"""The socket path, or `"0"` to never use a server."""
+
+DEFAULT_SOCKET: Final[str] = os.path.join(
+    os.path.expanduser("~"), ".cache", "ntfp", "forkserver.sock"
+)
+
+ROOT: Final[str] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+"""The directory of the command line scripts the server runs."""
+
+SCRIPTS: Final = ("main.py", "clubs.py")
+
+MAX_REQUEST: Final[int] = 1 << 20
+"""The most bytes of one request, which carries the environment."""
+
+STDIO_FDS: Final = (0, 1, 2)
+
+_serving = False
+"""True inside a server child, where commands must run in-process."""
+
+
+def socket_path(path: Optional[str] = None) -> str:
+    """`path`, else `$NTFP_FORKSERVER`, else `~/.cache/ntfp/forkserver.sock`."""
+    return path or os.environ.get(FORKSERVER_ENV) or DEFAULT_SOCKET
+
+
+def _send(conn: socket.socket, message: Dict, fds: Tuple[int, ...] = ()) -> None:
+    data = json.dumps(message).encode("utf-8") + b"\n"
+    if fds:
+        rights = array.array("i", fds).tobytes()
+        conn.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, rights)])
+    else:
+        conn.sendall(data)
+
+
+def _receive(conn: socket.socket) -> Tuple[Optional[Dict], List[int]]:
+    """One JSON line and any file descriptors sent with it."""
+    fds = array.array("i")
+    space = socket.CMSG_LEN(len(STDIO_FDS) * fds.itemsize)
+    data, ancdata, _, _ = conn.recvmsg(MAX_REQUEST, space)
+    for level, kind, rights in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(rights[: len(rights) - len(rights) % fds.itemsize])
+    while data and not data.endswith(b"\n") and len(data) < MAX_REQUEST:
+        more = conn.recv(MAX_REQUEST)
+        if not more:
+            break
+        data += more
+    if not data.endswith(b"\n"):
+        return None, list(fds)
+    return json.loads(data.decode("utf-8")), list(fds)
+
+
+def _connect(path: Optional[str] = None) -> Optional[socket.socket]:
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path(path))
+    except OSError:
+        conn.close()
+        return None
+    return conn
+
+
+def request(command: str, path: Optional[str] = None) -> Optional[Dict]:
+    """Sends `"status"` or `"stop"` to the server; `None` when none is running."""
+    conn = _connect(path)
+    if conn is None:
+        return None
+    with conn:
+        _send(conn, {"command": command})
+        reply, _ = _receive(conn)
+    return reply
+
+
+def run_in_server(path: Optional[str] = None) -> None:
+    """Runs this command in a warm server child and exits with its status.
+
+    Returns without doing anything when no server is running, or when it
+    refuses the command, so that the caller goes on in-process.
+    """
+    if _serving or os.environ.get(FORKSERVER_ENV) == "0":
+        return
+    conn = _connect(path)
+    if conn is None:
+        return
+    argv = [os.path.abspath(sys.argv[0])] + sys.argv[1:]
+    message = {"command": "run", "argv": argv, "cwd": os.getcwd()}
+    message["env"] = dict(os.environ)
+    try:
+        _send(conn, message, STDIO_FDS)
+        reply, _ = _receive(conn)
+    except OSError:
+        reply = None
+    if reply is None or "pid" not in reply:
+        conn.close()
+        return
+    pid = reply["pid"]
+    while True:
+        try:
+            reply, _ = _receive(conn)
+            break
+        except KeyboardInterrupt:
+            # the terminal only interrupts this process, not the server child
+            os.kill(pid, signal.SIGINT)
+    conn.close()
+    if reply is None:
+        print("fork-server child died", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(reply["status"])
+
+
+def preload(quantize: bool = False) -> None:
+    """Imports and loads everything a command would, once."""
+    from ntfp.models import load_pipeline, load_spacy
+
+    load_spacy()
+    load_pipeline(quantize=quantize)
+    sys.path.insert(0, ROOT)
+    for script in SCRIPTS:
+        __import__(script[: -len(".py")])
+
+
+def _module_mtimes() -> Dict[str, float]:
+    """The mtime of every loaded module file of this repository."""
+    scripts = {os.path.join(ROOT, s) for s in SCRIPTS}
+    mtimes = {}
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path and path.startswith(ROOT + os.sep) and path not in scripts:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = -1.0
+    return mtimes
+
+
+def _refusal(conn: socket.socket, message: Dict) -> Optional[str]:
+    """Why the server must not run a request, if it must not."""
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12)
+        if struct.unpack("3i", creds)[1] != os.getuid():
+            return "not the server's user"
+    argv = message.get("argv") or [""]
+    if argv[0] not in [os.path.join(ROOT, s) for s in SCRIPTS]:
+        return f"only runs {', '.join(SCRIPTS)} in {ROOT}"
+    return None
+
+
+def _exit_status(code) -> int:
+    """The process exit status of `sys.exit(code)`."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _reopen_stdio() -> None:
+    colorama = sys.modules.get("colorama")
+    if colorama is not None:
+        colorama.deinit()
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1 if os.isatty(1) else -1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    if colorama is not None:
+        # e.g. strips colors again when stdout is not a terminal
+        colorama.init()
+
+
+def _run_child(conn: socket.socket, message: Dict, fds: List[int]) -> None:
+    """Runs the command in this forked child, then exits. Never returns."""
+    global _serving
+    _serving = True
+    status = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        # a new session has no controlling terminal, so reading the
+        # client's terminal is never stopped by job control
+        os.setsid()
+        for target, fd in zip(STDIO_FDS, fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        _reopen_stdio()
+        os.chdir(message["cwd"])
+        os.environ.clear()
+        os.environ.update(message["env"])
+        sys.argv = list(message["argv"])
+        sys.path[0] = os.path.dirname(sys.argv[0])
+        _send(conn, {"pid": os.getpid()})
+        # only the command's own exit handlers, e.g. --profile, run here
+        atexit._clear()
+        try:
+            runpy.run_path(sys.argv[0], run_name="__main__")
+            status = 0
+        except SystemExit as e:
+            status = _exit_status(e.code)
+        except BaseException:
+            traceback.print_exc()
+        atexit._run_exitfuncs()
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except OSError:  # e.g. a closed pipe, as `| head` leaves it
+                pass
+        _send(conn, {"status": status})
+    finally:
+        os._exit(status)
+
+
+def serve(
+    path: Optional[str] = None, quantize: bool = False, verbose: bool = False
+) -> None:
+    """Preloads, then forks a warm child for each command until stopped.
+
+    Args:
+        path: The socket. (Default = `$NTFP_FORKSERVER` or \
+            `~/.cache/ntfp/forkserver.sock`).
+        quantize: Also preload the int8 quantized model.
+        verbose: printouts while running.
+    """
+    path = socket_path(path)
+    if request("status", path) is not None:
+        raise RuntimeError(f"a fork-server is already serving on {path}")
+    started = time.perf_counter()
+    preload(quantize=quantize)
+    loaded = _module_mtimes()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)  # only this user may connect, from the start
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(16)
+    # children are reaped by the kernel
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    seconds = time.perf_counter() - started
+    print(f"serving on {path}, preloaded in {seconds:.1f}s", file=sys.stderr)
+    served = 0
+    try:
+        while True:
+            conn, _ = listener.accept()
+            with conn:
+                message, fds = _receive(conn)
+                command = (message or {}).get("command")
+                if command == "status":
+                    _send(conn, {"pid": os.getpid(), "served": served})
+                    continue
+                if command == "stop":
+                    _send(conn, {"stopped": os.getpid()})
+                    return
+                refusal = "unknown command"
+                if command == "run":
+                    refusal = _refusal(conn, message)
+                stale = refusal is None and _module_mtimes() != loaded
+                if refusal or stale:
+                    for fd in fds:
+                        os.close(fd)
+                    _send(conn, {"error": refusal or "stale"})
+                    if stale:
+                        print("preloaded code changed, stopping", file=sys.stderr)
+                        return
+                    continue
+                if os.fork() == 0:
+                    listener.close()
+                    _run_child(conn, message, fds)
+                for fd in fds:
+                    os.close(fd)
+                served += 1
+                if verbose:
+                    print(f"ran {' '.join(message['argv'])}", file=sys.stderr)
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Offline ingestion of [`URL`](ntfp_types.html#ntfp.ntfp_types.URL)s, HTML \
+    files and plain-text [`UserContext`](ntfp_types.html#ntfp.ntfp_types.UserContext) \
+    documents into the [`store`](store.html).
+
+[//]: # (markdown comment # noqa)
+
+Every source is fetched, parsed, normalized, sentence-segmented and chunked
+in a process pool; the chunks are then deduplicated and indexed in the store.
+A PDF's text is extracted inside the pool worker itself, and a source that is
+ingested again replaces its chunks that changed.
+
+Example:
+    >>> from ntfp.ingest import ingest
+    >>> ingest(["https://cpe.calpoly.edu/faculty/foaad/", "clubs.txt"])
+    ... 812
+    >>> from ntfp.ntfp import get_context
+    >>> _, _, context = get_context("what is foaad email?", use_google=False)
+
+Resources:
+    * [concurrent.futures.ProcessPoolExecutor][1]
+
+[1]: https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, List, Optional, Tuple
+
+from ntfp.ntfp import extract_webpage_context, get_page
+from ntfp.ntfp_types import URL, Context, UserContext, WebPage
+from ntfp.pdf import get_pdf_page
+from ntfp.store import (
+    DEFAULT_STORE,
+    add_chunks,
+    chunk_sentences,
+    connect,
+    normalize_text,
+    split_sentences,
+)
+
+
+def source_kind(source: str) -> str:
+    """Classifies a source as `"url"`, `"html"` or `"text"`.
+
+    Example:
+        >>> source_kind("https://calpoly.edu"), source_kind("a.htm")
+        ('url', 'html')
+        >>> source_kind("clubs.txt")
+        'text'
+    """
+    if source.startswith(("http://", "https://")):
+        return "url"
+    if source.lower().endswith((".html", ".htm")):
+        return "html"
+    return "text"
+
+
+def read_source(source: str) -> Context:
+    """Fetches or reads a single source and returns its text content."""
+    kind = source_kind(source)
+    if kind == "url" and source.endswith("pdf"):
+        # an ingest worker is daemonic and cannot start get_page's PDF pool
+        return extract_webpage_context(get_pdf_page(URL(source), in_process=True))
+    if kind == "url":
+        return extract_webpage_context(get_page(URL(source)))
+    with open(source, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if kind == "html":
+        return extract_webpage_context(WebPage(text))
+    return UserContext(Context(text))
+
+
+def extract_chunks(source: str) -> Tuple[str, str, List[str]]:
+    """Runs every extraction stage for one source.
+
+    This is the unit of work sent to each process in the pool.
+
+    Returns:
+        A tuple of (source, kind, chunks).
+    """
+    text = normalize_text(read_source(source))
+    return source, source_kind(source), chunk_sentences(split_sentences(text))
+
+
+def ingest(
+    sources: Iterable[str],
+    store: str = DEFAULT_STORE,
+    workers: Optional[int] = None,
+    verbose: bool = False,
+) -> int:
+    """Extracts every source in a process pool and writes the chunks to the store.
+
+    Args:
+        sources: URLs, paths to HTML files or paths to plain-text files.
+        store: The path of the store. (Default = `"contexts.db"`).
+        workers: The size of the process pool. (Default = number of CPUs).
+        verbose: Print one line per ingested source.
+
+    Returns:
+        The number of new chunks written to the store.
+
+    A source that fails to fetch or parse is skipped, not fatal.
+    """
+    connection = connect(store)
+    added = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(extract_chunks, s): s for s in sources}
+            for future in as_completed(futures):
+                try:
+                    source, kind, chunks = future.result()
+                except Exception as e:
+                    if verbose:
+                        print(f"{futures[future]}: skipped ({e!r})")
+                    continue
+                new = add_chunks(connection, source, kind, chunks)
+                added += new
+                if verbose:
+                    print(f"{source}: {new} new of {len(chunks)} chunks")
+    finally:
+        connection.close()
+    return added
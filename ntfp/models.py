@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Loading of the question-answering models used by \
+    [`transformer`](ntfp.html#ntfp.ntfp.transformer).
+
+[//]: # (markdown comment # noqa)
+
+Loading a model is expensive, so each (model, mode) pipeline and each
+spaCy model is built once per process and reused by every later question,
+or once in the [`forkserver`](forkserver.html) for every command.
+
+The opt-in `"int8"` mode applies [dynamic quantization][1] to every
+`torch.nn.Linear` layer of the model. The quantized weights are cached on
+disk so only the first load pays for the quantization.
+
+Example:
+    >>> nlp = load_pipeline(quantize=True)
+    >>> nlp({"question": "What is 42?", "context": "42 is the answer."})
+    {'score': 0.9, 'start': 0, 'end': 2, 'answer': '42'}
+
+Resources:
+    * [Dynamic Quantization on BERT][2]
+
+[1]: https://pytorch.org/docs/stable/quantization.html#dynamic-quantization
+[2]: https://pytorch.org/tutorials/intermediate/dynamic_quantization_bert_tutorial.html
+"""
+import os
+import threading
+from functools import lru_cache
+from typing import Dict
+
+import spacy
+import torch
+from transformers import (
+    AutoConfig,
+    AutoModelForQuestionAnswering,
+    AutoTokenizer,
+    PreTrainedTokenizer,
+    pipeline,
+)
+from transformers.pipelines import QuestionAnsweringPipeline
+from typing_extensions import Final
+
+from ntfp.profiling import stage
+
+DEFAULT_QA_MODEL: Final[str] = "distilbert-base-cased-distilled-squad"
+"""The same model `pipeline("question-answering")` would pick by default."""
+
+DEFAULT_SPACY_MODEL: Final[str] = "en_core_web_sm"
+
+MODEL_CACHE_DIR: Final[str] = os.path.join(os.path.expanduser("~"), ".cache", "ntfp")
+"""Where quantized weights are cached."""
+
+FLOAT32: Final[str] = "float32"
+INT8: Final[str] = "int8"
+
+_tokenizers: Dict[str, PreTrainedTokenizer] = {}
+_tokenizer_lock = threading.Lock()
+
+
+def mode_name(quantize: bool) -> str:
+    """The inference mode reported in \
+        [`ExtraDataDict`](ntfp_types.html#ntfp.ntfp_types.ExtraDataDict)."""
+    return INT8 if quantize else FLOAT32
+
+
+def quantize_model(model: torch.nn.Module) -> torch.nn.Module:
+    """Returns a copy of the model with int8 dynamically quantized linear layers."""
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def quantized_weights_path(model: str, cache_dir: str = MODEL_CACHE_DIR) -> str:
+    """The cache file of a quantized model, versioned by torch release."""
+    name = model.replace("/", "--")
+    return os.path.join(cache_dir, f"{name}.{INT8}.torch-{torch.__version__}.pt")
+
+
+def load_quantized_model(
+    model: str, cache_dir: str = MODEL_CACHE_DIR
+) -> torch.nn.Module:
+    """Loads the int8 model from the disk cache, quantizing it on a cache miss."""
+    path = quantized_weights_path(model, cache_dir)
+    if os.path.exists(path):
+        # build the architecture without reading the float32 weights at all
+        config = AutoConfig.from_pretrained(model)
+        quantized = quantize_model(AutoModelForQuestionAnswering.from_config(config))
+        quantized.load_state_dict(torch.load(path))
+        return quantized.eval()
+    quantized = quantize_model(AutoModelForQuestionAnswering.from_pretrained(model))
+    os.makedirs(cache_dir, exist_ok=True)
+    partial_path = f"{path}.partial"
+    torch.save(quantized.state_dict(), partial_path)
+    os.replace(partial_path, path)  # never leave a half-written cache file
+    return quantized.eval()
+
+
+@lru_cache(maxsize=None)
+def load_spacy(name: str = DEFAULT_SPACY_MODEL):
+    """`spacy.load(name)`, once per process."""
+    with stage("spacy"):
+        return spacy.load(name)
+
+
+def load_tokenizer(model: str = DEFAULT_QA_MODEL) -> PreTrainedTokenizer:
+    """The model's tokenizer alone, without its weights, once per process.
+
+    Safe to call from many threads at once: the first call loads it and the
+    others wait for it instead of loading it again.
+    """
+    tokenizer = _tokenizers.get(model)
+    if tokenizer is None:
+        with _tokenizer_lock:
+            tokenizer = _tokenizers.get(model)
+            if tokenizer is None:
+                tokenizer = AutoTokenizer.from_pretrained(model)
+                _tokenizers[model] = tokenizer
+    return tokenizer
+
+
+@lru_cache(maxsize=None)
+def load_pipeline(
+    model: str = DEFAULT_QA_MODEL, quantize: bool = False
+) -> QuestionAnsweringPipeline:
+    """Builds the question-answering pipeline once per (model, mode).
+
+    Args:
+        model: A model name from the HuggingFace model hub.
+        quantize: Use int8 dynamically quantized weights. (Default = False).
+
+    Returns:
+        A `QuestionAnsweringPipeline` that runs on the CPU.
+    """
+    # FIXME: this needs an internet connection the first time!
+    with stage("model_load"):
+        if not quantize:
+            return pipeline("question-answering", model=model, tokenizer=model)
+        return pipeline(
+            "question-answering",
+            model=load_quantized_model(model),
+            tokenizer=AutoTokenizer.from_pretrained(model),
+        )
@@ -42,15 +42,27 @@ Resources:
 
 [__pdoc__override]: https://pdoc3.github.io/pdoc/doc/pdoc/#overriding-docstrings-with-__pdoc__
 """
-from typing import Optional, get_type_hints
+
+import heapq
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Optional, get_type_hints
+from urllib.parse import parse_qs, urlparse
 from bs4 import BeautifulSoup
 import googlesearch
 from fuzzywuzzy import fuzz
-from requests import get
+from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.models import Response
-from transformers import pipeline
 from typing_extensions import Final
-from typing import List, Callable, Iterator, Tuple
+from typing import List, Iterator, Tuple
 from ntfp.ntfp_types import (
     IDK,
     IDK_TYPE,
@@ -59,7 +71,9 @@ from ntfp.ntfp_types import (
     WebPageContext,
     GooglePage,
     GoogleResultURL,
-    GoogleResultURLIterator,
+    GoogleContext,
+    GoogleResult,
+    GoogleResults,
     Query,
     Question,
     SanitizedQuery,
@@ -67,8 +81,48 @@ from ntfp.ntfp_types import (
     URL,
     ExtraDataDict,
 )
+from ntfp.cache import DiskCache
+from ntfp.cascade import Cascade, run_cascade
+from ntfp.deadline import DEFAULT_DEADLINE_SECONDS, NO_DEADLINE, Deadline, hedged
+from ntfp.fast_path import fast_answer
+from ntfp.models import DEFAULT_QA_MODEL, load_pipeline, mode_name
+from ntfp.dedupe import DEFAULT_SIMILARITY, Deduplication, dedupe, record_dedupe
+from ntfp.packing import (
+    DEFAULT_TOKEN_BUDGET,
+    PackedContext,
+    count_tokens,
+    pack,
+    record_packing,
+    relevance_to,
+)
+from ntfp.pdf import get_pdf_page
+from ntfp.pool import InferencePool
+from ntfp.profiling import stage
+from ntfp.ranking import DEFAULT_MIN_YIELD, HostYields, page_yields, rank_results
+from ntfp.store import DEFAULT_STORE, lookup_context
+from ntfp.token_cache import TokenCache
 import spacy
 
+DEFAULT_TIMEOUT_SECONDS: Final[float] = 10.0
+"""The HTTP timeout of a fetch made without a deadline."""
+
+GOOGLE_SHARE: Final[float] = 0.3
+"""The share of the remaining deadline given to fetching the Google page."""
+
+PAGES_SHARE: Final[float] = 0.6
+"""The share of the remaining deadline given to fetching the result pages.
+
+The rest is kept for extracting the context and running the model on it.
+"""
+
+MAX_CONNECTIONS: Final[int] = 32
+
+_session: Final[Session] = Session()
+_session.mount("http://", HTTPAdapter(pool_maxsize=MAX_CONNECTIONS))
+_session.mount("https://", HTTPAdapter(pool_maxsize=MAX_CONNECTIONS))
+
+_fetch_pool: Final[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS)
+
 
 def create_query(question: Question) -> Query:
     """
@@ -119,27 +173,61 @@ def url_param_sanitize(query: Query) -> SanitizedQuery:
     return SanitizedQuery(googlesearch.quote_plus(query))  # pyre-ignore[16]
 
 
-def get_page(url: URL, verbose=False) -> WebPage:
+def get_page(
+    url: URL, verbose=False, timeout: float = DEFAULT_TIMEOUT_SECONDS
+) -> WebPage:
     """Returns the html \
         [`WebPage`](ntfp_types.html#ntfp.ntfp_types.WebPage) \
         of the given [`URL`](ntfp_types.html#ntfp.ntfp_types.URL).
+
+    [//]: # (markdown comment # noqa)
+
+    Connections are pooled across calls.
+    A PDF is returned as a simple HTML page of its text, see [`pdf`](pdf.html).
+
+    Args:
+        url: The [`URL`](ntfp_types.html#ntfp.ntfp_types.URL) to fetch.
+        verbose: printouts while running.
+        timeout: Seconds to wait for the server. (Default = 10.0).
     """
     if url.endswith("pdf"):
-        if verbose:
-            print("skipping PDF file && returning empty WebPage...")
-        # TODO: consider returning None? but then return is Optional[WebPage]
-        # TODO: consider having create_query avoid PDFs via "-filetype:pdf"
-        # TODO: but also consider that Google can get GoogleContext from PDFs,
-        #     :    which is good
-        # TODO: but for sure get_page should avoid PDFs.
-        #     :    unless we can import some fancy PDF OCR package to handle it
-        return WebPage("")
-    response: Response = get(url)
+        # the text of the PDF is extracted in a separate process pool
+        # with page, time and memory limits. see ntfp.pdf
+        return get_pdf_page(url, verbose=verbose, session=_session)
+    response: Response = _session.get(url, timeout=timeout)
     html: str = response.text
     return WebPage(html)
 
 
-def get_google_page(query: Query) -> GooglePage:
+def fetch_page(
+    url: URL, deadline: Deadline = NO_DEADLINE, cache: Optional[DiskCache] = None
+) -> WebPage:
+    """Like [`get_page`](#ntfp.ntfp.get_page), but bounded by the \
+        [`Deadline`](deadline.html#ntfp.deadline.Deadline) and \
+        [`hedged`](deadline.html#ntfp.deadline.hedged) when slow.
+
+    [//]: # (markdown comment # noqa)
+
+    With a [`DiskCache`](cache.html#ntfp.cache.DiskCache) each URL is only
+    fetched once.
+
+    Raises:
+        TimeoutError: the page did not arrive before the deadline.
+    """
+    if cache is not None:
+        return cache.get_or_compute("page", [url], lambda: fetch_page(url, deadline))
+    remaining = deadline.remaining()
+    timeout = DEFAULT_TIMEOUT_SECONDS if remaining is None else remaining
+    if url.endswith("pdf"):
+        # ASSUME: a duplicate download of a large PDF costs more than it saves
+        return get_pdf_page(url, session=_session, deadline=deadline)
+    host = urlparse(url).netloc
+    return hedged(get_page, url, host=host, deadline=deadline, timeout=timeout)
+
+
+def get_google_page(
+    query: Query, deadline: Deadline = NO_DEADLINE, cache: Optional[DiskCache] = None
+) -> GooglePage:
     """
     Perform a Google Search and return the html content.
 
@@ -147,6 +235,10 @@ def get_google_page(query: Query) -> GooglePage:
         query: A [`Query`](ntfp_types.html#ntfp.ntfp_types.Query) string
             that would be typed into the Google Search box,
             which is expected to be used as a URL parameter.
+        deadline: The [`Deadline`](deadline.html#ntfp.deadline.Deadline) \
+            of the fetch. (Default = no deadline).
+        cache: An optional [`DiskCache`](cache.html#ntfp.cache.DiskCache) \
+            of fetched pages.
 
     Example:
         >>> question: Question = Question("what is foaad email?")
@@ -171,58 +263,101 @@ def get_google_page(query: Query) -> GooglePage:
 
     url: URL = URL(f"{BASE_GOOGLE_URL}{sanitized_query}")
 
-    html_page: GooglePage = GooglePage(get_page(url))
+    with stage("fetch"):
+        html_page: GooglePage = GooglePage(fetch_page(url, deadline, cache))
 
     return html_page
 
 
-def fetch_google_result_urls(
-    query: Query, limit: Optional[int] = None
-) -> GoogleResultURLIterator:
-    """Fetches [`GoogleResultURL`](ntfp_types.html#ntfp.ntfp_types.GoogleResultURL)s \
-        from [large list of Google Search results][4].
+def google_result_url(href: str) -> Optional[GoogleResultURL]:
+    """Unwraps a result link of a [`GooglePage`](ntfp_types.html#ntfp.ntfp_types.GooglePage).
 
     [//]: # (markdown comment # noqa)
 
-    Retrieves strings of \
-        [`GoogleResultURL`](ntfp_types.html#ntfp.ntfp_types.GoogleResultURL)s \
-        pertaining to the given [`Query`](ntfp_types.html#ntfp.ntfp_types.Query).
+    Example:
+        >>> google_result_url("/url?q=https://cpe.calpoly.edu/faculty/foaad/&sa=U")
+        'https://cpe.calpoly.edu/faculty/foaad/'
+        >>> google_result_url("/search?q=foaad&start=10") is None
+        True
 
-    Args:
-        query: A [`Query`](ntfp_types.html#ntfp.ntfp_types.Query) string
-            that would be typed into the Google Search box,
-            which is expected to be used as a URL parameter.
+    Returns:
+        The [`GoogleResultURL`](ntfp_types.html#ntfp.ntfp_types.GoogleResultURL), \
+            or `None` when the link points back into Google.
+    """
+    if href.startswith("/url?"):
+        params = parse_qs(urlparse(href).query)
+        href = (params.get("q") or params.get("url") or [""])[0]
+    netloc = urlparse(href).netloc
+    if not href.startswith(("http://", "https://")) or "google." in netloc:
+        return None
+    return GoogleResultURL(URL(href))
 
-        limit: An optional integer for the total number of results to fetch.
-            By default `None` means fetch all results that google offers.
 
-    Yields:
-        A single \
-            [`GoogleResultURL`](ntfp_types.html#ntfp.ntfp_types.GoogleResultURL)
-            from the Google Search
-            [`GooglePage`](ntfp_types.html#ntfp.ntfp_types.GooglePage).
+def parse_google_results(page: GooglePage) -> GoogleResults:
+    """Extracts the ordered organic results of a \
+        [`GooglePage`](ntfp_types.html#ntfp.ntfp_types.GooglePage).
 
-    Resources:
-        * How to type annotate Generators
-            * https://stackoverflow.com/q/27264250
-            * https://docs.python.org/3/library/typing.html#typing.Generator
+    [//]: # (markdown comment # noqa)
 
-    [4]: http://google.com/search?q=what+is+foaad+email?+site:calpoly.edu
-    """
-    for url in googlesearch.search(
-        query,
-        num=10,
-        stop=limit,  # allows for infinite-ish generation of google results
-        country="",  # TODO: consider setting San Luis Obispo if possible?
-    ):
-        yield GoogleResultURL(url)
+    Every result title is an `<h3>` inside a link. The snippet is the rest of
+    the text of the largest element that holds that one title and no other.
 
+    Args:
+        page: A [`GooglePage`](ntfp_types.html#ntfp.ntfp_types.GooglePage) \
+            from [`get_google_page`](#ntfp.ntfp.get_google_page).
 
-def transformer(q: Question, c: Context) -> Tuple[Answer, ExtraDataDict]:
+    Returns:
+        A list of [`GoogleResult`](ntfp_types.html#ntfp.ntfp_types.GoogleResult)s \
+            in the order Google ranked them.
+    """
+    with stage("parse"):
+        soup: BeautifulSoup = BeautifulSoup(markup=page, features="html.parser")
+        results: GoogleResults = []
+        seen = set()
+        for h3 in soup.find_all("h3"):
+            link = h3.find_parent("a") or h3.find("a")
+            if link is None:
+                continue
+            url = google_result_url(link.get("href", ""))
+            if url is None or url in seen:
+                continue
+            seen.add(url)
+            container = link
+            while container.parent is not None:
+                if len(container.parent.find_all("h3")) > 1:
+                    break
+                container = container.parent
+            link_text = link.get_text(" ", strip=True)
+            text = container.get_text(" ", strip=True)
+            snippet = text.replace(link_text, "", 1).strip()
+            title = h3.get_text(" ", strip=True)
+            results.append(GoogleResult(url, title, GoogleContext(Context(snippet))))
+    return results
+
+
+def transformer(
+    q: Question,
+    c: Context,
+    model: str = DEFAULT_QA_MODEL,
+    quantize: bool = False,
+) -> Tuple[Answer, ExtraDataDict]:
     """transformer
 
     [//]: # (markdown comment # noqa)
 
+    Args:
+        q: A [`Question`](ntfp_types.html#ntfp.ntfp_types.Question) string.
+        c: A [`Context`](ntfp_types.html#ntfp.ntfp_types.Context) string.
+        model: A question-answering model name. \
+            (Default = `"distilbert-base-cased-distilled-squad"`).
+        quantize: Opt in to int8 dynamically quantized CPU inference. \
+            (Default = False).
+
+    Returns:
+        A tuple of the [`Answer`](ntfp_types.html#ntfp.ntfp_types.Answer) \
+            and an [`ExtraDataDict`](ntfp_types.html#ntfp.ntfp_types.ExtraDataDict) \
+            whose `mode` is `"float32"` or `"int8"`.
+
     Resources:
         * HuggingFace Transformers pipelines
             * https://github.com/huggingface/transformers#quick-tour-of-pipelines
@@ -234,25 +369,89 @@ def transformer(q: Question, c: Context) -> Tuple[Answer, ExtraDataDict]:
             "end": -1,
             "tokenizer": "NA_SKIPPED_TRANSFORMER",
             "model": "NA_SKIPPED_TRANSFORMER",
+            "mode": "NA_SKIPPED_TRANSFORMER",
         }
         return (
             Answer(IDK),
             extra_data,
         )
-    # FIXME: this line below needs an internet connection!
-    nlp = pipeline("question-answering")
+    nlp = load_pipeline(model=model, quantize=quantize)
     input_data = {"question": q, "context": c}
-    answer = nlp(input_data)
+    with stage("torch"):
+        answer = nlp(input_data)
     extra_data: ExtraDataDict = {
         "score": answer.get("score", -1.0),
         "start": answer.get("start", -1),
         "end": answer.get("end", -1),
         "tokenizer": nlp.tokenizer.__class__.__name__,
         "model": nlp.model.__class__.__name__,
+        "mode": mode_name(quantize),
+        "qa_model": model,
     }
     return (answer.get("answer", IDK), extra_data)
 
 
+def answer(
+    q: Question,
+    c: Context,
+    model: str = DEFAULT_QA_MODEL,
+    quantize: bool = False,
+    deadline: Deadline = NO_DEADLINE,
+    cascade: Optional[Cascade] = None,
+    pool: Optional[InferencePool] = None,
+) -> Tuple[Answer, ExtraDataDict]:
+    """Answers with the cheap [`fast_path`](fast_path.html) when it is confident, \
+        otherwise with the [`transformer`](#ntfp.ntfp.transformer).
+
+    [//]: # (markdown comment # noqa)
+
+    Once the [`Deadline`](deadline.html#ntfp.deadline.Deadline) has expired
+    the transformer still answers from the context that has arrived, but a
+    cascade no longer escalates. Only without any context is the answer IDK.
+    With a [`Cascade`](cascade.html) its models replace `model`, cheapest first.
+    Otherwise, with an [`InferencePool`](pool.html#ntfp.pool.InferencePool)
+    the transformer runs in one of its workers, with the pool's own model.
+
+    Returns:
+        A tuple of the [`Answer`](ntfp_types.html#ntfp.ntfp_types.Answer) \
+            and an [`ExtraDataDict`](ntfp_types.html#ntfp.ntfp_types.ExtraDataDict) \
+            whose `stage` tells which of the two answered.
+    """
+    fast = fast_answer(q, c)
+    if fast is not None:
+        return fast
+    if deadline.expired():
+        if not c:
+            answer, extra_data = transformer(q, Context(""))
+            extra_data["stage"] = "deadline"
+            return answer, extra_data
+        cascade = cascade[:1] if cascade else cascade
+    if cascade:
+        answer, extra_data = run_cascade(
+            cascade, lambda m: transformer(q, c, model=m, quantize=quantize)
+        )
+    elif pool is not None:
+        answer, extra_data = pool.transformer(q, c)
+    else:
+        answer, extra_data = transformer(q, c, model=model, quantize=quantize)
+    extra_data["stage"] = "transformer"
+    return answer, extra_data
+
+
+def answering_model(
+    model: str = DEFAULT_QA_MODEL,
+    cascade: Optional[Cascade] = None,
+    pool: Optional[InferencePool] = None,
+) -> str:
+    """The model [`answer`](#ntfp.ntfp.answer) runs first, so the one whose \
+        tokenizer a context is counted and packed with."""
+    if cascade:
+        return cascade[0].model
+    if pool is not None:
+        return pool.model
+    return model
+
+
 def extract_webpage_context(
     page: WebPage, only_paragraphs: Optional[bool] = False
 ) -> WebPageContext:
@@ -302,15 +501,27 @@ class NtfpNoEntityError(Exception):
         self.messsage = message
 
 
-def relevance(to, nlp=None, FUZZ_THRESHOLD=30, LEN_THRESHOLD=2):
+def relevance_score(
+    to, nlp=None, FUZZ_THRESHOLD=30, LEN_THRESHOLD=2, doc=None
+) -> Callable[[str], Optional[int]]:
+    """Returns a function that scores the relevance of a text to the question \
+        `to`, or gives `None` when the text is not relevant at all.
+
+    The score is the `fuzz.ratio` of the text and the question, plus
+    `FUZZ_THRESHOLD` when the text contains the question's named entity.
+    The entity is found by running `nlp` on the question, unless its spaCy
+    `doc` is given, e.g. from `nlp.pipe` over many questions.
+    """
     FUZZ_THRESHOLD = FUZZ_THRESHOLD or 30
     LEN_THRESHOLD = LEN_THRESHOLD or 2
     # TODO: make smarter filter THRESHOLDS
     # TODO: consider semantic similarity
     original_question = to
     entity_text = None
-    if isinstance(nlp, spacy.language.Language):
-        doc = nlp(original_question)
+    if doc is None and isinstance(nlp, spacy.language.Language):
+        with stage("spacy"):
+            doc = nlp(original_question)
+    if doc is not None:
         ents = doc.ents
         if len(ents) > 0:
             entity = ents[0]
@@ -328,7 +539,7 @@ def relevance(to, nlp=None, FUZZ_THRESHOLD=30, LEN_THRESHOLD=2):
             msg = f"'{original_question}' has no named entity from spacy?"
             raise NtfpNoEntityError(original_question, msg)
 
-    def _filter_func(text):
+    def _score_func(text):
         text_question_lexical_similarity = fuzz.ratio(text, original_question)
         # TODO: make smarter filter rules
         if entity_text is not None and entity_text in text:
@@ -336,14 +547,25 @@ def relevance(to, nlp=None, FUZZ_THRESHOLD=30, LEN_THRESHOLD=2):
             text_question_lexical_similarity += FUZZ_THRESHOLD
         if original_question in text:
             # ASSUME: that answer would not include original_question
-            return False
+            return None
         if text_question_lexical_similarity < FUZZ_THRESHOLD:
             # ASSUME: some lexical similarity question with answer
-            return False
+            return None
         if len(text) < LEN_THRESHOLD:
             # ASSUME: text is long enough to contain an answer.
-            return False
-        return True
+            return None
+        return text_question_lexical_similarity
+
+    return _score_func
+
+
+def relevance(to, nlp=None, FUZZ_THRESHOLD=30, LEN_THRESHOLD=2):
+    score = relevance_score(
+        to=to, nlp=nlp, FUZZ_THRESHOLD=FUZZ_THRESHOLD, LEN_THRESHOLD=LEN_THRESHOLD
+    )
+
+    def _filter_func(text):
+        return score(text) is not None
 
     return _filter_func
 
@@ -363,6 +585,59 @@ def filter_list_by_relevance(
 # fmt:on
 
 
+def iter_segments(string: str, sep: str = "\n") -> Iterator[str]:
+    """Lazily yields the same segments as `string.split(sep)`.
+
+    Example:
+        >>> list(iter_segments("a\n\nb\n", sep="\n"))
+        ['a', '', 'b', '']
+
+    Raises:
+        ValueError: When `sep` is empty, like `str.split`.
+    """
+    if not sep:
+        raise ValueError("empty separator")
+    start = 0
+    while True:
+        end = string.find(sep, start)
+        if end < 0:
+            yield string[start:]
+            return
+        yield string[start:end]
+        start = end + len(sep)
+
+
+def top_segments_by_relevance(
+    to: str,
+    segments: Iterable[str],
+    FUZZ: Optional[int] = None,
+    LEN: Optional[int] = None,
+    limit: Optional[int] = None,
+    nlp: Optional[object] = None,
+    doc: Optional[object] = None,
+) -> List[Tuple[int, str]]:
+    """Keeps the `limit` segments most relevant to the question `to`.
+
+    Segments are consumed one at a time and only a heap of the best `limit`
+    is kept, so this takes O(n log limit) time and O(limit) memory.
+
+    `doc` is the question's spaCy doc, if already computed. \
+        See [`relevance_score`](#ntfp.ntfp.relevance_score).
+
+    Returns:
+        (score, segment) pairs, best first. Equal scores keep their order.
+    """
+    score = relevance_score(
+        to=to, FUZZ_THRESHOLD=FUZZ, LEN_THRESHOLD=LEN, nlp=nlp, doc=doc
+    )
+    scored = ((score(segment), segment) for segment in segments)
+    relevant = (pair for pair in scored if pair[0] is not None)
+    with stage("fuzzy"):
+        if limit is None:
+            return sorted(relevant, key=itemgetter(0), reverse=True)
+        return heapq.nlargest(limit, relevant, key=itemgetter(0))
+
+
 def filter_string_by_relevance(
     to: str,
     string: str,
@@ -372,37 +647,454 @@ def filter_string_by_relevance(
     sep: str = "\n",
     nlp: Optional[object] = None,
 ) -> str:
-    lst = string.split(sep)
-    relevant_text_list: Iterator[str] = filter_list_by_relevance(
-        to=to, lst=lst, FUZZ=FUZZ, LEN=LEN, nlp=nlp
+    """Joins the `limit` segments of `string` most relevant to `to`, best first.
+
+    See [`top_segments_by_relevance`](#ntfp.ntfp.top_segments_by_relevance).
+    """
+    top = top_segments_by_relevance(
+        to=to,
+        segments=iter_segments(string, sep),
+        FUZZ=FUZZ,
+        LEN=LEN,
+        limit=limit,
+        nlp=nlp,
     )
-    return sep.join(sorted(relevant_text_list, reverse=True)[:limit])
+    return sep.join(segment for _, segment in top)
 
 
 def extract_relevant_context(page: WebPage, question: Question) -> Context:
-    soup: BeautifulSoup = BeautifulSoup(markup=page, features="html.parser")
+    with stage("parse"):
+        soup: BeautifulSoup = BeautifulSoup(markup=page, features="html.parser")
 
-    txt_lst: List[str] = [x for x in soup.stripped_strings]
+        txt_lst: List[str] = [x for x in soup.stripped_strings]
 
     # Filter by relevance to the question
     relevant_text_list = filter_list_by_relevance(to=question, lst=txt_lst)
 
-    return Context("\n".join(relevant_text_list))
+    with stage("fuzzy"):
+        return Context("\n".join(relevant_text_list))
 
 
 def get_context(
-    question: Question, use_google: bool = True, verbose: bool = False
+    question: Question,
+    use_google: bool = True,
+    verbose: bool = False,
+    store: str = DEFAULT_STORE,
+    deadline: Deadline = NO_DEADLINE,
+    cache: Optional[DiskCache] = None,
 ) -> Tuple[Query, WebPage, Context]:
+    """Gets the [`Context`](ntfp_types.html#ntfp.ntfp_types.Context) \
+        for a [`Question`](ntfp_types.html#ntfp.ntfp_types.Question).
+
+    [//]: # (markdown comment # noqa)
+
+    Args:
+        question: A [`Question`](ntfp_types.html#ntfp.ntfp_types.Question) string.
+        use_google: Search Google on the request path when `True`, otherwise \
+            look up the chunks pre-extracted by [`ingest`](ingest.html).
+        verbose: printouts while running.
+        store: The path of the [`store`](store.html) used when \
+            `use_google` is `False`.
+        deadline: The [`Deadline`](deadline.html#ntfp.deadline.Deadline) \
+            of the Google fetch. (Default = no deadline).
+        cache: An optional [`DiskCache`](cache.html#ntfp.cache.DiskCache) \
+            of fetched pages.
+
+    Returns:
+        A tuple of (query, page, context). \
+            The page is empty when the context comes from the store.
+    """
     if use_google:
         query: Query = create_query(question)
-        page: GooglePage = get_google_page(query)
+        page: GooglePage = get_google_page(query, deadline, cache)
         if verbose:
             print("query: ", query, "\n")
             print("len(page): ", len(page), "\n")
         context: Context = extract_relevant_context(page, question)
         return query, page, context
     else:
-        raise NotImplementedError
+        context: Context = lookup_context(question, store=store)
+        if verbose:
+            print("store: ", store, "\n")
+        return Query(question), WebPage(""), context
+
+
+SNIPPET_SCORE_THRESHOLD: Final[float] = 0.5
+"""Below this score the result pages are fetched to find a better answer."""
+
+FETCH_CONCURRENCY: Final[int] = 4
+"""How many ranked result pages are downloaded at the same time."""
+
+
+def ranked_urls(
+    question: Question,
+    results: GoogleResults,
+    limit: int = 10,
+    min_yield: float = DEFAULT_MIN_YIELD,
+    yields: Optional[HostYields] = None,
+) -> List[GoogleResultURL]:
+    """The URLs of at most `limit` results worth fetching, best first, \
+        see [`rank_results`](ranking.html#ntfp.ranking.rank_results).
+    """
+    ranked = rank_results(question, results, yields)
+    return [result.url for score, result in ranked if score >= min_yield][:limit]
+
+
+def fetch_ranked_contexts(
+    question: Question,
+    results: GoogleResults,
+    limit: int = 10,
+    deadline: Deadline = NO_DEADLINE,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    min_yield: float = DEFAULT_MIN_YIELD,
+    yields: Optional[HostYields] = None,
+    cache: Optional[DiskCache] = None,
+    model: str = DEFAULT_QA_MODEL,
+) -> List[Tuple[GoogleResultURL, Context]]:
+    """Fetches the result pages worth it, best first, until their relevant \
+        contexts fill the token budget.
+
+    [//]: # (markdown comment # noqa)
+
+    `FETCH_CONCURRENCY` pages are downloaded at a time, in the order of
+    [`ranked_urls`](#ntfp.ntfp.ranked_urls). Once the contexts that arrived
+    have `budget` tokens, or the deadline expires, no other page is fetched.
+
+    Args:
+        question: A [`Question`](ntfp_types.html#ntfp.ntfp_types.Question) string.
+        results: The [`parse_google_results`](#ntfp.ntfp.parse_google_results).
+        limit: The most result pages to fetch. (Default = 10).
+        deadline: The [`Deadline`](deadline.html#ntfp.deadline.Deadline) \
+            of all the fetches. (Default = no deadline).
+        budget: The context tokens that are enough, `None` for no limit. \
+            (Default = `DEFAULT_TOKEN_BUDGET`).
+        min_yield: The least score of a page worth fetching. \
+            (Default = `DEFAULT_MIN_YIELD`).
+        yields: The host yields to rank by, see \
+            [`load_yields`](ranking.html#ntfp.ranking.load_yields).
+        cache: An optional [`DiskCache`](cache.html#ntfp.cache.DiskCache) \
+            of fetched pages.
+        model: The model whose tokens fill the budget. \
+            (Default = `DEFAULT_QA_MODEL`).
+
+    Returns:
+        The (url, relevant context) of every page that arrived in time, \
+            best first. The context is empty when nothing in it was relevant.
+    """
+    urls = ranked_urls(question, results, limit, min_yield, yields)
+    arrived: Dict[int, Context] = {}
+    in_flight: Dict[Future, int] = {}
+    tokens = 0
+    index = 0
+    try:
+        while index < len(urls) or in_flight:
+            while index < len(urls) and len(in_flight) < FETCH_CONCURRENCY:
+                future = _fetch_pool.submit(fetch_page, urls[index], deadline, cache)
+                in_flight[future] = index
+                index += 1
+            with stage("fetch"):
+                done, _ = wait(
+                    in_flight, timeout=deadline.remaining(), return_when=FIRST_COMPLETED
+                )
+            if not done:
+                break  # the deadline expired
+            for future in done:
+                i = in_flight.pop(future)
+                if future.exception() is not None:
+                    continue
+                arrived[i] = extract_relevant_context(future.result(), question)
+                if budget and arrived[i]:
+                    tokens += count_tokens(arrived[i], model)
+            if budget and tokens >= budget:
+                break
+    finally:
+        for future in in_flight:
+            future.cancel()
+    return [(urls[i], arrived[i]) for i in sorted(arrived)]
+
+
+Preparation = Tuple[Context, Optional[Deduplication], Optional[PackedContext]]
+
+
+def prepare_context(
+    question: Question,
+    context: Context,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    dedupe_threshold: Optional[float] = DEFAULT_SIMILARITY,
+    sep: str = "\n",
+    ranked: bool = False,
+    cache: Optional[TokenCache] = None,
+    model: str = DEFAULT_QA_MODEL,
+) -> Preparation:
+    """Drops the near-duplicate sentences of a context, then packs its `sep` \
+        separated segments, scored by \
+        [`relevance_to`](packing.html#ntfp.packing.relevance_to) the question, \
+        into `budget` tokens.
+
+    Args:
+        ranked: The segments are already best first, e.g. clubs from \
+            [`top_segments_by_relevance`](#ntfp.ntfp.top_segments_by_relevance), \
+            so they are packed in their order. (Default = False).
+        cache: The [`TokenCache`](token_cache.html#ntfp.token_cache.TokenCache) \
+            to count tokens with. (Default = `shared_cache`).
+        model: The model that will answer, see \
+            [`answering_model`](#ntfp.ntfp.answering_model). \
+            (Default = `DEFAULT_QA_MODEL`).
+
+    Returns:
+        The packed context, its [`Deduplication`](dedupe.html#ntfp.dedupe.Deduplication) \
+            and its [`PackedContext`](packing.html#ntfp.packing.PackedContext), \
+            each `None` when skipped.
+    """  # noqa
+    deduped = packed = None
+    if dedupe_threshold:
+        context, deduped = dedupe(context, sep, dedupe_threshold)
+    if budget:
+        score = None if ranked else relevance_to(question)
+        context, packed = pack(
+            question, context, sep, budget, model=model, cache=cache, score=score
+        )
+    return context, deduped, packed
+
+
+def record_preparation(
+    extra_data: ExtraDataDict, preparation: Preparation
+) -> ExtraDataDict:
+    """Adds what [`prepare_context`](#ntfp.ntfp.prepare_context) did to `extra_data`."""
+    _, deduped, packed = preparation
+    if deduped is not None:
+        record_dedupe(extra_data, deduped)
+    if packed is not None:
+        record_packing(extra_data, packed)
+    return extra_data
+
+
+def answer_packed(
+    question: Question,
+    context: Context,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    dedupe_threshold: Optional[float] = DEFAULT_SIMILARITY,
+    deadline: Deadline = NO_DEADLINE,
+    cascade: Optional[Cascade] = None,
+    pool: Optional[InferencePool] = None,
+) -> Tuple[Context, Answer, ExtraDataDict]:
+    """[`answer`](#ntfp.ntfp.answer)s from the context \
+        once it went through [`prepare_context`](#ntfp.ntfp.prepare_context).
+
+    Returns:
+        The packed context, the answer and its extra data.
+    """
+    model = answering_model(cascade=cascade, pool=pool)
+    preparation = prepare_context(
+        question, context, budget, dedupe_threshold, model=model
+    )
+    best_answer, extra_data = answer(
+        question, preparation[0], deadline=deadline, cascade=cascade, pool=pool
+    )
+    return preparation[0], best_answer, record_preparation(extra_data, preparation)
+
+
+def answer_from_google(
+    question: Question,
+    threshold: float = SNIPPET_SCORE_THRESHOLD,
+    limit: int = 10,
+    verbose: bool = False,
+    deadline: Optional[Deadline] = None,
+    budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+    dedupe_threshold: Optional[float] = DEFAULT_SIMILARITY,
+    cascade: Optional[Cascade] = None,
+    min_yield: float = DEFAULT_MIN_YIELD,
+    yields: Optional[HostYields] = None,
+    pool: Optional[InferencePool] = None,
+) -> Tuple[Query, GooglePage, Context, Answer, ExtraDataDict]:
+    """Answers from the Google result snippets, fetching the result pages \
+        only when the snippet answer is not good enough.
+
+    [//]: # (markdown comment # noqa)
+
+    The snippets are the [`GoogleContext`](ntfp_types.html#ntfp.ntfp_types.GoogleContext) \
+        already inside the [`GooglePage`](ntfp_types.html#ntfp.ntfp_types.GooglePage), \
+        so most questions need one HTTP round-trip instead of eleven.
+
+    Args:
+        question: A [`Question`](ntfp_types.html#ntfp.ntfp_types.Question) string.
+        threshold: The minimum `score` of a snippet answer. (Default = 0.5).
+        limit: The most result pages to fetch when below `threshold`. \
+            They are fetched best first and only while worth it, see \
+            [`fetch_ranked_contexts`](#ntfp.ntfp.fetch_ranked_contexts). \
+            (Default = 10).
+        verbose: printouts while running.
+        deadline: The [`Deadline`](deadline.html#ntfp.deadline.Deadline) \
+            of the whole answer. The Google page gets `GOOGLE_SHARE` of it \
+            and the result pages `PAGES_SHARE` of what is left; the answer \
+            is then made from the pages that arrived in time. \
+            (Default = `DEFAULT_DEADLINE_SECONDS` from now).
+        budget: The most context tokens the model reads, see \
+            [`pack`](packing.html#ntfp.packing.pack). `None` for no limit. \
+            (Default = `DEFAULT_TOKEN_BUDGET`).
+        dedupe_threshold: Near-duplicate sentences are dropped before \
+            packing, see [`dedupe`](dedupe.html#ntfp.dedupe.dedupe). \
+            `None` to keep them. (Default = `DEFAULT_SIMILARITY`).
+        cascade: The models to answer with, cheapest first, see \
+            [`run_cascade`](cascade.html#ntfp.cascade.run_cascade). \
+            (Default = only `DEFAULT_QA_MODEL`).
+        min_yield: The least [`rank_results`](ranking.html#ntfp.ranking.rank_results) \
+            score of a result page worth fetching. \
+            (Default = `DEFAULT_MIN_YIELD`).
+        yields: The host yields to rank the result pages by, see \
+            [`load_yields`](ranking.html#ntfp.ranking.load_yields).
+        pool: An optional [`InferencePool`](pool.html#ntfp.pool.InferencePool) \
+            to run the transformer in, see [`answer`](#ntfp.ntfp.answer).
+
+    Returns:
+        A tuple of (query, page, context, answer, extra_data). \
+            The page is empty when Google did not respond in time. \
+            The context is the packed one the answer was found in.
+    """
+    if deadline is None:
+        deadline = Deadline(DEFAULT_DEADLINE_SECONDS)
+    query: Query = create_query(question)
+    try:
+        page: GooglePage = get_google_page(query, deadline.share(GOOGLE_SHARE))
+    except TimeoutError:
+        page = GooglePage(WebPage(""))
+    results: GoogleResults = parse_google_results(page)
+    context = Context("\n".join(r.snippet for r in results if r.snippet))
+    context, best_answer, extra_data = answer_packed(
+        question, context, budget, dedupe_threshold, deadline, cascade, pool
+    )
+    extra_data["pages_fetched"] = 0
+    if verbose:
+        print("query: ", query, "\n")
+        print("len(results): ", len(results), "\n")
+        print("snippet score: ", extra_data["score"], "\n")
+    if extra_data["score"] >= threshold or deadline.expired():
+        return query, page, context, best_answer, extra_data
+    fetched = fetch_ranked_contexts(
+        question,
+        results,
+        limit=limit,
+        deadline=deadline.share(PAGES_SHARE),
+        budget=budget,
+        min_yield=min_yield,
+        yields=yields,
+        model=answering_model(cascade=cascade, pool=pool),
+    )
+    # the snippets already scored below threshold, the pages get the budget
+    page_context = Context("\n".join(c for _, c in fetched if c))
+    page_context, page_answer, page_extra_data = answer_packed(
+        question, page_context, budget, dedupe_threshold, deadline, cascade, pool
+    )
+    if verbose:
+        print("pages_fetched: ", len(fetched), "\n")
+        print("page score: ", page_extra_data["score"], "\n")
+    if page_extra_data["score"] < extra_data["score"]:
+        best = (context, best_answer, extra_data)
+    else:
+        best = (page_context, page_answer, page_extra_data)
+    best_context, best_answer, extra_data = best
+    record_fetching(extra_data, fetched, min(len(results), limit), best_answer)
+    return query, page, best_context, best_answer, extra_data
+
+
+def record_fetching(
+    extra_data: ExtraDataDict,
+    fetched: List[Tuple[GoogleResultURL, Context]],
+    candidates: int,
+    final_answer: Answer,
+) -> ExtraDataDict:
+    """Adds `pages_fetched`, `pages_skipped` and `page_yields` to `extra_data`.
+
+    Args:
+        fetched: The [`fetch_ranked_contexts`](#ntfp.ntfp.fetch_ranked_contexts).
+        candidates: How many result pages a fixed fetch depth would download.
+        final_answer: The answer given. Without one (`IDK`) no page yields.
+    """
+    extra_data["pages_fetched"] = len(fetched)
+    extra_data["pages_skipped"] = max(0, candidates - len(fetched))
+    if final_answer != IDK:
+        extra_data["page_yields"] = page_yields(fetched, final_answer)
+    return extra_data
+
+
+CONFIDENT_SCORE_THRESHOLD: Final[float] = 0.8
+"""[`stream_answers`](#ntfp.ntfp.stream_answers) stops once an answer scores this."""
+
+
+def stream_answers(
+    question: Question,
+    threshold: float = CONFIDENT_SCORE_THRESHOLD,
+    limit: int = 10,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[Tuple[Answer, ExtraDataDict]]:
+    """Yields ever better answers as the result pages arrive.
+
+    [//]: # (markdown comment # noqa)
+
+    The first answer comes from the Google result snippets. Then the result
+    pages worth it, see [`ranked_urls`](#ntfp.ntfp.ranked_urls), are fetched
+    concurrently and each page is answered as soon as it arrives; an answer
+    is only yielded when it beats the best so far.
+    Once an answer scores `threshold`, the deadline runs out, or the caller
+    stops iterating, the fetches that have not started are cancelled.
+
+    Args:
+        question: A [`Question`](ntfp_types.html#ntfp.ntfp_types.Question) string.
+        threshold: The `score` that is good enough to stop. (Default = 0.8).
+        limit: The most result pages to fetch. (Default = 10).
+        deadline: The [`Deadline`](deadline.html#ntfp.deadline.Deadline) \
+            of the whole stream. (Default = `DEFAULT_DEADLINE_SECONDS` from now).
+
+    Example:
+        >>> for answer, extra_data in stream_answers(Question("what is foaad email?")):
+        ...     print(answer, extra_data["score"], extra_data["pages_fetched"])
+        Khosmood 0.21 0
+        foaad@calpoly.edu 0.93 2
+
+    Yields:
+        Tuples of (answer, extra_data) with strictly increasing `score`.
+    """
+    if deadline is None:
+        deadline = Deadline(DEFAULT_DEADLINE_SECONDS)
+    query: Query = create_query(question)
+    try:
+        page: GooglePage = get_google_page(query, deadline.share(GOOGLE_SHARE))
+    except TimeoutError:
+        page = GooglePage(WebPage(""))
+    results: GoogleResults = parse_google_results(page)
+    context = Context("\n".join(r.snippet for r in results if r.snippet))
+    best_answer, best = answer(question, context, deadline=deadline)
+    best["pages_fetched"] = 0
+    yield best_answer, best
+    if best["score"] >= threshold or deadline.expired():
+        return
+    futures = [
+        _fetch_pool.submit(fetch_page, url, deadline)
+        for url in ranked_urls(question, results, limit)
+    ]
+    fetched = 0
+    try:
+        for future in as_completed(futures, timeout=deadline.remaining()):
+            fetched += 1
+            if deadline.expired():
+                return
+            if future.exception() is not None:
+                continue
+            page_context = extract_relevant_context(future.result(), question)
+            if not page_context:
+                continue
+            page_answer, extra_data = answer(question, page_context, deadline=deadline)
+            extra_data["pages_fetched"] = fetched
+            if extra_data["score"] > best["score"]:
+                best_answer, best = page_answer, extra_data
+                yield best_answer, best
+                if best["score"] >= threshold:
+                    return
+    except FutureTimeoutError:
+        return
+    finally:
+        for future in futures:
+            future.cancel()
 
 
 if __name__ == "__main__":
@@ -473,22 +1165,12 @@ if __name__ == "__main__":
     # # reveal_type(x)
     # # reveal_type(y)
 
-    google_page: GooglePage = get_google_page(query)
-
-    first_ten_urls: List[GoogleResultURL] = [
-        x for x in fetch_google_result_urls(query, limit=10)
-    ]  # noqa
-    print("first_ten_urls: ", first_ten_urls)
-    # reveal_type(first_ten_urls)
-
-    f: Callable[[URL], WebPage] = get_page
-    result_pages: List[WebPage] = [f(url) for url in first_ten_urls]
-    # reveal_type(result_pages)
-
-    f: Callable[[WebPage], WebPageContext] = extract_webpage_context
-    contexts: List[WebPageContext] = [f(page) for page in result_pages]
+    google_data = answer_from_google(question, verbose=True)
+    _, google_page, context, answer_, extra_data = google_data
 
-    large_context: Context = Context("\n\n".join(contexts))
+    results: GoogleResults = parse_google_results(google_page)
+    print("results: ", results, "\n")
 
-    print(large_context)
-    # print(": ", transformer("ok", "cool"))
+    print(context)
+    print("answer: ", answer_, "\n")
+    print("extra_data: ", extra_data, "\n")
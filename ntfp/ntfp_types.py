@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # flake8: noqa
-from typing import Callable, Iterator, List, NewType, Type
+from typing import Callable, Iterator, List, NamedTuple, NewType, Tuple, Type
 from typing_extensions import Literal, TypedDict
 
 __pdoc__ = {}
@@ -240,6 +240,34 @@ Example:
 GoogleContexts = List[GoogleContext]
 GoogleContextIterator = Iterator[GoogleContext]
 
+
+class GoogleResult(NamedTuple):
+    """GoogleResult"""
+
+    url: GoogleResultURL
+    title: str
+    snippet: GoogleContext
+
+
+__pdoc__[
+    "GoogleResult"
+] = """A GoogleResult type
+
+One organic result of a [`GooglePage`](#ntfp.ntfp_types.GooglePage): \
+    its [`GoogleResultURL`](#ntfp.ntfp_types.GoogleResultURL), \
+    its clickable title and its [`GoogleContext`](#ntfp.ntfp_types.GoogleContext) \
+    snippet.
+
+Example:
+    >>> parse_google_results(google_page)[0]
+    ... GoogleResult(
+    ...     url='https://cpe.calpoly.edu/faculty/foaad/',
+    ...     title='Foaad Khosmood | Computer Engineering',
+    ...     snippet='Foaad Khosmood. Professor. Email: foaad@calpoly.edu ...'
+    ... )
+"""
+GoogleResults = List[GoogleResult]
+
 WebPageContext = NewType("WebPageContext", Context)
 """WebPageContext"""
 __pdoc__[
@@ -370,17 +398,56 @@ Example:
 """
 
 
-ExtraDataDict = TypedDict(
-    "ExtraDataDict",
+_ExtraDataDictRequired = TypedDict(
+    "_ExtraDataDictRequired",
     {"score": float, "start": int, "end": int, "tokenizer": str, "model": str},
 )
-"""ExtraDataDict"""
+
+
+class ExtraDataDict(_ExtraDataDictRequired, total=False):
+    """ExtraDataDict"""
+
+    mode: str
+    stage: str
+    pages_fetched: int
+    pages_skipped: int
+    page_yields: List[Tuple[str, bool]]
+    latency_s: float
+    packed_tokens: int
+    dropped_segments: List[int]
+    duplicates_dropped: int
+    dedupe_shrink: float
+    qa_model: str
+    escalations: int
+    cascade_latency_s: float
+    error: str
+
+
 __pdoc__[
     "ExtraDataDict"
 ] = """An ExtraDataDict type
 
 Some extra data for ntfp.transformer to return.
 
+Always has the keys `score`, `start`, `end`, `tokenizer` and `model`.
+
+May also have the keys:
+
+* `mode`: the inference mode, `"float32"` or `"int8"`.
+* `stage`: which stage answered, e.g. `"fast_path:email"` or `"transformer"`.
+* `pages_fetched`: how many result pages were downloaded besides the GooglePage.
+* `pages_skipped`: how many fewer result pages were downloaded than `limit` would allow.
+* `page_yields`: the host of every downloaded page and whether it held the answer.
+* `latency_s`: seconds from starting on the question to answering it.
+* `packed_tokens`: how many context tokens were packed into the token budget.
+* `dropped_segments`: the ranks of the context segments that did not fit at all.
+* `duplicates_dropped`: how many near-duplicate context sentences were dropped.
+* `dedupe_shrink`: the fraction of context characters that dropping them saved.
+* `qa_model`: the name of the question-answering model that answered.
+* `escalations`: how many cheaper models of a [cascade](cascade.html) were not confident enough.
+* `cascade_latency_s`: seconds of all the models of the cascade that were run.
+* `error`: why the question could not be answered, e.g. a failed fetch.
+
 Example:
     ```
     {
@@ -388,7 +455,49 @@ Example:
         "start": 35,
         "end": 59,
         "tokenizer": "DistilBertTokenizer",
-        "model": "DistilBertForQuestionAnswering"
+        "model": "DistilBertForQuestionAnswering",
+        "mode": "float32"
+    }
+    ```
+"""
+
+
+class RetrievalConfigDict(TypedDict):
+    """RetrievalConfigDict"""
+
+    fuzz: int
+    len: int
+    limit: int
+    retriever: Literal["snapshot", "corpus"]
+    budget: int
+    dedupe: float
+
+
+__pdoc__[
+    "RetrievalConfigDict"
+] = """A RetrievalConfigDict type
+
+How [`clubs.py`](../clubs.html) picks the clubs it gives the model as context.
+
+* `fuzz`: the relevance `FUZZ_THRESHOLD` a club must reach.
+* `len`: the `LEN_THRESHOLD`, the fewest characters of a relevant club.
+* `limit`: the most clubs in one context.
+* `retriever`: `"snapshot"` scores only the clubs sharing a term with the \
+    question when a snapshot exists, `"corpus"` always scores every club.
+* `budget`: the most context tokens to [`pack`](packing.html#ntfp.packing.pack), \
+    or `0` for no limit.
+* `dedupe`: the similarity threshold of [`dedupe`](dedupe.html#ntfp.dedupe.dedupe), \
+    or `0` to keep near-duplicate sentences.
+
+Example:
+    ```
+    {
+        "fuzz": 25,
+        "len": 2,
+        "limit": 25,
+        "retriever": "snapshot",
+        "budget": 512,
+        "dedupe": 0.9
     }
     ```
 """
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Packs the most valuable context segments into a token budget.
+
+[//]: # (markdown comment # noqa)
+
+Inference cost grows with the number of context tokens the model reads,
+so a context is packed before inference: the segments, highest scored
+first, are taken whole while they fit the budget. A segment that does not
+fit is cut down to its best sentences that do, and a segment with no
+sentence that fits is dropped. Every question then costs at most
+`budget` context tokens, i.e. a bounded number of model windows.
+
+Tokens are counted with the model's own tokenizer, word by word like
+[`tokenize_segment`](token_cache.html#ntfp.token_cache.tokenize_segment),
+through a [`TokenCache`](token_cache.html#ntfp.token_cache.TokenCache), by
+default the [`shared_cache`](token_cache.html#ntfp.token_cache.shared_cache),
+so a segment is only tokenized once.
+
+Example:
+    >>> context, packed = pack(question, context, sep="\\n\\n\\n", budget=64)
+    >>> packed.tokens, packed.dropped
+    (61, [2, 3])
+    >>> answer, extra_data = transformer(question, context)
+    >>> extra_data = record_packing(extra_data, packed)
+"""
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from fuzzywuzzy import fuzz
+from typing_extensions import Final
+
+from ntfp.models import DEFAULT_QA_MODEL, load_tokenizer
+from ntfp.ntfp_types import Context, ExtraDataDict, Question
+from ntfp.profiling import stage
+from ntfp.store import split_sentences
+from ntfp.token_cache import TokenCache, shared_cache
+
+DEFAULT_TOKEN_BUDGET: Final[int] = 512
+"""About three model windows of context for a short question."""
+
+
+class PackedContext(NamedTuple):
+    """The segments that fit a token budget.
+
+    Attributes:
+        segments: The packed segments, most valuable first. Some may be \
+            cut down to fewer sentences.
+        tokens: How many context tokens the packed segments have.
+        dropped: The indices of the given segments left out entirely.
+        truncated: The indices of the given segments cut down to fit.
+    """
+
+    segments: List[str]
+    tokens: int
+    dropped: List[int]
+    truncated: List[int]
+
+
+def count_tokens(
+    text: str, model: str = DEFAULT_QA_MODEL, cache: Optional[TokenCache] = None
+) -> int:
+    """How many tokens `model`'s tokenizer makes of `text`.
+
+    Only the tokenizer is loaded, never the model's weights.
+    """
+    cache = cache if cache is not None else shared_cache
+    return len(cache.get(load_tokenizer(model), model, text).token_ids)
+
+
+def relevance_to(question: Question) -> Callable[[str], float]:
+    """A cheap sentence value for truncation: its overlap with the question."""
+    return lambda sentence: fuzz.token_set_ratio(sentence, question)
+
+
+def pack_context(
+    segments: Sequence[str],
+    budget: int = DEFAULT_TOKEN_BUDGET,
+    model: str = DEFAULT_QA_MODEL,
+    cache: Optional[TokenCache] = None,
+    value: Optional[Callable[[str], float]] = None,
+) -> PackedContext:
+    """Greedily packs `segments` into `budget` tokens.
+
+    Args:
+        segments: The candidate segments, most valuable first, e.g. from \
+            [`top_segments_by_relevance`](ntfp.html#ntfp.ntfp.top_segments_by_relevance).
+        budget: The most context tokens to pack. (Default = 512).
+        model: The model whose tokenizer counts the tokens.
+        cache: A [`TokenCache`](token_cache.html#ntfp.token_cache.TokenCache) \
+            to count with. (Default = `shared_cache`).
+        value: Ranks the sentences of a segment that must be cut down; \
+            the best that fit are kept, in their original order. \
+            (Default = keep the first sentences that fit).
+
+    Returns:
+        A [`PackedContext`](#ntfp.packing.PackedContext).
+    """  # noqa
+    cache = cache if cache is not None else shared_cache
+    packed: List[str] = []
+    dropped: List[int] = []
+    truncated: List[int] = []
+    used = 0
+    for index, segment in enumerate(segments):
+        tokens = count_tokens(segment, model, cache)
+        if used + tokens <= budget:
+            packed.append(segment)
+            used += tokens
+            continue
+        sentences = split_sentences(segment)
+        counts = [count_tokens(s, model, cache) for s in sentences]
+        order = list(range(len(sentences)))
+        if value is not None:
+            order.sort(key=lambda i: -value(sentences[i]))
+        kept = []
+        for i in order:
+            if used + counts[i] <= budget:
+                kept.append(i)
+                used += counts[i]
+        if kept:
+            packed.append(" ".join(sentences[i] for i in sorted(kept)))
+            truncated.append(index)
+        else:
+            dropped.append(index)
+    return PackedContext(packed, used, dropped, truncated)
+
+
+def rank_segments(segments: Sequence[str], score: Callable[[str], float]) -> List[int]:
+    """The indices of the segments, highest `score` first. Ties keep their order."""
+    scores = [score(segment) for segment in segments]
+    return sorted(range(len(segments)), key=lambda i: -scores[i])
+
+
+def pack(
+    question: Question,
+    context: Context,
+    sep: str = "\n",
+    budget: int = DEFAULT_TOKEN_BUDGET,
+    model: str = DEFAULT_QA_MODEL,
+    cache: Optional[TokenCache] = None,
+    score: Optional[Callable[[str], float]] = None,
+) -> Tuple[Context, PackedContext]:
+    """Packs the `sep` separated segments of a context, highest scored first, \
+        cutting segments down to their sentences most like the question.
+
+    Args:
+        score: Scores each segment, e.g. \
+            [`relevance_to`](#ntfp.packing.relevance_to) the question. \
+            (Default = the segments are already best first, e.g. from \
+            [`top_segments_by_relevance`](ntfp.html#ntfp.ntfp.top_segments_by_relevance)).
+
+    Returns:
+        The packed context, highest scored first, and its \
+            [`PackedContext`](#ntfp.packing.PackedContext), whose indices \
+            are those of the segments in `context`.
+    """  # noqa
+    segments = context.split(sep) if context else []
+    with stage("pack"):
+        order = list(range(len(segments)))
+        if score is not None:
+            order = rank_segments(segments, score)
+        packed = pack_context(
+            [segments[i] for i in order],
+            budget=budget,
+            model=model,
+            cache=cache,
+            value=relevance_to(question),
+        )
+    packed = packed._replace(
+        dropped=[order[i] for i in packed.dropped],
+        truncated=[order[i] for i in packed.truncated],
+    )
+    return Context(sep.join(packed.segments)), packed
+
+
+def record_packing(extra_data: ExtraDataDict, packed: PackedContext) -> ExtraDataDict:
+    """Adds `packed_tokens` and `dropped_segments` to `extra_data`."""
+    extra_data["packed_tokens"] = packed.tokens
+    extra_data["dropped_segments"] = packed.dropped
+    return extra_data
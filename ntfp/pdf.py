@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Bounded-memory PDF text extraction for \
+    [`get_page`](ntfp.html#ntfp.ntfp.get_page).
+
+[//]: # (markdown comment # noqa)
+
+A PDF is streamed to a temporary file, never held in memory as a whole,
+and its text is extracted page by page in a separate process pool. Every
+document gets a page limit, a time limit and a memory limit, so one huge
+syllabus or catalog can neither block nor bloat the process that serves
+questions. Whatever pages were extracted before a limit was hit are kept.
+With a [`Deadline`](deadline.html#ntfp.deadline.Deadline) the download and
+the extraction together take no longer than it allows.
+
+Extracted text is cached on disk by the sha256 of the PDF bytes, but only
+when the extraction finished: a timed out, crashed or empty extraction may
+do better next time.
+
+The text is returned as a simple HTML
+[`WebPage`](ntfp_types.html#ntfp.ntfp_types.WebPage), one `<p>` per line,
+so it flows through [`extract_relevant_context`](ntfp.html#ntfp.ntfp.extract_relevant_context)
+like any other page.
+
+Resources:
+    * [pdfminer.six][1]
+    * [resource.setrlimit][2]
+
+[1]: https://pdfminersix.readthedocs.io/en/latest/
+[2]: https://docs.python.org/3/library/resource.html#resource.setrlimit
+"""
+import hashlib
+import html
+import math
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+from requests import Session, get
+from typing_extensions import Final
+
+from ntfp.deadline import NO_DEADLINE, Deadline
+from ntfp.ntfp_types import URL, WebPage
+
+try:
+    import resource
+except ImportError:  # Windows has no resource limits
+    resource = None
+
+MAX_PDF_BYTES: Final[int] = 20 * 2 ** 20
+"""Larger downloads are abandoned."""
+
+MAX_PDF_PAGES: Final[int] = 50
+PDF_TIMEOUT_SECONDS: Final[int] = 20
+PDF_MEMORY_LIMIT_BYTES: Final[int] = 512 * 2 ** 20
+PDF_WORKERS: Final[int] = 2
+
+PDF_GRACE_SECONDS: Final[int] = 5
+"""How much longer than its own time limit a worker is waited for, \
+    without a deadline."""
+
+PDF_CACHE_DIR: Final[str] = os.path.join(
+    os.path.expanduser("~"), ".cache", "ntfp", "pdf"
+)
+
+PDF_MAGIC: Final[bytes] = b"%PDF"
+"""How every PDF file starts, unlike e.g. an HTML error page."""
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class _PdfTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _PdfTimeout()
+
+
+def extract_pdf_pages(
+    path: str,
+    max_pages: int = MAX_PDF_PAGES,
+    timeout: int = PDF_TIMEOUT_SECONDS,
+    memory_limit: int = PDF_MEMORY_LIMIT_BYTES,
+) -> Tuple[List[str], bool]:
+    """Extracts the text of each page. Runs inside a pool process, \
+        or in the main thread of a process that may take the limits.
+
+    The memory limit and the alarm handler are restored afterwards.
+
+    Returns:
+        The text of every page extracted before any limit was reached, \
+            and whether the extraction finished without hitting one.
+    """
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            memory_limit = min(memory_limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+    if hasattr(signal, "SIGALRM"):
+        handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+    pages: List[str] = []
+    complete = False
+    try:
+        for layout in extract_pages(path, maxpages=max_pages):
+            texts = [e.get_text() for e in layout if isinstance(e, LTTextContainer)]
+            pages.append("".join(texts))
+        complete = True
+    except Exception:
+        # _PdfTimeout, MemoryError or a damaged PDF
+        # ASSUME: the pages extracted so far are better than no pages
+        pass
+    finally:
+        if hasattr(signal, "SIGALRM"):
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, handler)
+        if resource is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    return pages, complete
+
+
+def _seconds_left(deadline: Deadline, limit: float) -> float:
+    remaining = deadline.remaining()
+    return limit if remaining is None else min(limit, remaining)
+
+
+def download_pdf(
+    url: URL,
+    max_bytes: int = MAX_PDF_BYTES,
+    session: Optional[Session] = None,
+    deadline: Deadline = NO_DEADLINE,
+) -> Optional[Tuple[str, str]]:
+    """Streams a PDF into a temporary file, hashing it along the way.
+
+    Args:
+        url: The [`URL`](ntfp_types.html#ntfp.ntfp_types.URL) of the PDF.
+        max_bytes: Larger PDFs are abandoned. (Default = `MAX_PDF_BYTES`).
+        session: An optional `requests.Session` to reuse its connections.
+        deadline: The [`Deadline`](deadline.html#ntfp.deadline.Deadline) \
+            of the whole download. (Default = no deadline).
+
+    Returns:
+        A tuple of (temporary file path, sha256 hex digest), \
+            or `None` when the PDF is larger than `max_bytes` \
+            or the response is not a PDF.
+
+    Raises:
+        requests.HTTPError: When the response has an error status.
+        TimeoutError: When the deadline expired before the download finished.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    is_pdf = True
+    expired = False
+    if deadline.expired():
+        raise TimeoutError(f"no time left to download {url}")
+    request = session.get if session is not None else get
+    timeout = _seconds_left(deadline, PDF_TIMEOUT_SECONDS)
+    with request(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            for block in response.iter_content(chunk_size=64 * 1024):
+                if deadline.expired():
+                    expired = True
+                    break
+                if size == 0 and not block.startswith(PDF_MAGIC):
+                    is_pdf = False
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    break
+                sha.update(block)
+                f.write(block)
+    if expired or size > max_bytes or not is_pdf or size == 0:
+        os.remove(f.name)
+        if expired:
+            raise TimeoutError(f"{url} did not download before the deadline")
+        return None
+    return f.name, sha.hexdigest()
+
+
+def pdf_to_webpage(pages: List[str]) -> WebPage:
+    """Wraps the text of each PDF line in a `<p>` of a minimal HTML page."""
+    paragraphs = [
+        f"<p>{html.escape(line.strip())}</p>"
+        for page in pages
+        for line in page.splitlines()
+        if line.strip()
+    ]
+    return WebPage(f"<html><body>{''.join(paragraphs)}</body></html>")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Forgets a broken pool, unless another thread already replaced it."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def _cache_pages(cache_path: str, pages: List[str], complete: bool) -> WebPage:
+    """Caches the text of a finished, non-empty extraction; returns its page."""
+    if not complete or not any(page.strip() for page in pages):
+        return pdf_to_webpage(pages)
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    partial_path = f"{cache_path}.partial"
+    with open(partial_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(pages))
+    os.replace(partial_path, cache_path)
+    return pdf_to_webpage(pages)
+
+
+def get_pdf_page(
+    url: URL,
+    verbose: bool = False,
+    session: Optional[Session] = None,
+    deadline: Deadline = NO_DEADLINE,
+    in_process: bool = False,
+) -> WebPage:
+    """Returns the text of a PDF at `url` as a \
+        [`WebPage`](ntfp_types.html#ntfp.ntfp_types.WebPage).
+
+    Returns an empty WebPage when the PDF is too large or cannot be read,
+    or when the deadline expires while its text is extracted.
+
+    With `in_process` the text is extracted in the calling process, with the
+    same limits, instead of the pool. A daemonic pool worker, e.g. one of
+    [`ingest`](ingest.html#ntfp.ingest.ingest)'s, cannot start the pool.
+
+    Raises:
+        requests.HTTPError: When the response has an error status.
+        TimeoutError: When the deadline expired before the download finished.
+    """
+    downloaded = download_pdf(url, session=session, deadline=deadline)
+    if downloaded is None:
+        if verbose:
+            print("skipping PDF larger than MAX_PDF_BYTES or not a PDF...")
+        return WebPage("")
+    path, sha = downloaded
+    cache_path = os.path.join(PDF_CACHE_DIR, f"{sha}.txt")
+    try:
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return pdf_to_webpage([f.read()])
+        seconds = _seconds_left(deadline, PDF_TIMEOUT_SECONDS)
+        if seconds <= 0:
+            return WebPage("")
+        if in_process:
+            pages, complete = extract_pdf_pages(path, timeout=math.ceil(seconds))
+            return _cache_pages(cache_path, pages, complete)
+        grace = PDF_GRACE_SECONDS if deadline.remaining() is None else 0
+        pool = _get_pool()
+        try:
+            # the worker's alarm only counts whole seconds
+            future = pool.submit(extract_pdf_pages, path, timeout=math.ceil(seconds))
+            pages, complete = future.result(timeout=seconds + grace)
+        except FutureTimeoutError:
+            if verbose:
+                print("PDF extraction timed out && returning empty WebPage...")
+            return WebPage("")
+        except BrokenProcessPool:
+            # the worker died, e.g. killed for using too much memory
+            _discard_pool(pool)
+            if verbose:
+                print("PDF extraction crashed && returning empty WebPage...")
+            return WebPage("")
+        return _cache_pages(cache_path, pages, complete)
+    finally:
+        os.remove(path)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""A pool of forked processes that run \
+    [`transformer`](ntfp.html#ntfp.ntfp.transformer) in parallel.
+
+[//]: # (markdown comment # noqa)
+
+The question-answering model is loaded once in the parent process and its
+weights are moved to shared memory, so every forked worker reads the very
+same pages instead of holding its own copy of the model.
+
+Each worker limits torch to its share of the CPU cores so that N workers
+do not oversubscribe the machine. The parent hands each question to an idle
+worker through that worker's own pipe, recording the assignment first, so
+it always knows which question a worker holds.
+
+A worker that dies, e.g. killed for using too much memory, fails the
+question it was answering with an
+[`NtfpWorkerError`](#ntfp.pool.NtfpWorkerError); once no worker is left,
+every outstanding and later question fails the same way instead of hanging.
+
+Example:
+    >>> with InferencePool(workers=4) as pool:
+    ...     futures = [pool.submit(q, c) for q, c in questions_and_contexts]
+    ...     answers = [f.result() for f in futures]
+    ...     pool.metrics()
+    {'workers': 4, 'submitted': 100, 'completed': 100, 'failed': 0, ...}
+
+Create the pool before running any inference in the parent process,
+since forking a process that has already started torch's thread pool
+is not safe.
+
+Resources:
+    * [torch.set_num_threads][1]
+    * [torch.nn.Module.share_memory][2]
+
+[1]: https://pytorch.org/docs/stable/generated/torch.set_num_threads.html
+[2]: https://pytorch.org/docs/stable/generated/torch.nn.Module.html#torch.nn.Module.share_memory
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import torch
+
+from ntfp.models import DEFAULT_QA_MODEL, load_pipeline
+from ntfp.ntfp_types import Answer, Context, ExtraDataDict, Question
+
+_DONE = "done"
+_FAILED = "failed"
+
+
+class NtfpWorkerError(Exception):
+    """A pool worker raised an exception while answering a question.
+
+    Attributes:
+        question -- the question that failed.
+        message -- the exception raised inside the worker.
+    """
+
+    def __init__(self, question, message):
+        super().__init__(message)
+        self.question = question
+        self.message = message
+
+
+def default_threads_per_worker(workers: int) -> int:
+    """Splits the CPU cores evenly between the workers, at least one each."""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _worker_loop(model, quantize, threads, tasks: Connection, results) -> None:
+    # imported here, since ntfp.ntfp itself takes an optional pool
+    from ntfp.ntfp import transformer
+
+    torch.set_num_threads(threads)
+    while True:
+        try:
+            task = tasks.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        task_id, question, context = task
+        try:
+            # load_pipeline is cached, so this is the model the parent loaded
+            value = transformer(question, context, model=model, quantize=quantize)
+        except Exception as e:
+            results.put((_FAILED, task_id, repr(e)))
+        else:
+            results.put((_DONE, task_id, value))
+
+
+class InferencePool:
+    """Runs [`transformer`](ntfp.html#ntfp.ntfp.transformer) in N forked workers.
+
+    Args:
+        workers: The number of worker processes. (Default = number of CPUs).
+        model: A question-answering model name.
+        quantize: Use the int8 quantized model. (Default = False).
+        threads_per_worker: torch intra-op threads of each worker. \
+            (Default = number of CPUs // workers).
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        model: str = DEFAULT_QA_MODEL,
+        quantize: bool = False,
+        threads_per_worker: Optional[int] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.model = model
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(
+            self.workers
+        )
+        nlp = load_pipeline(model=model, quantize=quantize)
+        nlp.model.share_memory()
+        context = multiprocessing.get_context("fork")
+        self._results = context.SimpleQueue()
+        self._processes = []
+        self._tasks: List[Connection] = []
+        for _ in range(self.workers):
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_worker_loop,
+                args=(model, quantize, self.threads_per_worker, reader, self._results),
+                daemon=True,
+            )
+            process.start()
+            # only the worker reads, so a send to a dead one fails at once
+            reader.close()
+            self._processes.append(process)
+            self._tasks.append(writer)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._futures: Dict[int, Tuple[Future, Question, float]] = {}
+        self._queued: Deque[Tuple[int, Question, Context]] = deque()
+        self._idle = list(range(self.workers))
+        self._running: Dict[int, int] = {}  # task id -> worker index
+        self._live = {p.sentinel: i for i, p in enumerate(self._processes)}
+        self._closing = False
+        self._next_id = 0
+        self._started_at = time.perf_counter()
+        self._counts = {"submitted": 0, "started": 0, "completed": 0, "failed": 0}
+        self._total_latency = 0.0
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def _dispatch(self) -> None:
+        """Hands queued questions to idle workers, recording who holds which."""
+        while True:
+            with self._lock:
+                if not (self._queued and self._idle):
+                    return
+                index = self._idle.pop()
+                task = self._queued.popleft()
+                self._running[task[0]] = index
+                self._counts["started"] += 1
+            try:
+                self._tasks[index].send(task)
+            except OSError:
+                pass  # the worker died, and _watch fails its question
+
+    def _collect(self) -> None:
+        while True:
+            event, task_id, value = self._results.get()
+            if event is None:
+                return
+            with self._lock:
+                index = self._running.pop(task_id, None)
+                if index is not None and index in self._live.values():
+                    self._idle.append(index)
+                entry = self._futures.pop(task_id, None)
+                self._changed.notify_all()
+                if entry is None:
+                    continue  # already failed when its worker died
+                future, question, submitted_at = entry
+                self._total_latency += time.perf_counter() - submitted_at
+                self._counts["completed" if event == _DONE else "failed"] += 1
+            self._dispatch()
+            if event == _DONE:
+                future.set_result(value)
+            else:
+                future.set_exception(NtfpWorkerError(question, value))
+
+    def _watch(self) -> None:
+        """Fails the questions of workers that die, all of them once none live."""
+        while True:
+            with self._lock:
+                sentinels = list(self._live)
+            if not sentinels:
+                return
+            for sentinel in wait(sentinels):
+                failed = []
+                with self._lock:
+                    index = self._live.pop(sentinel)
+                    if index in self._idle:
+                        self._idle.remove(index)
+                    self._changed.notify_all()
+                    if self._closing:
+                        continue
+                    process = self._processes[index]
+                    process.join()  # already exited, this sets its exitcode
+                    message = f"worker {process.pid} died ({process.exitcode})"
+                    if self._live:
+                        task_ids = [
+                            task_id
+                            for task_id, worker in self._running.items()
+                            if worker == index
+                        ]
+                    else:
+                        task_ids = list(self._futures)
+                        self._queued.clear()
+                    failed = [(self._futures.pop(i), message) for i in task_ids]
+                    for task_id in task_ids:
+                        self._running.pop(task_id, None)
+                    self._counts["failed"] += len(failed)
+                    self._changed.notify_all()
+                for (future, question, _), message in failed:
+                    future.set_exception(NtfpWorkerError(question, message))
+
+    def submit(self, question: Question, context: Context) -> Future:
+        """Queues a question for the next idle worker.
+
+        Returns:
+            A `Future` of the (Answer, ExtraDataDict) tuple. It fails with \
+                an [`NtfpWorkerError`](#ntfp.pool.NtfpWorkerError) when \
+                no worker is alive.
+        """
+        future: Future = Future()
+        with self._lock:
+            if not self._live:
+                future.set_exception(NtfpWorkerError(question, "no live workers"))
+                return future
+            task_id = self._next_id
+            self._next_id += 1
+            self._futures[task_id] = (future, question, time.perf_counter())
+            self._queued.append((task_id, question, context))
+            self._counts["submitted"] += 1
+        self._dispatch()
+        return future
+
+    def transformer(self, q: Question, c: Context) -> Tuple[Answer, ExtraDataDict]:
+        """A drop-in, blocking replacement of \
+            [`transformer`](ntfp.html#ntfp.ntfp.transformer) backed by the pool.
+        """
+        return self.submit(q, c).result()
+
+    def map(
+        self, pairs: Iterable[Tuple[Question, Context]]
+    ) -> List[Tuple[Answer, ExtraDataDict]]:
+        """Answers every (question, context) pair, keeping their order."""
+        futures = [self.submit(q, c) for q, c in pairs]
+        return [f.result() for f in futures]
+
+    def metrics(self) -> Dict[str, float]:
+        """Throughput and queue metrics since the pool started.
+
+        Returns:
+            A dict with the keys `workers`, `threads_per_worker`, `submitted`, \
+                `completed`, `failed`, `queued` (waiting for a worker), \
+                `busy` (being answered), `uptime_s`, `throughput_qps` \
+                and `mean_latency_s` (from submit to result).
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            total_latency = self._total_latency
+        finished = counts["completed"] + counts["failed"]
+        uptime = time.perf_counter() - self._started_at
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "submitted": counts["submitted"],
+            "completed": counts["completed"],
+            "failed": counts["failed"],
+            "queued": counts["submitted"] - counts["started"],
+            "busy": counts["started"] - finished,
+            "uptime_s": uptime,
+            "throughput_qps": finished / uptime if uptime > 0 else 0.0,
+            "mean_latency_s": total_latency / finished if finished else 0.0,
+        }
+
+    def close(self) -> None:
+        """Lets the workers finish the queued questions, then stops them."""
+        with self._lock:
+            self._changed.wait_for(lambda: not self._futures or not self._live)
+            self._closing = True
+        for tasks in self._tasks:
+            try:
+                tasks.send(None)
+            except OSError:
+                pass  # already dead
+            tasks.close()
+        for process in self._processes:
+            process.join()
+        self._results.put((None, None, None))
+        self._collector.join()
+        self._watcher.join()
+
+    def __enter__(self) -> "InferencePool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
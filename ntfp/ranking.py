@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Ranks Google result URLs before any of their pages is downloaded.
+
+[//]: # (markdown comment # noqa)
+
+Fetching the result pages costs most of the bandwidth, and on the slow path
+most of the latency, of a question, yet many results are useless: images,
+archives, or pages that share nothing with the question.
+[`rank_results`](#ntfp.ranking.rank_results) scores every
+[`GoogleResult`](ntfp_types.html#ntfp.ntfp_types.GoogleResult) from what is
+known before it is downloaded, weighted by `WEIGHTS`:
+
+* `text`: the share of the question's terms in its title and snippet,
+* `path`: the share of the question's terms in its URL path, \
+  e.g. `/faculty/foaad/`,
+* `rank`: Google's own rank of it,
+* `host`: how often the pages of its host held the answer before, \
+  see [`host_yield`](#ntfp.ranking.host_yield),
+
+times how useful its file type usually is. A file type that
+[`get_page`](ntfp.html#ntfp.ntfp.get_page) cannot read, e.g. `.jpg` or
+`.zip`, scores 0 and is never fetched.
+
+The score is the expected yield of fetching the page: pages are fetched
+best first, and none below `DEFAULT_MIN_YIELD`.
+
+The host yields come from the yield log, one CSV line per fetched page
+with its host and whether it held the final answer. `main.py` appends to
+it with [`record_yields`](#ntfp.ranking.record_yields), like it appends to
+`data.csv`.
+
+Example:
+    >>> yields = load_yields()
+    >>> for score, result in rank_results(question, results, yields):
+    ...     print(f"{score:.2f}", result.url)
+    0.81 https://cpe.calpoly.edu/faculty/foaad/
+    0.34 https://digitalcommons.calpoly.edu/cgi/viewcontent.cgi?article=1&context=csse
+    0.00 https://www.calpoly.edu/logo.png
+"""
+import csv
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from typing_extensions import Final
+
+from ntfp.ntfp_types import GoogleResult, GoogleResults, Question, URL
+from ntfp.store import terms
+
+WEIGHTS: Final[Dict[str, float]] = {
+    "text": 0.4,
+    "path": 0.15,
+    "rank": 0.15,
+    "host": 0.3,
+}
+"""How much each feature counts, summing to 1."""
+
+DEFAULT_MIN_YIELD: Final[float] = 0.2
+"""Result pages scoring below this are not worth downloading."""
+
+SKIPPED_FILE_TYPES: Final[frozenset] = frozenset(
+    "jpg jpeg png gif svg webp ico bmp tif tiff mp3 mp4 m4a mov avi wav "
+    "zip gz tgz tar rar 7z exe dmg iso doc docx ppt pptx xls xlsx ics "
+    "css js json xml".split()
+)
+"""File types whose text [`get_page`](ntfp.html#ntfp.ntfp.get_page) cannot read."""
+
+PDF_WEIGHT: Final[float] = 0.7
+"""PDFs often hold the answer, but are slow to download and to parse."""
+
+HOST_PRIOR: Final[float] = 0.3
+"""The yield assumed of a host never fetched before."""
+
+PRIOR_STRENGTH: Final[float] = 2.0
+"""How many fetches the prior counts as, so one lucky page is not trusted."""
+
+DEFAULT_YIELD_LOG: Final[str] = os.path.join(
+    os.path.expanduser("~"), ".cache", "ntfp", "yield.csv"
+)
+
+HostYields = Dict[str, Tuple[int, int]]
+"""The (fetched, answered) page counts of each host."""
+
+_EXTENSION = re.compile(r"\.([a-z0-9]{1,5})$")
+_log_lock = threading.Lock()
+
+
+def host(url: str) -> str:
+    """The host of the URL, without a `www.`."""
+    netloc = urlparse(url).netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def file_type(url: str) -> str:
+    """The lowercase extension of the URL's path, e.g. `"pdf"`, or `""`."""
+    match = _EXTENSION.search(urlparse(url).path.lower())
+    return match.group(1) if match else ""
+
+
+def file_type_weight(url: str) -> float:
+    """0 for a file type that cannot be read, `PDF_WEIGHT` for a PDF, else 1."""
+    kind = file_type(url)
+    if kind in SKIPPED_FILE_TYPES:
+        return 0.0
+    return PDF_WEIGHT if kind == "pdf" else 1.0
+
+
+def host_yield(name: str, yields: Optional[HostYields] = None) -> float:
+    """The share of the host's fetched pages that held the answer, \
+        pulled towards `HOST_PRIOR` while it has few fetches."""
+    fetched, answered = (yields or {}).get(name, (0, 0))
+    return (answered + HOST_PRIOR * PRIOR_STRENGTH) / (fetched + PRIOR_STRENGTH)
+
+
+def _overlap(question_terms: frozenset, text: str) -> float:
+    if not question_terms:
+        return 0.0
+    return len(question_terms.intersection(terms(text))) / len(question_terms)
+
+
+def score_result(
+    question_terms: frozenset,
+    result: GoogleResult,
+    position: int,
+    yields: Optional[HostYields] = None,
+) -> float:
+    """The expected yield of fetching the result's page.
+
+    Args:
+        question_terms: The [`terms`](store.html#ntfp.store.terms) of the question.
+        result: The [`GoogleResult`](ntfp_types.html#ntfp.ntfp_types.GoogleResult).
+        position: Its 0-based rank on the Google page.
+        yields: The [`load_yields`](#ntfp.ranking.load_yields) of every host.
+    """  # noqa
+    weight = file_type_weight(result.url)
+    if weight == 0.0:
+        return 0.0
+    features = {
+        "text": _overlap(question_terms, f"{result.title} {result.snippet}"),
+        "path": _overlap(question_terms, unquote(urlparse(result.url).path)),
+        "rank": 1.0 / (1 + position),
+        "host": host_yield(host(result.url), yields),
+    }
+    return weight * sum(WEIGHTS[name] * value for name, value in features.items())
+
+
+def rank_results(
+    question: Question, results: GoogleResults, yields: Optional[HostYields] = None
+) -> List[Tuple[float, GoogleResult]]:
+    """Every result with its [`score_result`](#ntfp.ranking.score_result), \
+        best first. Equal scores keep Google's order.
+    """
+    question_terms = frozenset(terms(question))
+    scored = [
+        (score_result(question_terms, result, position, yields), result)
+        for position, result in enumerate(results)
+    ]
+    return sorted(scored, key=lambda scored_result: -scored_result[0])
+
+
+def page_yields(
+    pages: Iterable[Tuple[URL, str]], answer: str
+) -> List[Tuple[str, bool]]:
+    """The host of each fetched page and whether its context holds the answer."""
+    needle = answer.strip().lower()
+    return [(host(url), bool(needle) and needle in text.lower()) for url, text in pages]
+
+
+@lru_cache(maxsize=8)
+def _read_yields(path: str, mtime_ns: int, size: int) -> HostYields:
+    counts: Dict[str, List[int]] = {}
+    with open(path, "r", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) != 2:
+                continue
+            name, answered = row
+            fetched_answered = counts.setdefault(name, [0, 0])
+            fetched_answered[0] += 1
+            fetched_answered[1] += answered == "1"
+    return {name: (fetched, answered) for name, (fetched, answered) in counts.items()}
+
+
+def load_yields(path: str = DEFAULT_YIELD_LOG) -> HostYields:
+    """The (fetched, answered) counts of every host in the yield log.
+
+    The log is only read again after it changed. A missing log has no hosts.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    return _read_yields(path, stat.st_mtime_ns, stat.st_size)
+
+
+def record_yields(
+    yields: Iterable[Tuple[str, bool]], path: str = DEFAULT_YIELD_LOG
+) -> None:
+    """Appends the (host, answered) of fetched pages to the yield log."""
+    lines = "".join(f"{name},{int(answered)}\n" for name, answered in yields)
+    if not lines:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _log_lock, open(path, "a") as f:
+        f.write(lines)
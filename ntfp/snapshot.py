@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""A precomputed binary snapshot of a segmented corpus such as `clubs.txt`.
+
+[//]: # (markdown comment # noqa)
+
+Everything derived from the corpus text is computed once by
+[`build_snapshot`](#ntfp.snapshot.build_snapshot) and written to one file
+next to it (e.g. `clubs.txt.snapshot`):
+
+* the normalized text of every segment and its byte offsets,
+* the token ids and character spans of every segment for one tokenizer, \
+    as [`TokenCache`](token_cache.html#ntfp.token_cache.TokenCache) holds them,
+* an inverted index from each term to the segments containing it.
+
+[`load_snapshot`](#ntfp.snapshot.load_snapshot) memory-maps the file and
+views every section in place with `memoryview.cast`, so loading costs a
+checksum of the source and nothing else. A snapshot built from a different
+version of the source, separator or tokenizer, or written in another
+format version, is rejected and `None` is returned instead.
+
+spaCy only ever runs on the question (see
+[`relevance_score`](ntfp.html#ntfp.ntfp.relevance_score)), never on a
+segment, so no entities are stored for the segments.
+
+File layout (little-endian):
+
+    magic "NTFPSNAP" | version u32 | sha256 of source (32 bytes) | meta length u32
+    meta JSON: separator, tokenizer, {section name: [offset, bytes, typecode]}
+    sections, each 8-byte aligned
+
+Example:
+    >>> build_snapshot("clubs.txt")
+    'clubs.txt.snapshot'
+    >>> snapshot = load_snapshot("clubs.txt")
+    >>> snapshot.candidates("who advises CSAI?")[:3]
+    [0, 57, 101]
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from typing_extensions import Final
+
+from ntfp.corpus import Corpus
+from ntfp.models import DEFAULT_QA_MODEL, load_pipeline
+from ntfp.store import normalize_text, terms
+from ntfp.token_cache import TokenCache, TokenizedSegment, tokenize_segment
+
+SNAPSHOT_MAGIC: Final[bytes] = b"NTFPSNAP"
+SNAPSHOT_VERSION: Final[int] = 2
+SNAPSHOT_SUFFIX: Final[str] = ".snapshot"
+
+_HEADER = struct.Struct("<8sI32sI")  # magic, version, sha256, len(meta)
+_ALIGN = 8
+
+
+def source_checksum(path: str) -> bytes:
+    """The sha256 digest of a file, read in blocks."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            sha.update(block)
+    return sha.digest()
+
+
+def _pairs(sizes: Iterable[int]) -> array:
+    """The flattened (start, end) offsets of consecutive runs of `sizes`."""
+    offsets = array("Q")
+    end = 0
+    for size in sizes:
+        offsets.extend((end, end + size))
+        end += size
+    return offsets
+
+
+def build_snapshot(
+    path: str,
+    sep: str = "\n\n\n",
+    model: str = DEFAULT_QA_MODEL,
+    snapshot_path: Optional[str] = None,
+) -> str:
+    """Computes and writes the snapshot of the corpus at `path`.
+
+    Args:
+        path: The corpus text file.
+        sep: The separator between segments. (Default = `"\\n\\n\\n"`).
+        model: The model whose tokenizer the token ids are for.
+        snapshot_path: (Default = `path` + `".snapshot"`).
+
+    Returns:
+        The path of the written snapshot.
+    """
+    snapshot_path = snapshot_path or f"{path}{SNAPSHOT_SUFFIX}"
+    checksum = source_checksum(path)
+    with Corpus(path, sep=sep) as corpus:
+        texts = [normalize_text(segment) for segment in corpus]
+    tokenizer = load_pipeline(model=model).tokenizer
+    encoded = [text.encode("utf-8") for text in texts]
+    tokens = [tokenize_segment(tokenizer, text) for text in texts]
+    postings: Dict[str, List[int]] = defaultdict(list)
+    for index, text in enumerate(texts):
+        for term in sorted(set(terms(text))):
+            postings[term].append(index)
+    vocab = sorted(postings)
+    encoded_vocab = [term.encode("utf-8") for term in vocab]
+
+    sections: Dict[str, Tuple[str, object]] = {
+        "text_offsets": ("Q", _pairs(len(b) for b in encoded)),
+        "text": ("B", b"".join(encoded)),
+        "token_offsets": ("Q", _pairs(len(t.token_ids) for t in tokens)),
+        "token_ids": ("I", array("I", [i for t in tokens for i in t.token_ids])),
+        "token_starts": ("I", array("I", [i for t in tokens for i in t.starts])),
+        "token_ends": ("I", array("I", [i for t in tokens for i in t.ends])),
+        "vocab_offsets": ("Q", _pairs(len(b) for b in encoded_vocab)),
+        "vocab": ("B", b"".join(encoded_vocab)),
+        "posting_offsets": ("Q", _pairs(len(postings[t]) for t in vocab)),
+        "postings": ("I", array("I", [i for t in vocab for i in postings[t]])),
+    }
+    blobs = {name: bytes(data) for name, (_, data) in sections.items()}
+
+    def layout(meta_len: int) -> Dict[str, List]:
+        offset = _HEADER.size + meta_len
+        table = {}
+        for name, (typecode, _) in sections.items():
+            offset += -offset % _ALIGN
+            table[name] = [offset, len(blobs[name]), typecode]
+            offset += len(blobs[name])
+        return table
+
+    # the meta JSON holds the offsets, which depend on the meta JSON's length
+    meta_len = 0
+    while True:
+        meta = {"sep": sep, "tokenizer": model, "sections": layout(meta_len)}
+        meta_bytes = json.dumps(meta, sort_keys=True).encode("utf-8")
+        if len(meta_bytes) == meta_len:
+            break
+        meta_len = len(meta_bytes)
+
+    partial_path = f"{snapshot_path}.partial"
+    with open(partial_path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, checksum, meta_len))
+        f.write(meta_bytes)
+        for name, (offset, _, _) in meta["sections"].items():
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(blobs[name])
+    os.replace(partial_path, snapshot_path)
+    return snapshot_path
+
+
+class Snapshot:
+    """Zero-copy views of a snapshot file. See [`load_snapshot`](#ntfp.snapshot.load_snapshot)."""  # noqa
+
+    def __init__(self, data: mmap.mmap, meta: Dict):
+        self._data = data
+        self.sep: str = meta["sep"]
+        self.tokenizer: str = meta["tokenizer"]
+        self._view = memoryview(data)
+        self._sections = {
+            name: self._view[offset : offset + size].cast(typecode)
+            for name, (offset, size, typecode) in meta["sections"].items()
+        }
+
+    def _range(self, name: str, i: int) -> Tuple[int, int]:
+        offsets = self._sections[name]
+        return offsets[2 * i], offsets[2 * i + 1]
+
+    def __len__(self) -> int:
+        return len(self._sections["text_offsets"]) // 2
+
+    def __getitem__(self, i: int) -> str:
+        """The normalized text of the `i`th segment."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("snapshot segment index out of range")
+        start, end = self._range("text_offsets", i)
+        return bytes(self._sections["text"][start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+    def segments(self, indices: Iterable[int]) -> List[str]:
+        return [self[i] for i in indices]
+
+    def tokens(self, i: int) -> TokenizedSegment:
+        """The cached tokens of the `i`th segment."""
+        start, end = self._range("token_offsets", i)
+        return TokenizedSegment(
+            self._sections["token_ids"][start:end].tolist(),
+            self._sections["token_starts"][start:end].tolist(),
+            self._sections["token_ends"][start:end].tolist(),
+        )
+
+    def _term_id(self, term: str) -> Optional[int]:
+        """Binary searches the sorted vocabulary without decoding it."""
+        key = term.encode("utf-8")
+        vocab = self._sections["vocab"]
+        lo, hi = 0, len(self._sections["vocab_offsets"]) // 2
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = self._range("vocab_offsets", mid)
+            candidate = bytes(vocab[start:end])
+            if candidate == key:
+                return mid
+            if candidate < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def candidates(self, question: str) -> List[int]:
+        """The segments sharing a term with the question, most shared first."""
+        matched: Counter = Counter()
+        for term in set(terms(question)):
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            start, end = self._range("posting_offsets", term_id)
+            matched.update(self._sections["postings"][start:end].tolist())
+        return [i for i, _ in sorted(matched.items(), key=lambda m: (-m[1], m[0]))]
+
+    def fill_token_cache(self, cache: TokenCache, indices: Iterable[int]) -> None:
+        """Puts the precomputed tokens of the segments at `indices` in `cache`."""
+        for i in indices:
+            cache.put(self.tokenizer, self[i], self.tokens(i))
+
+    def close(self) -> None:
+        for section in self._sections.values():
+            section.release()
+        self._view.release()
+        self._data.close()
+
+
+def load_snapshot(
+    path: str,
+    sep: str = "\n\n\n",
+    model: str = DEFAULT_QA_MODEL,
+    snapshot_path: Optional[str] = None,
+) -> Optional[Snapshot]:
+    """Maps the snapshot of the corpus at `path`, if it is still valid.
+
+    Returns:
+        The [`Snapshot`](#ntfp.snapshot.Snapshot), or `None` when there is \
+            none or it was built from another source, separator, tokenizer \
+            or format version.
+    """
+    snapshot_path = snapshot_path or f"{path}{SNAPSHOT_SUFFIX}"
+    try:
+        with open(snapshot_path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None  # missing or empty
+    if len(data) < _HEADER.size:
+        data.close()
+        return None
+    magic, version, checksum, meta_len = _HEADER.unpack_from(data)
+    if (magic, version) != (SNAPSHOT_MAGIC, SNAPSHOT_VERSION) or (
+        checksum != source_checksum(path)
+    ):
+        data.close()
+        return None
+    meta = json.loads(data[_HEADER.size : _HEADER.size + meta_len].decode("utf-8"))
+    if (meta["sep"], meta["tokenizer"]) != (sep, model):
+        data.close()
+        return None
+    return Snapshot(data, meta)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""A persistent store of pre-extracted [`Context`](ntfp_types.html#ntfp.ntfp_types.Context) chunks.
+
+[//]: # (markdown comment # noqa)
+
+The store is a single SQLite file holding normalized, sentence-segmented,
+deduplicated chunks of text along with an inverted index of their terms.
+
+It is written by the offline [`ingest`](ingest.html) pipeline and read at
+query time by [`get_context`](ntfp.html#ntfp.ntfp.get_context), so that
+answering a question is only a lookup plus inference.
+
+Resources:
+    * [sqlite3][1]
+    * [unicodedata.normalize][2]
+
+[1]: https://docs.python.org/3/library/sqlite3.html
+[2]: https://docs.python.org/3/library/unicodedata.html#unicodedata.normalize
+"""
+import hashlib
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+from typing_extensions import Final
+
+from ntfp.ntfp_types import Context, Question
+
+DEFAULT_STORE: Final[str] = "contexts.db"
+"""The default filename of the store."""
+
+MAX_CHUNK_CHARS: Final[int] = 500
+"""Consecutive sentences are grouped into chunks of at most this many chars."""
+
+SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    ingested_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_source_id ON chunks(source_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL REFERENCES chunks(id),
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+"""
+
+# ASSUME: words this short or this common never help find the right chunk.
+STOP_WORDS: Final[frozenset] = frozenset(
+    "a an and are as at be by for from has have in is it of on or the to was"
+    " what when where which who whom whose why how with does do did can"
+    " site".split()
+)
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])")
+_TERM = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes unicode and whitespace so equal text hashes equally.
+
+    Example:
+        >>> normalize_text("  Hello\\u00a0 World!\\n\\n\\nBye.  ")
+        'Hello World!\\nBye.'
+    """
+    text = unicodedata.normalize("NFKC", text)
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Splits normalized text into sentences on line breaks and end punctuation.
+
+    Example:
+        >>> split_sentences("Hi there. I am Foaad.\\nEmail: foaad@calpoly.edu")
+        ['Hi there.', 'I am Foaad.', 'Email: foaad@calpoly.edu']
+    """
+    return [
+        sent
+        for line in text.splitlines()
+        for sent in _SENTENCE_BOUNDARY.split(line)
+        if sent
+    ]
+
+
+def chunk_sentences(
+    sentences: Iterable[str], max_chars: int = MAX_CHUNK_CHARS
+) -> List[str]:
+    """Groups consecutive sentences into chunks of at most `max_chars`.
+
+    A single sentence longer than `max_chars` becomes a chunk of its own.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for sent in sentences:
+        if current and size + 1 + len(sent) > max_chars:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sent)
+        size += len(sent) + (1 if size else 0)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def terms(text: str) -> List[str]:
+    """The lowercased index terms of some text, stop words removed."""
+    return [
+        t for t in _TERM.findall(text.lower()) if len(t) > 1 and t not in STOP_WORDS
+    ]
+
+
+def chunk_hash(chunk: str) -> str:
+    """The sha256 hex digest used to deduplicate chunks."""
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def connect(store: str = DEFAULT_STORE) -> sqlite3.Connection:
+    """Opens (and if needed creates) the store at the given path."""
+    connection = sqlite3.connect(store)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def add_chunks(
+    connection: sqlite3.Connection, source: str, kind: str, chunks: List[str]
+) -> int:
+    """Inserts the chunks of one source, skipping any chunk already stored.
+
+    A source ingested before loses its chunks that are no longer among
+    `chunks`, with their postings, so a changed source leaves no stale text.
+
+    Returns:
+        The number of chunks that were new to the store.
+    """
+    hashes = {chunk_hash(chunk) for chunk in chunks}
+    with connection:
+        connection.execute(
+            "INSERT OR IGNORE INTO sources (source, kind) VALUES (?, ?)",
+            (source, kind),
+        )
+        (source_id,) = connection.execute(
+            "SELECT id FROM sources WHERE source = ?", (source,)
+        ).fetchone()
+        stale = [
+            (chunk_id,)
+            for chunk_id, old_hash in connection.execute(
+                "SELECT id, hash FROM chunks WHERE source_id = ?", (source_id,)
+            )
+            if old_hash not in hashes
+        ]
+        connection.executemany("DELETE FROM postings WHERE chunk_id = ?", stale)
+        connection.executemany("DELETE FROM chunks WHERE id = ?", stale)
+        added = 0
+        for position, chunk in enumerate(chunks):
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO chunks (hash, source_id, position, text)"
+                " VALUES (?, ?, ?, ?)",
+                (chunk_hash(chunk), source_id, position, chunk),
+            )
+            if cursor.rowcount != 1:
+                continue  # a duplicate of a chunk from this or another source
+            added += 1
+            connection.executemany(
+                "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                [
+                    (term, cursor.lastrowid, tf)
+                    for term, tf in Counter(terms(chunk)).items()
+                ],
+            )
+    return added
+
+
+def lookup(
+    connection: sqlite3.Connection, question: Question, limit: int = 5
+) -> List[Tuple[int, str]]:
+    """Finds the chunks sharing the most distinct terms with the question.
+
+    Ties are broken by the total number of term occurrences.
+
+    Returns:
+        Up to `limit` (number of matched terms, chunk text) pairs, best first.
+    """
+    question_terms = sorted(set(terms(question)))
+    if not question_terms:
+        return []
+    placeholders = ", ".join("?" * len(question_terms))
+    rows = connection.execute(
+        "SELECT COUNT(*) AS matched, SUM(p.tf) AS hits, c.text"
+        " FROM postings p JOIN chunks c ON c.id = p.chunk_id"
+        f" WHERE p.term IN ({placeholders})"
+        " GROUP BY p.chunk_id ORDER BY matched DESC, hits DESC LIMIT ?",
+        (*question_terms, limit),
+    )
+    return [(matched, text) for matched, _, text in rows]
+
+
+def lookup_context(
+    question: Question, store: str = DEFAULT_STORE, limit: int = 5
+) -> Context:
+    """Returns the most relevant stored chunks joined into one
+        [`Context`](ntfp_types.html#ntfp.ntfp_types.Context).
+    """
+    connection = connect(store)
+    try:
+        chunks = lookup(connection, question, limit=limit)
+    finally:
+        connection.close()
+    return Context("\n".join(text for _, text in chunks))
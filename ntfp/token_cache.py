@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""A cache of pre-tokenized [`Context`](ntfp_types.html#ntfp.ntfp_types.Context) \
+    segments, and question answering over those cached tokens.
+
+[//]: # (markdown comment # noqa)
+
+The same corpus segments (e.g. the club blocks of `clubs.txt`) are given to
+the model question after question; only the question changes. So each
+segment is tokenized once, keyed by the sha256 of its text and the name of
+the tokenizer, and stored with the character span of every token.
+
+At query time only the question is tokenized. The cached context token ids
+are appended to it, the model runs on the concatenation, and the answer's
+token span is mapped back to `start`/`end` characters through the cached
+spans, exactly as [`transformer`](ntfp.html#ntfp.ntfp.transformer) reports them.
+
+Segments are split on whitespace and every word is tokenized on its own,
+like the SQuAD preprocessing of the HuggingFace pipeline, so answers always
+start and end on word boundaries. This assumes a BERT-style
+`[CLS] question [SEP] context [SEP]` input layout.
+
+Scores are computed exactly like the pipeline's: every window is padded to
+`MAX_SEQ_LEN` and the softmax spans the whole window, padding included.
+So a cached answer scores like [`transformer`](ntfp.html#ntfp.ntfp.transformer)'s
+and the same thresholds (e.g. a cascade's) apply to both.
+
+Example:
+    >>> cache = TokenCache("clubs.tokens")
+    >>> segments = ["CSAI has Professor Foaad Khosmood as their advisor.", ...]
+    >>> cached_transformer("who advises CSAI?", segments, cache=cache)
+    ('Foaad Khosmood', {'score': 0.91, 'start': 19, 'end': 33, ...})
+    >>> cache.save()
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from inspect import signature
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import torch
+from typing_extensions import Final
+
+from ntfp.models import DEFAULT_QA_MODEL, load_pipeline, mode_name
+from ntfp.ntfp_types import IDK, Answer, ExtraDataDict, Question
+from ntfp.profiling import stage
+
+MAX_SEQ_LEN: Final[int] = 384
+"""The same window size the question-answering pipeline uses."""
+
+DOC_STRIDE: Final[int] = 128
+"""How many context tokens consecutive windows overlap by."""
+
+MAX_QUESTION_LEN: Final[int] = 64
+MAX_ANSWER_LEN: Final[int] = 15
+
+SHARED_CACHE_SEGMENTS: Final[int] = 20000
+"""How many segments `shared_cache` holds before it forgets the oldest."""
+
+WINDOW_BATCH_SIZE: Final[int] = 16
+"""The most windows in one forward pass, so a long context is not one huge batch."""
+
+
+class TokenizedSegment(NamedTuple):
+    """The token ids of a segment and the character span of every token."""
+
+    token_ids: List[int]
+    starts: List[int]
+    ends: List[int]
+
+
+def tokenize_segment(tokenizer, text: str) -> TokenizedSegment:
+    """Tokenizes a segment word by word, remembering each token's characters."""
+    token_ids: List[int] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    end = 0
+    for word in text.split():
+        start = text.index(word, end)
+        end = start + len(word)
+        ids = tokenizer.convert_tokens_to_ids(tokenizer.tokenize(word))
+        token_ids += ids
+        starts += [start] * len(ids)
+        ends += [end] * len(ids)
+    return TokenizedSegment(token_ids, starts, ends)
+
+
+class TokenCache:
+    """Maps (sha256 of segment text, tokenizer name) to a \
+        [`TokenizedSegment`](#ntfp.token_cache.TokenizedSegment).
+
+    Args:
+        path: An optional file to load the cache from and `save` it to.
+        max_segments: Once it holds this many segments, the oldest is \
+            forgotten for every new one. (Default = no limit).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_segments: Optional[int] = None):
+        self.path = path
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = 0
+        self._segments: Dict[Tuple[str, str], TokenizedSegment] = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                self._segments = pickle.load(f)
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def get(self, tokenizer, tokenizer_name: str, text: str) -> TokenizedSegment:
+        """Returns the cached tokens of `text`, tokenizing it on a miss."""
+        key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), tokenizer_name)
+        segment = self._segments.get(key)
+        if segment is None:
+            self.misses += 1
+            segment = tokenize_segment(tokenizer, text)
+            self._add(key, segment)
+        else:
+            self.hits += 1
+        return segment
+
+    def put(self, tokenizer_name: str, text: str, segment: TokenizedSegment) -> None:
+        """Caches tokens computed elsewhere, e.g. by a [`snapshot`](snapshot.html)."""
+        key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), tokenizer_name)
+        self._add(key, segment)
+
+    def _add(self, key: Tuple[str, str], segment: TokenizedSegment) -> None:
+        with self._lock:
+            if key not in self._segments:
+                self._unsaved += 1
+            self._segments[key] = segment
+            if self.max_segments is not None:
+                while len(self._segments) > self.max_segments:
+                    # dicts keep insertion order, so this is the oldest
+                    del self._segments[next(iter(self._segments))]
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Persists the cache to `path` (Default = the path it was loaded from).
+
+        Rewriting the whole cache costs O(its size), so saving to the path it
+        was loaded from does nothing until a segment was added since.
+        """
+        if path is None and not self._unsaved:
+            return
+        path = path or self.path
+        if path is None:
+            return
+        partial_path = f"{path}.partial"
+        with self._lock, open(partial_path, "wb") as f:
+            pickle.dump(self._segments, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial_path, path)
+        if path == self.path:
+            self._unsaved = 0
+
+
+shared_cache: Final[TokenCache] = TokenCache(max_segments=SHARED_CACHE_SEGMENTS)
+"""The cache used when none is given, so that every caller, not only \
+    `clubs.py`, tokenizes a segment once."""
+
+
+def join_segments(
+    segments: List[TokenizedSegment], texts: List[str], sep: str
+) -> TokenizedSegment:
+    """Concatenates cached segments as if `sep.join(texts)` had been tokenized."""
+    token_ids: List[int] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    offset = 0
+    for segment, text in zip(segments, texts):
+        token_ids += segment.token_ids
+        starts += [offset + s for s in segment.starts]
+        ends += [offset + e for e in segment.ends]
+        offset += len(text) + len(sep)
+    return TokenizedSegment(token_ids, starts, ends)
+
+
+def windows(question_ids: List[int], context_len: int) -> List[Tuple[int, int]]:
+    """The (start, end) context token ranges of each model input window."""
+    capacity = MAX_SEQ_LEN - len(question_ids) - 3  # [CLS], [SEP], [SEP]
+    ranges = []
+    start = 0
+    while True:
+        end = min(start + capacity, context_len)
+        ranges.append((start, end))
+        if end >= context_len:
+            return ranges
+        start += min(capacity, DOC_STRIDE)
+
+
+def best_spans(
+    nlp,
+    items: List[Tuple[List[int], List[int], Tuple[int, int]]],
+    batch_size: int = WINDOW_BATCH_SIZE,
+) -> List[Tuple[float, int, int]]:
+    """Runs the model on padded batches of windows and finds each best answer.
+
+    Args:
+        nlp: A question-answering pipeline from \
+            [`load_pipeline`](models.html#ntfp.models.load_pipeline).
+        items: (question ids, context ids, window range) for every window.
+        batch_size: The most windows in one forward pass. \
+            (Default = `WINDOW_BATCH_SIZE`).
+
+    Returns:
+        (score, first context token, last context token) for every window.
+    """
+    results = []
+    for i in range(0, len(items), batch_size):
+        results += _best_spans_batch(nlp, items[i : i + batch_size])
+    return results
+
+
+def _best_spans_batch(
+    nlp, items: List[Tuple[List[int], List[int], Tuple[int, int]]]
+) -> List[Tuple[float, int, int]]:
+    tokenizer = nlp.tokenizer
+    inputs = []
+    for question_ids, context_ids, (start, end) in items:
+        ids = tokenizer.build_inputs_with_special_tokens(
+            question_ids, context_ids[start:end]
+        )
+        inputs.append(ids)
+    # the pipeline pads every window to MAX_SEQ_LEN, and its softmax spans
+    # the padding too, so padding less would change the scores
+    width = MAX_SEQ_LEN
+    pad = tokenizer.pad_token_id or 0
+    input_ids = torch.tensor([ids + [pad] * (width - len(ids)) for ids in inputs])
+    attention_mask = torch.tensor(
+        [[1] * len(ids) + [0] * (width - len(ids)) for ids in inputs]
+    )
+    kwargs = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if "token_type_ids" in signature(nlp.model.forward).parameters:
+        kwargs["token_type_ids"] = torch.tensor(
+            [
+                [0] * (len(q) + 2)
+                + [1] * (len(ids) - len(q) - 2)
+                + [0] * (width - len(ids))
+                for ids, (q, _, _) in zip(inputs, items)
+            ]
+        )
+    with stage("torch"), torch.no_grad():
+        start_logits, end_logits = nlp.model(**kwargs)[:2]
+    start_probs_all = start_logits.softmax(-1)
+    end_probs_all = end_logits.softmax(-1)
+    results = []
+    for row, (question_ids, _, (start, end)) in enumerate(items):
+        first = len(question_ids) + 2
+        last = first + (end - start)
+        # only context tokens can be an answer, like the pipeline's p_mask
+        start_probs = start_probs_all[row, first:last]
+        end_probs = end_probs_all[row, first:last]
+        scores = torch.triu(start_probs[:, None] * end_probs[None, :])
+        scores = torch.tril(scores, MAX_ANSWER_LEN - 1)
+        best = int(scores.argmax())
+        s, e = divmod(best, scores.shape[1])
+        results.append((float(scores[s, e]), start + s, start + e))
+    return results
+
+
+def cached_transformer_batch(
+    pairs: Iterable[Tuple[Question, List[str]]],
+    sep: str = " ",
+    model: str = DEFAULT_QA_MODEL,
+    quantize: bool = False,
+    cache: Optional[TokenCache] = None,
+) -> List[Tuple[Answer, ExtraDataDict]]:
+    """Answers many questions, each over `sep.join(segments)`, in one model call.
+
+    Returns:
+        One (Answer, ExtraDataDict) per pair, in order.
+    """
+    nlp = load_pipeline(model=model, quantize=quantize)
+    tokenizer = nlp.tokenizer
+    cache = cache if cache is not None else shared_cache
+    pairs = list(pairs)
+    joined: List[TokenizedSegment] = []
+    items = []
+    owners = []
+    for index, (question, texts) in enumerate(pairs):
+        context = join_segments(
+            [cache.get(tokenizer, model, text) for text in texts], texts, sep
+        )
+        joined.append(context)
+        question_ids = tokenizer.encode(question, add_special_tokens=False)
+        question_ids = question_ids[:MAX_QUESTION_LEN]
+        if not context.token_ids:
+            continue
+        for window in windows(question_ids, len(context.token_ids)):
+            items.append((question_ids, context.token_ids, window))
+            owners.append(index)
+    best: Dict[int, Tuple[float, int, int]] = {}
+    for owner, span in zip(owners, best_spans(nlp, items) if items else []):
+        if owner not in best or span[0] > best[owner][0]:
+            best[owner] = span
+    results = []
+    for index, (question, texts) in enumerate(pairs):
+        extra_data: ExtraDataDict = {
+            "score": -1.0,
+            "start": -1,
+            "end": -1,
+            "tokenizer": "NA_SKIPPED_TRANSFORMER",
+            "model": "NA_SKIPPED_TRANSFORMER",
+            "mode": "NA_SKIPPED_TRANSFORMER",
+        }
+        if index not in best:
+            results.append((Answer(IDK), extra_data))
+            continue
+        score, first, last = best[index]
+        start, end = joined[index].starts[first], joined[index].ends[last]
+        extra_data = {
+            "score": score,
+            "start": start,
+            "end": end,
+            "tokenizer": tokenizer.__class__.__name__,
+            "model": nlp.model.__class__.__name__,
+            "mode": mode_name(quantize),
+            "qa_model": model,
+        }
+        results.append((Answer(sep.join(texts)[start:end]), extra_data))
+    return results
+
+
+def cached_transformer(
+    q: Question,
+    segments: List[str],
+    sep: str = " ",
+    model: str = DEFAULT_QA_MODEL,
+    quantize: bool = False,
+    cache: Optional[TokenCache] = None,
+) -> Tuple[Answer, ExtraDataDict]:
+    """Like [`transformer`](ntfp.html#ntfp.ntfp.transformer) over the context \
+        `sep.join(segments)`, but each segment is tokenized only once.
+    """
+    return cached_transformer_batch(
+        [(q, segments)], sep=sep, model=model, quantize=quantize, cache=cache
+    )[0]
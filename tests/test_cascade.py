@@ -0,0 +1,70 @@
+import pytest
+
+from ntfp.cascade import CascadeStage, parse_cascade, run_cascade, run_cascade_batch
+
+CASCADE = (CascadeStage("small", 0.5), CascadeStage("large", 0.0))
+
+
+def answer(text, score, start=0):
+    return text, {"score": score, "start": start}
+
+
+def test_parse_cascade():
+    assert parse_cascade(" small:0.5, large ") == CASCADE
+
+
+@pytest.mark.parametrize("spec", ["", " , ", ":0.5"])
+def test_parse_cascade_needs_a_model(spec):
+    with pytest.raises(ValueError):
+        parse_cascade(spec)
+
+
+def test_parse_cascade_needs_number_thresholds():
+    with pytest.raises(ValueError):
+        parse_cascade("small:high")
+
+
+def test_run_cascade_stops_at_a_confident_model():
+    models = []
+
+    def run(model):
+        models.append(model)
+        return answer("Foaad", 0.9)
+
+    text, extra_data = run_cascade(CASCADE, run)
+    assert (text, models) == ("Foaad", ["small"])
+    assert (extra_data["qa_model"], extra_data["escalations"]) == ("small", 0)
+    assert extra_data["cascade_latency_s"] >= 0.0
+
+
+def test_run_cascade_escalates_an_unsure_answer():
+    scores = {"small": 0.1, "large": 0.2}
+    text, extra_data = run_cascade(CASCADE, lambda model: answer(model, scores[model]))
+    assert (text, extra_data["qa_model"], extra_data["escalations"]) == (
+        "large",
+        "large",
+        1,
+    )
+
+
+def test_run_cascade_never_escalates_without_a_context():
+    text, extra_data = run_cascade(CASCADE, lambda model: answer(model, -1.0, -1))
+    assert (text, extra_data["escalations"]) == ("small", 0)
+
+
+def test_run_cascade_batch_only_runs_escalated_questions():
+    scores = {0: 0.9, 1: 0.1, 2: 0.3}
+    calls = []
+
+    def run_batch(model, indices):
+        calls.append((model, list(indices)))
+        return [answer(f"{model}{i}", scores[i]) for i in indices]
+
+    results = run_cascade_batch(CASCADE, run_batch, 3)
+    assert calls == [("small", [0, 1, 2]), ("large", [1, 2])]
+    assert [text for text, _ in results] == ["small0", "large1", "large2"]
+    assert [extra["escalations"] for _, extra in results] == [0, 1, 1]
+
+
+def test_run_cascade_batch_of_no_questions():
+    assert run_cascade_batch(CASCADE, lambda model, indices: [], 0) == []
@@ -0,0 +1,97 @@
+import hashlib
+import os
+
+from checksum import (
+    cached_concat_sha256,
+    concat_sha256,
+    file_digests,
+    merkle_leaf,
+    merkle_root,
+    stat_key,
+    walk_files,
+)
+from ntfp.cache import DiskCache
+
+# the sha256 of "", "hi" and "hihi", as in the checksum.py Example
+EMPTY = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+HI = "8f434346648f6b96df89dda901c5176b10a6d83961dd3c1ac88b59b2dc327aa4"
+HIHI = "27e6f695d734689575e2a063b77668a1fab9c7a83071134630f6a02ebf697592"
+
+
+def write(path, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_concat_sha256_matches_the_example():
+    assert concat_sha256([]) == EMPTY
+
+
+def test_concat_sha256_is_the_sha256_of_the_concatenation(tmp_path):
+    one = write(tmp_path / "1.TEST_FOO", b"hi")
+    assert concat_sha256([one]) == HI
+    two = write(tmp_path / "2.TEST_FOO", b"hi")
+    assert concat_sha256([one, two]) == HIHI
+
+
+def test_concat_sha256_is_byte_identical_to_reading_whole_files(tmp_path):
+    # the 1.0.0 algorithm: read every file whole, hash the concatenation
+    contents = [os.urandom(3 << 20), b"", b"tail\n"]
+    paths = [write(tmp_path / f"{i}.py", data) for i, data in enumerate(contents)]
+    expected = hashlib.sha256(b"".join(contents)).hexdigest()
+    assert concat_sha256(paths) == expected
+
+
+def test_walk_files_sorts_and_prunes(tmp_path):
+    write(tmp_path / "b.py", b"")
+    write(tmp_path / "a" / "c.py", b"")
+    write(tmp_path / "a.txt", b"")
+    write(tmp_path / ".git" / "hook.py", b"")
+    write(tmp_path / "__pycache__" / "x.py", b"")
+    root = str(tmp_path)
+    assert walk_files(root, ".py") == [
+        os.path.join(root, "a", "c.py"),
+        os.path.join(root, "b.py"),
+    ]
+
+
+def test_cached_concat_sha256_is_reused_only_while_unchanged(tmp_path):
+    path = write(tmp_path / "a.py", b"hi")
+    os.utime(path, ns=(0, 0))  # old enough not to be racy
+    cache = DiskCache(str(tmp_path / "cache.db"))
+    keys = [stat_key(path)]
+    assert cached_concat_sha256([path], keys, cache) == HI
+    assert cache.get("checksum", keys) == HI
+    write(tmp_path / "a.py", b"hihi")
+    assert cached_concat_sha256([path], [stat_key(path)], cache) == HIHI
+
+
+def test_file_digests_are_the_sha256_of_each_file(tmp_path):
+    paths = [write(tmp_path / "a.py", b"hi"), write(tmp_path / "b.py", b"")]
+    keys = [stat_key(path) for path in paths]
+    assert file_digests(paths, keys, cache=None) == [HI, EMPTY]
+
+
+def test_merkle_root_of_nothing_is_the_empty_sha256():
+    assert merkle_root([], []) == EMPTY
+
+
+def test_merkle_root_of_one_file_is_its_leaf():
+    assert merkle_root(["./a.py"], [HI]) == merkle_leaf("./a.py", HI).hex()
+
+
+def test_merkle_root_carries_an_odd_node_up():
+    paths, digests = ["./a.py", "./b.py", "./c.py"], [HI, HIHI, EMPTY]
+    a, b, c = (merkle_leaf(p, d) for p, d in zip(paths, digests))
+    ab = hashlib.sha256(b"\x01" + a + b).digest()
+    expected = hashlib.sha256(b"\x01" + ab + c).hexdigest()
+    assert merkle_root(paths, digests) == expected
+
+
+def test_merkle_root_depends_on_paths_contents_and_order():
+    root = merkle_root(["./a.py", "./b.py"], [HI, HIHI])
+    assert merkle_root(["./a.py", "./b.py"], [HI, EMPTY]) != root
+    assert merkle_root(["./a.py", "./c.py"], [HI, HIHI]) != root
+    assert merkle_root(["./b.py", "./a.py"], [HIHI, HI]) != root
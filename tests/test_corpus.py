@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from ntfp.corpus import Corpus, find_offsets
+
+TEXT = "CSAI advisor Foaad.\n\n\nChess club meets Monday.\n\n\n\n\n\nCafé ☕ club."
+
+
+def pairs(offsets):
+    return list(zip(offsets[::2], offsets[1::2]))
+
+
+@pytest.mark.parametrize("data", [b"", b"a", b"a--b", b"--a--", b"a----b", b"----"])
+def test_find_offsets_matches_split(data):
+    assert [data[s:e] for s, e in pairs(find_offsets(data, b"--"))] == data.split(b"--")
+
+
+def test_find_offsets_rejects_an_empty_separator():
+    with pytest.raises(ValueError):
+        find_offsets(b"abc", b"")
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    path = tmp_path / "clubs.txt"
+    path.write_bytes(TEXT.encode("utf-8"))
+    return str(path)
+
+
+def test_corpus_round_trips_the_segments(corpus_path):
+    with Corpus(corpus_path) as corpus:
+        assert list(corpus) == TEXT.split("\n\n\n")
+        assert len(corpus) == 4
+        assert corpus[-1] == "Café ☕ club."
+        assert corpus.segments([2, 0]) == ["", "CSAI advisor Foaad."]
+        with pytest.raises(IndexError):
+            corpus[4]
+
+
+def test_corpus_reuses_its_index(corpus_path):
+    Corpus(corpus_path).close()
+    index_path = f"{corpus_path}.idx"
+    assert os.path.exists(index_path)
+    with open(index_path, "r+b") as f:
+        f.seek(-16, os.SEEK_END)
+        f.write((0).to_bytes(8, "little") * 2)  # break the last (start, end)
+    with Corpus(corpus_path) as corpus:
+        assert corpus[-1] == ""  # the index, not the text, was read
+
+
+def test_corpus_rebuilds_a_stale_index(corpus_path):
+    Corpus(corpus_path).close()
+    with Corpus(corpus_path, sep="\n") as corpus:
+        assert list(corpus) == TEXT.split("\n")
+    with open(corpus_path, "a") as f:
+        f.write("\n\n\nNew club.")
+    with Corpus(corpus_path) as corpus:
+        assert corpus[-1] == "New club."
+
+
+def test_corpus_of_an_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    with Corpus(str(path)) as corpus:
+        assert list(corpus) == [""]
@@ -0,0 +1,60 @@
+from ntfp.dedupe import (
+    Deduplication,
+    dedupe,
+    numbers,
+    record_dedupe,
+    simhash,
+    similarity,
+)
+
+
+def test_similarity_of_equal_and_opposite_fingerprints():
+    fingerprint = simhash(["csai", "advisor"])
+    assert similarity(fingerprint, fingerprint) == 1.0
+    assert similarity(0, (1 << 64) - 1) == 0.0
+
+
+def test_numbers():
+    assert numbers("Call 805-756-1111 by 5pm.") == {"805", "756", "1111", "5"}
+
+
+def test_dedupe_drops_exact_duplicate_sentences():
+    context = "CSAI meets Monday. Chess meets Friday.\nCSAI meets Monday."
+    deduped, stats = dedupe(context)
+    assert deduped == "CSAI meets Monday. Chess meets Friday."
+    assert stats == Deduplication(3, 1, len(context), len(context) - len(deduped))
+
+
+def test_dedupe_keeps_sentences_with_other_numbers():
+    context = "\n".join(
+        f"The mail box of the Chess Club is {box}." for box in (7, 8, 7)
+    )
+    deduped, stats = dedupe(context, threshold=0.0)
+    assert deduped == (
+        "The mail box of the Chess Club is 7.\nThe mail box of the Chess Club is 8."
+    )
+    assert stats.dropped == 1
+
+
+def test_dedupe_drops_reworded_sentences():
+    context = "X has the mail box 89.\nThe mail box of X is 89."
+    assert dedupe(context)[0] == "X has the mail box 89."
+
+
+def test_dedupe_drops_near_duplicates_within_the_threshold():
+    context = "Foaad Khosmood advises CSAI.\nFoaad Khosmood advises CSAI students."
+    assert dedupe(context, threshold=0.0)[0] == "Foaad Khosmood advises CSAI."
+    assert dedupe(context, threshold=1.0)[0] == context
+
+
+def test_dedupe_keeps_the_separator():
+    context = "a one.---b two.---a one."
+    assert dedupe(context, sep="---")[0] == "a one.---b two."
+
+
+def test_dedupe_of_an_empty_context():
+    assert dedupe("") == ("", Deduplication(0, 0, 0, 0))
+    assert record_dedupe({}, Deduplication(0, 0, 0, 0)) == {
+        "duplicates_dropped": 0,
+        "dedupe_shrink": 0.0,
+    }
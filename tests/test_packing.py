@@ -0,0 +1,65 @@
+import pytest
+
+import ntfp.packing
+from ntfp.packing import (
+    PackedContext,
+    pack,
+    pack_context,
+    rank_segments,
+    record_packing,
+)
+
+
+@pytest.fixture(autouse=True)
+def count_words(monkeypatch):
+    """Counts one token per word instead of running a tokenizer."""
+    monkeypatch.setattr(
+        ntfp.packing, "count_tokens", lambda text, *_: len(text.split())
+    )
+
+
+def test_pack_context_keeps_what_fits_in_order():
+    packed = pack_context(["a b", "c d e", "f"], budget=10)
+    assert packed == PackedContext(["a b", "c d e", "f"], 6, [], [])
+
+
+def test_pack_context_drops_and_truncates():
+    segments = ["one two three", "Four five. Six seven eight.", "nine ten"]
+    packed = pack_context(segments, budget=5)
+    assert packed == PackedContext(["one two three", "Four five."], 5, [2], [1])
+
+
+def test_pack_context_truncates_to_the_most_valuable_sentences():
+    segments = ["A b c. D e. F g h."]
+    value = {"A b c.": 1, "D e.": 3, "F g h.": 2}.get
+    packed = pack_context(segments, budget=5, value=value)
+    # the best that fit, in their original order
+    assert packed.segments == ["D e. F g h."]
+    assert packed.truncated == [0]
+
+
+def test_rank_segments_is_stable():
+    assert rank_segments(["b", "a", "c", "a"], {"a": 2, "b": 1, "c": 2}.get) == [
+        1,
+        2,
+        3,
+        0,
+    ]
+
+
+def test_pack_maps_indices_back_to_the_context():
+    context = "noise noise noise\nthe CSAI advisor\nmore noise noise noise"
+    score = {"the CSAI advisor": 2}.get
+    packed_context, packed = pack(
+        "who is the CSAI advisor?", context, budget=3, score=lambda s: score(s, 0)
+    )
+    assert packed_context == "the CSAI advisor"
+    assert sorted(packed.dropped) == [0, 2]
+    assert record_packing({}, packed) == {
+        "packed_tokens": 3,
+        "dropped_segments": packed.dropped,
+    }
+
+
+def test_pack_of_an_empty_context():
+    assert pack("who?", "") == ("", PackedContext([], 0, [], []))
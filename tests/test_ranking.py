@@ -0,0 +1,94 @@
+import pytest
+
+from ntfp.ntfp_types import GoogleResult
+from ntfp.ranking import (
+    HOST_PRIOR,
+    PDF_WEIGHT,
+    file_type,
+    file_type_weight,
+    host,
+    host_yield,
+    load_yields,
+    page_yields,
+    rank_results,
+    record_yields,
+)
+
+QUESTION = "who is the CSAI club advisor?"
+
+
+def result(url, title="", snippet=""):
+    return GoogleResult(url, title, snippet)
+
+
+def test_host_and_file_type():
+    assert host("https://WWW.CalPoly.edu/a/b.PDF?x=1") == "calpoly.edu"
+    assert file_type("https://calpoly.edu/a/b.PDF?x=1") == "pdf"
+    assert file_type("https://calpoly.edu/a/") == ""
+
+
+@pytest.mark.parametrize(
+    "url, weight",
+    [
+        ("https://a.edu/b.html", 1.0),
+        ("https://a.edu/b", 1.0),
+        ("https://a.edu/b.pdf", PDF_WEIGHT),
+        ("https://a.edu/b.png", 0.0),
+        ("https://a.edu/b.zip", 0.0),
+    ],
+)
+def test_file_type_weight(url, weight):
+    assert file_type_weight(url) == weight
+
+
+def test_host_yield_is_pulled_towards_the_prior():
+    assert host_yield("new.edu") == pytest.approx(HOST_PRIOR)
+    assert host_yield("a.edu", {"a.edu": (1, 1)}) > HOST_PRIOR
+    assert host_yield("a.edu", {"a.edu": (100, 100)}) > host_yield(
+        "a.edu", {"a.edu": (1, 1)}
+    )
+
+
+def test_rank_results_puts_the_best_match_first():
+    results = [
+        result("https://a.edu/news.html", "News", "Campus news"),
+        result("https://b.edu/csai", "CSAI club", "The CSAI club advisor is Foaad."),
+        result("https://c.edu/logo.png", "CSAI club advisor", "CSAI club advisor"),
+    ]
+    ranked = rank_results(QUESTION, results)
+    assert [r.url for _, r in ranked] == [
+        "https://b.edu/csai",
+        "https://a.edu/news.html",
+        "https://c.edu/logo.png",
+    ]
+    assert ranked[-1][0] == 0.0
+
+
+def test_rank_results_keeps_google_order_for_ties():
+    results = [result("https://a.edu/1"), result("https://a.edu/2")]
+    ranked = rank_results("zebra?", results)
+    assert [r.url for _, r in ranked] == ["https://a.edu/1", "https://a.edu/2"]
+
+
+def test_rank_results_learns_from_host_yields():
+    results = [result("https://a.edu/x"), result("https://b.edu/x")]
+    yields = {"a.edu": (10, 0), "b.edu": (10, 10)}
+    ranked = rank_results(QUESTION, results, yields)
+    assert ranked[0][1].url == "https://b.edu/x"
+
+
+def test_page_yields():
+    pages = [("https://a.edu/1", "Advisor: Foaad KHOSMOOD"), ("https://b.edu", "")]
+    assert page_yields(pages, " foaad khosmood ") == [("a.edu", True), ("b.edu", False)]
+    assert page_yields(pages, "") == [("a.edu", False), ("b.edu", False)]
+
+
+def test_yields_round_trip(tmp_path):
+    path = str(tmp_path / "ntfp" / "yield.csv")
+    assert load_yields(path) == {}
+    record_yields([("a.edu", True), ("b.edu", False)], path)
+    assert load_yields(path) == {"a.edu": (1, 1), "b.edu": (1, 0)}
+    record_yields([("a.edu", False)], path)
+    assert load_yields(path) == {"a.edu": (2, 1), "b.edu": (1, 0)}
+    record_yields([], path)
+    assert load_yields(path) == {"a.edu": (2, 1), "b.edu": (1, 0)}
@@ -0,0 +1,16 @@
+import pytest
+
+from ntfp.ntfp import iter_segments
+
+
+@pytest.mark.parametrize(
+    "string, sep",
+    [("", "\n"), ("a", "\n"), ("a\n\nb\n", "\n"), ("a\n\n\nb", "\n\n\n"), ("--", "-")],
+)
+def test_iter_segments_matches_split(string, sep):
+    assert list(iter_segments(string, sep)) == string.split(sep)
+
+
+def test_iter_segments_rejects_an_empty_separator():
+    with pytest.raises(ValueError):
+        list(iter_segments("abc", ""))
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ntfp.snapshot
+from ntfp.snapshot import build_snapshot, load_snapshot
+from ntfp.token_cache import TokenCache, tokenize_segment
+
+TEXT = "CSAI advisor Foaad.\n\n\nChess club meets Monday.\n\n\nCafé ☕ club."
+
+
+class FakeTokenizer:
+    """One token per word, its id the word's length."""
+
+    def tokenize(self, word):
+        return [word]
+
+    def convert_tokens_to_ids(self, tokens):
+        return [len(token) for token in tokens]
+
+
+@pytest.fixture
+def corpus_path(tmp_path, monkeypatch):
+    pipeline = SimpleNamespace(tokenizer=FakeTokenizer())
+    monkeypatch.setattr(ntfp.snapshot, "load_pipeline", lambda **_: pipeline)
+    path = tmp_path / "clubs.txt"
+    path.write_bytes(TEXT.encode("utf-8"))
+    return str(path)
+
+
+def test_snapshot_round_trips_the_segments_and_tokens(corpus_path):
+    build_snapshot(corpus_path)
+    snapshot = load_snapshot(corpus_path)
+    try:
+        assert list(snapshot) == TEXT.split("\n\n\n")
+        assert snapshot[-1] == "Café ☕ club."
+        for i, text in enumerate(snapshot):
+            assert snapshot.tokens(i) == tokenize_segment(FakeTokenizer(), text)
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_candidates_share_a_term(corpus_path):
+    build_snapshot(corpus_path)
+    snapshot = load_snapshot(corpus_path)
+    try:
+        assert snapshot.candidates("which club meets on Monday?") == [1, 2]
+        assert snapshot.candidates("zebra?") == []
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_fills_a_token_cache(corpus_path):
+    build_snapshot(corpus_path)
+    snapshot = load_snapshot(corpus_path)
+    cache = TokenCache()
+    try:
+        snapshot.fill_token_cache(cache, [1])
+        segment = cache.get(None, snapshot.tokenizer, snapshot[1])  # no tokenizer
+        assert (cache.hits, segment) == (1, snapshot.tokens(1))
+    finally:
+        snapshot.close()
+
+
+def test_stale_snapshots_are_rejected(corpus_path):
+    build_snapshot(corpus_path)
+    assert load_snapshot(corpus_path, sep="\n") is None
+    assert load_snapshot(corpus_path, model="another-model") is None
+    with open(corpus_path, "a") as f:
+        f.write(" Changed.")
+    assert load_snapshot(corpus_path) is None
+
+
+def test_missing_snapshots_are_none(corpus_path):
+    assert load_snapshot(corpus_path) is None
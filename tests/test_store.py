@@ -0,0 +1,86 @@
+from ntfp.store import (
+    add_chunks,
+    chunk_hash,
+    chunk_sentences,
+    connect,
+    lookup,
+    lookup_context,
+    normalize_text,
+    split_sentences,
+    terms,
+)
+
+
+def test_normalize_text():
+    assert normalize_text("  Hello  World!\n\n\nBye.  ") == "Hello World!\nBye."
+
+
+def test_split_sentences():
+    text = "Hi there. I am Foaad.\nEmail: foaad@calpoly.edu"
+    assert split_sentences(text) == [
+        "Hi there.",
+        "I am Foaad.",
+        "Email: foaad@calpoly.edu",
+    ]
+
+
+def test_split_sentences_keeps_abbreviations_before_lowercase():
+    assert split_sentences("Meets at 5 p.m. on Mondays.") == [
+        "Meets at 5 p.m. on Mondays."
+    ]
+
+
+def test_chunk_sentences_respects_max_chars():
+    sentences = ["aaaa.", "bbbb.", "cccc."]
+    assert chunk_sentences(sentences, max_chars=11) == ["aaaa. bbbb.", "cccc."]
+    assert chunk_sentences(["x" * 20], max_chars=5) == ["x" * 20]
+    assert chunk_sentences([]) == []
+
+
+def test_terms_lowercases_and_drops_stop_words():
+    assert terms("What is the email of Dr. Foaad?") == ["email", "dr", "foaad"]
+
+
+def test_chunk_hash_is_the_sha256_of_the_utf8_text():
+    assert chunk_hash("") == (
+        "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    )
+    assert chunk_hash("café") != chunk_hash("cafe")
+
+
+def test_add_chunks_skips_duplicates_across_sources(tmp_path):
+    connection = connect(str(tmp_path / "contexts.db"))
+    assert add_chunks(connection, "a.txt", "text", ["CSAI meets Monday."]) == 1
+    assert add_chunks(connection, "b.txt", "text", ["CSAI meets Monday.", "x"]) == 1
+    connection.close()
+
+
+def test_lookup_ranks_by_matched_terms(tmp_path):
+    store = str(tmp_path / "contexts.db")
+    connection = connect(store)
+    add_chunks(
+        connection,
+        "clubs.txt",
+        "text",
+        ["Chess club meets Monday.", "CSAI advisor is Foaad Khosmood."],
+    )
+    assert lookup(connection, "who is the CSAI advisor?", limit=1) == [
+        (2, "CSAI advisor is Foaad Khosmood.")
+    ]
+    assert lookup(connection, "what is the?") == []
+    connection.close()
+    assert lookup_context("when does chess meet?", store=store) == (
+        "Chess club meets Monday."
+    )
+
+
+def test_add_chunks_replaces_the_stale_chunks_of_a_source(tmp_path):
+    store = str(tmp_path / "contexts.db")
+    connection = connect(store)
+    add_chunks(connection, "a.txt", "text", ["CSAI meets Monday.", "Chess meets."])
+    assert add_chunks(connection, "a.txt", "text", ["CSAI meets Friday."]) == 1
+    assert add_chunks(connection, "a.txt", "text", ["CSAI meets Friday."]) == 0
+    assert lookup(connection, "when does CSAI meet?") == [(1, "CSAI meets Friday.")]
+    (postings,) = connection.execute("SELECT COUNT(*) FROM postings").fetchone()
+    assert postings == len(terms("CSAI meets Friday."))
+    connection.close()